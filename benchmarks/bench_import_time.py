@@ -0,0 +1,76 @@
+"""Time it takes to import the CLI, from python -X importtime.
+
+    python benchmarks/bench_import_time.py
+
+"cli" is what every invocation pays, including --help and --version.
+"everything" also imports what a real run loads later on: the PuppetDB
+client, the template engine and pygments. The slowest modules imported by
+the CLI are listed below.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+
+IMPORTS = [
+    ("cli", "import infinitory.cli"),
+    ("everything", "import infinitory.cli, infinitory.inventory, infinitory.render, "
+        "pygments.formatters, markdown2, multiprocessing"),
+]
+
+LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_times(code):
+    """ Run code in a fresh interpreter. Returns the seconds it spent in the
+    imports it ran itself (not the interpreter's own, like site), and
+    [(seconds, module)] for the modules imported directly by those. """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+        env=env, stderr=subprocess.PIPE, check=True, universal_newlines=True).stderr
+
+    packages = set(name.split(".")[0] for name in re.findall(r"[\w.]+", code))
+    packages.discard("import")
+
+    # A module is listed after everything it imports.
+    total = 0.0
+    children = []
+    imported = []
+    for match in LINE_RE.finditer(stderr):
+        seconds = int(match.group(2)) / 1e6
+        depth = len(match.group(3)) // 2
+        module = match.group(4)
+        if depth == 1:
+            children.append((seconds, module))
+        elif depth == 0:
+            if module.split(".")[0] in packages:
+                total += seconds
+                imported.extend(children)
+            children = []
+
+    return total, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    best = dict()
+    for name, code in IMPORTS:
+        best[name] = min(import_times(code) for _ in range(args.repeat))
+        print("%-12s %8.1f ms" % (name, best[name][0] * 1000))
+
+    print()
+    _, imported = best["cli"]
+    for seconds, module in sorted(imported, reverse=True)[:args.top]:
+        print("  %-30s %8.1f ms" % (module, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main()
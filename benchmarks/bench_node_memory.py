@@ -0,0 +1,65 @@
+"""Memory held by the loaded nodes of a fleet.
+
+    PYTHONPATH=. python benchmarks/bench_node_memory.py --nodes 10000
+
+"dict" keeps the (unflattened) inventory rows with a defaultdict(list) as
+their other section, which is what Inventory.load_nodes() used to do.
+"record" keeps NodeRecords, as it does now. Both load the fields the report
+renders (cli.NODE_FIELDS) and are then enriched from resources.
+"""
+
+import argparse
+from collections import defaultdict
+import gc
+import time
+import tracemalloc
+
+from fakepuppetdb import FakePuppetDB
+from infinitory import cli
+from infinitory.inventory import Inventory, inventory_query, unflatten_node
+
+
+class DictInventory(Inventory):
+    def load_nodes(self, pupdb, fields=None):
+        self.nodes = dict()
+        for node in pupdb.query(self.filter(inventory_query(fields))):
+            node = unflatten_node(node)
+            node["other"] = defaultdict(list)
+            self.nodes[node["certname"]] = node
+
+
+def measure(inventory_class, pupdb):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    inventory = inventory_class()
+    inventory.add_active_filter()
+    inventory.load_nodes(pupdb, cli.NODE_FIELDS)
+    inventory.load_resources(pupdb)
+
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return inventory, elapsed, held, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10000)
+    args = parser.parse_args()
+
+    pupdb = FakePuppetDB(args.nodes, latency=0)
+
+    print("%-10s %10s %12s %12s %12s" % ("nodes", "seconds", "held MiB", "peak MiB", "bytes/node"))
+    for name, inventory_class in [("dict", DictInventory), ("record", Inventory)]:
+        inventory, elapsed, held, peak = measure(inventory_class, pupdb)
+        print("%-10s %10.2f %12.1f %12.1f %12d" % (
+            name, elapsed, held / 2**20, peak / 2**20, held // args.nodes))
+        del inventory
+
+
+if __name__ == "__main__":
+    main()
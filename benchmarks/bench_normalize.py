@@ -0,0 +1,102 @@
+"""Error message normalization throughput with a few hundred rules.
+
+    PYTHONPATH=. python benchmarks/bench_normalize.py --prefixes 200 --masks 100
+
+Compares ErrorNormalizer against the naive approach of trying every prefix
+with startswith() and applying every mask with its own re.sub().
+"""
+
+import argparse
+import random
+import re
+import time
+
+from infinitory.normalize import ErrorNormalizer
+
+
+WORDS = "catalog service package file failed could not find resolve dependent evaluate".split()
+
+
+def make_rules(prefix_count, mask_count, rand):
+    prefixes = [
+        "%s %d: %s" % (rand.choice(WORDS).capitalize(), i, " ".join(rand.sample(WORDS, 4)))
+        for i in range(prefix_count)]
+
+    masks = [
+        (r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", "<uuid>"),
+        (r"\b[\w-]+(?:\.[\w-]+)+\.(?:com|net|org)\b", "<host>"),
+        (r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?Z?", "<time>"),
+        (r"(?:/[\w.-]+){2,}", "<path>"),
+        (r"(?<=line )\d+", "<line>"),
+    ]
+    for i in range(mask_count - len(masks)):
+        masks.append((r"\bmodule%d::[\w:]+" % i, "<module%d>" % i))
+
+    return prefixes, masks
+
+
+def make_messages(count, distinct, prefixes, mask_count, rand):
+    templates = []
+    for i in range(distinct):
+        if i % 4 == 0:
+            templates.append(rand.choice(prefixes) + " on node%d" % i)
+        elif i % 4 == 1:
+            templates.append(
+                "Evaluation Error: Unknown resource in module%d::profile::app%d (line %d)" % (
+                    rand.randrange(mask_count), i, rand.randint(1, 500)))
+        else:
+            templates.append(
+                "Could not evaluate File[/etc/app%d/config.yaml] at line %d on"
+                " web%02d.ops.example.com (%s) at 2019-01-%02dT10:11:12Z" % (
+                    i, rand.randint(1, 500), i % 100,
+                    "123e4567-e89b-12d3-a456-%012d" % i, 1 + i % 28))
+
+    return [rand.choice(templates) for _ in range(count)]
+
+
+class NaiveNormalizer(object):
+    def __init__(self, prefixes, masks):
+        self.prefixes = prefixes
+        self.masks = [(re.compile(p), r) for p, r in masks]
+
+    def normalize(self, message):
+        for prefix in self.prefixes:
+            if message.startswith(prefix):
+                return prefix
+
+        for pattern, replacement in self.masks:
+            message = pattern.sub(replacement, message)
+        return message
+
+
+def measure(normalizer, messages):
+    start = time.perf_counter()
+    groups = set(normalizer.normalize(m) for m in messages)
+    return time.perf_counter() - start, len(groups)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prefixes", type=int, default=200)
+    parser.add_argument("--masks", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--distinct", type=int, default=20000)
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    prefixes, masks = make_rules(args.prefixes, args.masks, rand)
+    messages = make_messages(
+        args.messages, args.distinct, prefixes, args.masks - 5, rand)
+
+    print("%-12s %10s %14s %8s" % ("normalizer", "seconds", "messages/s", "groups"))
+    for name, normalizer in [
+            ("naive", NaiveNormalizer(prefixes, masks)),
+            ("compiled", ErrorNormalizer(prefixes, masks)),
+            ("uncached", ErrorNormalizer(prefixes, masks, cache_size=0))]:
+        elapsed, groups = measure(normalizer, messages)
+        print("%-12s %10.3f %14.0f %8d" % (
+            name, elapsed, len(messages) / elapsed, groups))
+
+
+if __name__ == "__main__":
+    main()
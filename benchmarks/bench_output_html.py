@@ -0,0 +1,71 @@
+"""Cost of the whole rendering phase (output_html) with and without the cell cache.
+
+    PYTHONPATH=. python benchmarks/bench_output_html.py --nodes 10000
+
+"uncached" formats every cell again for the node list, the CSV export and
+each node page, as before cellformatter.memoized. "cached" is output_html
+as it is.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from fakepuppetdb import FakePuppetDB
+from infinitory import cellformatter
+from infinitory import cli
+from infinitory import errors
+from infinitory.inventory import Inventory
+
+
+class NoCache(dict):
+    """ Stands in for cellformatter._cache, forgetting everything. """
+    def __setitem__(self, key, value):
+        pass
+
+
+def load_inventory(pupdb):
+    inventory = Inventory()
+    inventory.add_active_filter()
+    inventory.errorParser = errors.ErrorParser(
+        report_batch_size=100, cache_path=tempfile.mkdtemp())
+    inventory.load_nodes(pupdb, cli.NODE_FIELDS)
+    inventory.load_resources(pupdb)
+    inventory.load_errors(pupdb)
+    shutil.rmtree(inventory.errorParser.report_cache.path)
+    return inventory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+
+    inventory = load_inventory(FakePuppetDB(args.nodes, latency=0))
+    directory = tempfile.mkdtemp()
+    cache = cellformatter._cache
+    try:
+        print("%-10s %10s %12s" % ("cells", "seconds", "peak MiB"))
+        for name, cell_cache in [("uncached", NoCache()), ("cached", cache)]:
+            cellformatter._cache = cell_cache
+            start = time.perf_counter()
+            cli.output_html(inventory, os.path.join(directory, name), jobs=args.jobs)
+            elapsed = time.perf_counter() - start
+
+            # Again, for memory: tracemalloc would distort the timing.
+            tracemalloc.start()
+            cli.output_html(inventory, os.path.join(directory, name), jobs=args.jobs)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print("%-10s %10.2f %12.1f" % (name, elapsed, peak / 2**20))
+    finally:
+        cellformatter._cache = cache
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Per-page template rendering cost.
+
+    PYTHONPATH=. python benchmarks/bench_render.py --nodes 10000
+
+"fresh" builds a new Renderer (Jinja2 environment, loader and Markdown
+converter) for every page, which is what render_template() used to do.
+"shared" renders every page with one Renderer.
+"""
+
+import argparse
+from collections import defaultdict
+import shutil
+import tempfile
+import time
+
+from fakepuppetdb import FakePuppetDB
+from infinitory import cellformatter
+from infinitory.render import Renderer
+
+
+COLUMNS = [
+    cellformatter.Teams("other", "teams"),
+    cellformatter.Owners("other", "owners"),
+    cellformatter.Services("other", "services"),
+    cellformatter.Set("other", "backups"),
+    cellformatter.Boolean("other", "logging"),
+    cellformatter.Boolean("other", "metrics"),
+    cellformatter.Base("facts", "whereami"),
+    cellformatter.Base("facts", "primary_ip"),
+    cellformatter.Os("facts", "os"),
+    cellformatter.Roles("other", "roles"),
+]
+
+
+def render_nodes(nodes, renderer_for_page):
+    start = time.perf_counter()
+    for node in nodes:
+        renderer_for_page().render("node.html",
+            path="../",
+            columns=COLUMNS,
+            node=node)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10000)
+    args = parser.parse_args()
+
+    nodes = FakePuppetDB(args.nodes).inventory
+    for node in nodes:
+        node["other"] = defaultdict(list)
+
+    shared = Renderer()
+    bytecode_cache_path = tempfile.mkdtemp()
+    try:
+        # Fill the bytecode cache.
+        Renderer(bytecode_cache_path).render("node.html", node=nodes[0], columns=COLUMNS)
+
+        print("%-20s %10s %14s" % ("renderer", "seconds", "ms/page"))
+        for name, renderer_for_page in [
+                ("fresh", Renderer),
+                ("fresh+bytecode", lambda: Renderer(bytecode_cache_path)),
+                ("shared", lambda: shared)]:
+            elapsed = render_nodes(nodes, renderer_for_page)
+            print("%-20s %10.2f %14.3f" % (name, elapsed, 1000 * elapsed / len(nodes)))
+    finally:
+        shutil.rmtree(bytecode_cache_path)
+
+
+if __name__ == "__main__":
+    main()
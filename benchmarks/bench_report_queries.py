@@ -0,0 +1,85 @@
+"""Compare report loading strategies against FakePuppetDB.
+
+    PYTHONPATH=. python benchmarks/bench_report_queries.py --nodes 1000 10000
+
+full:      one unprojected reports[] query per node (the original strategy)
+per-hash:  one projected query per node
+batched:   reports[certname, hash, status, logs] { hash in [...] } in chunks
+subquery:  a single query joining against nodes[latest_report_hash]
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+from fakepuppetdb import FakePuppetDB
+import infinitory.errors
+
+
+def full(pupdb, cache_path, batch_size, workers):
+    nodes = pupdb.query('nodes[certname, latest_report_hash] { }')
+    for node in nodes:
+        pupdb.query('reports[] { hash = "%s" }' % node["latest_report_hash"])
+    return len(nodes)
+
+
+def per_hash(pupdb, cache_path, batch_size, workers):
+    error_parser = infinitory.errors.ErrorParser(
+        report_workers=workers, cache_path=cache_path)
+    error_parser.load_reports(pupdb)
+    return error_parser.report_count
+
+
+def batched(pupdb, cache_path, batch_size, workers):
+    error_parser = infinitory.errors.ErrorParser(
+        report_workers=workers,
+        report_batch_size=batch_size,
+        cache_path=cache_path)
+    error_parser.load_reports(pupdb)
+    return error_parser.report_count
+
+
+def subquery(pupdb, cache_path, batch_size, workers):
+    fields = ", ".join(infinitory.errors.REPORT_FIELDS)
+    reports = pupdb.query(
+        'reports[%s] { hash in nodes[latest_report_hash] { } }' % fields)
+    return len(reports)
+
+
+STRATEGIES = [
+    ("full", full),
+    ("per-hash", per_hash),
+    ("batched", batched),
+    ("subquery", subquery),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--latency", type=float, default=0.001,
+        help="simulated round trip time in seconds")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    print("%-10s %8s %10s %10s %14s" % ("strategy", "nodes", "seconds", "queries", "bytes"))
+    for node_count in args.nodes:
+        for name, strategy in STRATEGIES:
+            pupdb = FakePuppetDB(node_count, latency=args.latency)
+            cache_path = tempfile.mkdtemp()
+            try:
+                start = time.perf_counter()
+                loaded = strategy(pupdb, cache_path, args.batch_size, args.workers)
+                elapsed = time.perf_counter() - start
+            finally:
+                shutil.rmtree(cache_path)
+
+            assert loaded == node_count, (name, loaded)
+            print("%-10s %8d %10.2f %10d %14d" % (
+                name, node_count, elapsed, pupdb.queries, pupdb.bytes_sent))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Cost of writing the SQLite backend, and of answering a question from it
+rather than from the JSON export.
+
+    PYTHONPATH=. python benchmarks/bench_sqlite.py --nodes 10000
+
+The question is "which nodes have role X but no backups". "json" loads
+nodes/index.json and filters it in Python, as a consumer of the site has to;
+"sqlite" runs the query against the database.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from fakepuppetdb import ROLES, FakePuppetDB
+from infinitory import cli
+from infinitory import export
+from infinitory import errors
+from infinitory.backends import SqliteBackend
+from infinitory.inventory import Inventory
+
+
+QUERY = """
+SELECT certname FROM nodes
+JOIN node_roles ON node_roles.node_id = nodes.id
+JOIN roles ON roles.id = node_roles.role_id
+WHERE roles.name = ?
+AND nodes.id NOT IN (SELECT node_id FROM node_backups)
+"""
+
+
+def load_inventory(pupdb):
+    inventory = Inventory()
+    inventory.add_active_filter()
+    inventory.errorParser = errors.ErrorParser(
+        report_batch_size=100, cache_path=tempfile.mkdtemp())
+    inventory.load_nodes(pupdb, cli.NODE_FIELDS)
+    inventory.load_resources(pupdb)
+    inventory.load_errors(pupdb)
+    shutil.rmtree(inventory.errorParser.report_cache.path)
+    return inventory
+
+
+def from_json(path, role):
+    with open(path, encoding="utf-8") as json_file:
+        nodes = json.load(json_file)
+    return [
+        node["certname"] for node in nodes
+        if role in node["other"].get("roles", []) and not node["other"].get("backups")]
+
+
+def from_sqlite(path, role):
+    connection = sqlite3.connect(path)
+    try:
+        return [row[0] for row in connection.execute(QUERY, (role,))]
+    finally:
+        connection.close()
+
+
+def best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    inventory = load_inventory(FakePuppetDB(args.nodes, latency=0))
+    inventory.build_indexes()
+    directory = tempfile.mkdtemp()
+    try:
+        json_path = os.path.join(directory, "index.json")
+        database = os.path.join(directory, "inventory.sqlite")
+        export.write_json(inventory.sorted_nodes("facts", "fqdn"), json_path)
+
+        write, _ = best_of(args.repeat,
+            lambda: SqliteBackend(database, cli.NODE_COLUMNS).write(inventory, "now"))
+        print("%-20s %10.3f s  (%.1f MiB)" % (
+            "write sqlite", write, os.path.getsize(database) / 2**20))
+
+        role = ROLES[0]
+        json_time, json_result = best_of(args.repeat, lambda: from_json(json_path, role))
+        sqlite_time, sqlite_result = best_of(args.repeat, lambda: from_sqlite(database, role))
+        assert sorted(json_result) == sorted(sqlite_result)
+        print("%-20s %10.3f s  (%d nodes)" % ("query json", json_time, len(json_result)))
+        print("%-20s %10.3f s" % ("query sqlite", sqlite_time))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
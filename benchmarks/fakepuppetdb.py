@@ -0,0 +1,372 @@
+"""In-process stand-in for a simplepup PuppetDB connection.
+
+It generates a synthetic fleet and answers the handful of queries infinitory
+issues, serializing every response to JSON and back so that payload size
+costs roughly what it would over the wire. A fixed per-query latency models
+the network round trip.
+
+This cannot reproduce PuppetDB's own query planning costs; it is only useful
+for comparing how many round trips and bytes a strategy needs.
+
+It can also be served over HTTP on PuppetDB's port, so that infinitory itself
+can be run against it:
+
+    PYTHONPATH=. python benchmarks/fakepuppetdb.py --nodes 1000 &
+    infinitory --host localhost --output output
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+LOG_LEVELS = ["notice"] * 20 + ["info"] * 5 + ["warning", "err"]
+
+ERROR_MESSAGES = [
+    "Could not retrieve catalog from remote server: Error 500 on SERVER: Server Error: Evaluation Error: Error while evaluating a Function Call, Untrusted facts (left) don't match values from certname (right) {node}",
+    "Could not find dependent Service[{service}] for File[/etc/{service}.conf]",
+    "Execution of '/usr/bin/apt-get -q -y install {service}' returned 100",
+    "Failed to apply catalog: Connection refused - connect(2) for {node} port 8140",
+    "Unknown function: 'hiera_include'",
+]
+
+SERVICES = ["nginx", "postgresql", "rabbitmq", "redis", "jenkins", "haproxy"]
+
+TEAMS = ["sre", "infracore", "release", "qe", "it"]
+
+OPERATING_SYSTEMS = [("Debian", "9.8"), ("Debian", "10.1"), ("CentOS", "7.6.1810"), ("Ubuntu", "18.04")]
+
+WHEREAMI = ["pdx", "ord", "aws-us-west-2", "gcp-us-central1"]
+
+ROLES = ["Role::Web", "Role::Db", "Role::Ci", "Role::Util", "Role::Proxy"]
+
+BACKUP_PATHS = ["/etc", "/var/lib", "/home", "/srv", "/opt"]
+
+
+def make_service(service, rand):
+    return {
+        "class_name": "profile::%s" % service,
+        "human_name": service.capitalize(),
+        "team": rand.choice(TEAMS + [":undef"]),
+        "owner_uid": rand.choice(["alice", "bob", "carol", ":undef"]),
+        "doc_urls": ["https://confluence.example.com/display/SRE/%s" % service],
+        "downtime_impact": "Things break",
+        "end_users": ["%s@example.com" % rand.choice(TEAMS)],
+        "escalation_period": "24/7",
+        "notes": "Restart with `systemctl restart %s`.\n\n* one\n* two" % service,
+        "other_fqdns": ["%s.example.com" % service],
+    }
+
+
+def make_facts(certname, rand):
+    hostname, domain = certname.split(".", 1)
+    os_name, os_release = rand.choice(OPERATING_SYSTEMS)
+    services = rand.sample(SERVICES, rand.randint(0, 2))
+
+    return {
+        "fqdn": certname,
+        "hostname": hostname,
+        "domain": domain,
+        "whereami": rand.choice(WHEREAMI),
+        "primary_ip": "10.%d.%d.%d" % (rand.randrange(256), rand.randrange(256), rand.randrange(256)),
+        "os": {
+            "name": os_name,
+            "family": "Debian" if os_name != "CentOS" else "RedHat",
+            "release": {"full": os_release, "major": os_release.split(".")[0]},
+        },
+        "group": rand.choice(["ops", "eng", "it"]),
+        "function": rand.choice(["web", "db", "ci", "util"]),
+        "context": rand.choice(["prod", "stage", "dev"]),
+        "stage": rand.choice(["prod", "test"]),
+        "function_number": "%02d" % rand.randrange(1, 20),
+        "profile_metadata": {
+            "services": [make_service(s, rand) for s in services],
+        },
+        # Large facts infinitory never renders.
+        "partitions": dict(
+            ("/dev/sda%d" % i, {"size": "%d GiB" % rand.randrange(1, 500), "uuid": "%032x" % rand.getrandbits(128)})
+            for i in range(8)),
+        "mountpoints": dict(
+            ("/mnt/%d" % i, {"device": "/dev/sda%d" % i, "filesystem": "ext4", "options": ["rw", "relatime"]})
+            for i in range(8)),
+        "ssh": dict(
+            (kind, {"key": "AAAA%0256x" % rand.getrandbits(1024), "fingerprints": {"sha256": "SHA256:%064x" % rand.getrandbits(256)}})
+            for kind in ("rsa", "ecdsa", "ed25519")),
+    }
+
+
+def make_resource(certname, resource_type, title, **parameters):
+    return {
+        "certname": certname,
+        "type": resource_type,
+        "title": title,
+        "parameters": parameters,
+        "exported": False,
+        "environment": "production",
+        "file": "/etc/puppetlabs/code/environments/production/site.pp",
+        "line": 1,
+        "tags": [resource_type.lower(), "class"],
+    }
+
+
+def make_resources(certname, rand):
+    resources = [make_resource(certname, "Class", rand.choice(ROLES))]
+
+    for i in range(rand.randint(0, 3)):
+        resources.append(make_resource(certname, "Backup::Job", "%s-%d" % (certname, i),
+            ensure=rand.choice(["present"] * 4 + ["absent"]),
+            files=rand.sample(BACKUP_PATHS, rand.randint(1, 3))))
+
+    for title, share in [
+            ("Profile::Logging::Rsyslog::Client", 0.8),
+            ("Profile::Metrics", 0.6),
+            ("Profile::Server::Monitor", 0.7)]:
+        if rand.random() < share:
+            resources.append(make_resource(certname, "Class", title))
+
+    if rand.random() < 0.7:
+        resources.append(make_resource(certname, "Class", "Profile::Monitoring::Icinga2::Common",
+            notification_period=rand.choice(["24x7", "workhours"]),
+            icinga2_environment=rand.choice(["production", "staging"]),
+            owner=rand.choice(TEAMS)))
+
+    # Resources no enrichment asks for.
+    for i in range(5):
+        resources.append(make_resource(certname, "File", "/etc/file%d" % i, ensure="file"))
+
+    return resources
+
+
+class FakePuppetDB(object):
+    def __init__(self, node_count, seed=0, latency=0.001, logs_per_report=40):
+        self.latency = latency
+        self.queries = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+        rand = random.Random(seed)
+        # Separate, so that adding resources didn't change the other data.
+        resource_rand = random.Random(seed + 1)
+        self.nodes = []
+        self.inventory = []
+        self.resources = []
+        self.reports = dict()
+        for i in range(node_count):
+            certname = "node%05d.example.com" % i
+            report_hash = hashlib.sha1(certname.encode("utf-8")).hexdigest()
+            self.nodes.append({
+                "certname": certname,
+                "latest_report_hash": report_hash,
+            })
+            self.inventory.append({
+                "certname": certname,
+                "environment": "production",
+                "timestamp": "2019-01-01T00:00:00.000Z",
+                "facts": make_facts(certname, rand),
+                "trusted": {"certname": certname, "authenticated": "remote"},
+            })
+            self.reports[report_hash] = self.make_report(
+                rand, certname, report_hash, logs_per_report)
+            self.resources.extend(make_resources(certname, resource_rand))
+
+    def make_report(self, rand, certname, report_hash, logs_per_report):
+        logs = []
+        for _ in range(logs_per_report):
+            level = rand.choice(LOG_LEVELS)
+            if level in ("err", "warning"):
+                message = rand.choice(ERROR_MESSAGES).format(
+                    node=certname, service=rand.choice(SERVICES))
+            else:
+                message = "Applied catalog in %.2f seconds" % rand.uniform(1, 90)
+            logs.append({
+                "file": None,
+                "line": None,
+                "level": level,
+                "message": message,
+                "source": "Puppet",
+                "tags": ["notice"],
+                "time": "2019-01-01T00:00:00.000Z",
+            })
+
+        return {
+            "certname": certname,
+            "hash": report_hash,
+            "status": "failed" if rand.random() < 0.1 else "unchanged",
+            "environment": "production",
+            "puppet_version": "5.5.10",
+            "configuration_version": "1546300800",
+            "logs": {"data": logs, "href": "/pdb/query/v4/reports/%s/logs" % report_hash},
+            "metrics": {
+                "data": [
+                    {"category": "time", "name": name, "value": rand.uniform(0, 10)}
+                    for name in ("catalog_application", "config_retrieval", "total")
+                ],
+                "href": "/pdb/query/v4/reports/%s/metrics" % report_hash,
+            },
+            "resource_events": {
+                "data": [
+                    {
+                        "resource_type": "File",
+                        "resource_title": "/etc/motd",
+                        "property": "content",
+                        "status": "success",
+                        "old_value": "{md5}%032x" % rand.getrandbits(128),
+                        "new_value": "{md5}%032x" % rand.getrandbits(128),
+                    }
+                    for _ in range(5)
+                ],
+                "href": "/pdb/query/v4/reports/%s/events" % report_hash,
+            },
+        }
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def query(self, query, order_by=None, limit=None, timeout=60):
+        time.sleep(self.latency)
+        payload = json.dumps(self.answer(query))
+
+        with self._lock:
+            self.queries += 1
+            self.bytes_sent += len(payload)
+
+        return json.loads(payload)
+
+    def answer(self, query):
+        if re.match(r"\s*nodes\[certname, latest_report_hash\]", query):
+            return self.nodes
+
+        match = re.match(r"\s*inventory\s*(?:\[(.*?)\])?\s*\{", query)
+        if match:
+            return self.answer_inventory(match.group(1))
+
+        match = re.match(r"\s*resources\s*(?:\[(.*?)\])?\s*\{(.*)\}\s*\Z", query)
+        if match:
+            return self.answer_resources(match.group(1), match.group(2))
+
+        match = re.match(r"\s*reports\[(.*?)\]\s*\{\s*hash\s+(=|in)\s+(.*?)\s*\}\s*\Z", query)
+        if match:
+            return self.answer_reports(match.group(1), match.group(2), match.group(3))
+
+        raise ValueError("FakePuppetDB doesn't understand query: {}".format(query))
+
+    def answer_inventory(self, fields):
+        if not fields:
+            return self.inventory
+
+        rows = []
+        fields = [f.strip() for f in fields.split(",")]
+        for node in self.inventory:
+            row = dict()
+            for field in fields:
+                value = node
+                for key in field.split(".", 1):
+                    value = value.get(key) if isinstance(value, dict) else None
+                row[field] = value
+            rows.append(row)
+
+        return rows
+
+    def answer_resources(self, fields, condition):
+        """ Only understands what Inventory.load_resources() asks for:
+        clauses of type = "..." optionally with title = "..." or
+        title ~ "...", joined with or. Every node is active, so the nodes
+        subquery filter is ignored. """
+        clauses = []
+        for resource_type, operator, title in re.findall(
+                r'type = "([^"]+)"(?: and title (=|~) "([^"]+)")?', condition):
+            if not operator:
+                clauses.append((resource_type, lambda t: True))
+            elif operator == "=":
+                clauses.append((resource_type, lambda t, title=title: t == title))
+            else:
+                clauses.append((resource_type, re.compile(title).search))
+        if not clauses:
+            raise ValueError("FakePuppetDB doesn't understand condition: {}".format(condition))
+
+        resources = [
+            r for r in self.resources
+            if any(r["type"] == t and matches(r["title"]) for t, matches in clauses)
+        ]
+        fields = [f.strip() for f in (fields or "").split(",") if f.strip()]
+        if fields:
+            resources = [dict((f, r[f]) for f in fields) for r in resources]
+
+        return resources
+
+    def answer_reports(self, fields, operator, operand):
+        if operand.startswith("nodes["):
+            hashes = [node["latest_report_hash"] for node in self.nodes]
+        else:
+            hashes = re.findall(r'"([^"]+)"', operand)
+
+        reports = [self.reports[h] for h in hashes if h in self.reports]
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+        if fields:
+            reports = [dict((f, r[f]) for f in fields) for r in reports]
+
+        return reports
+
+
+def serve(fake, host="localhost", port=8080):
+    """ An HTTP server answering /pdb/query/v4 like PuppetDB would. Call
+    serve_forever() on it, and shutdown() to stop it. """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/pdb/query/v4":
+                self.send_error(404)
+                return
+
+            try:
+                payload = json.dumps(fake.answer(parse_qs(url.query)["query"][0]))
+            except (KeyError, ValueError) as e:
+                self.send_error(400, str(e))
+                return
+
+            time.sleep(fake.latency)
+            with fake._lock:
+                fake.queries += 1
+                fake.bytes_sent += len(payload)
+
+            body = payload.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic fleet over PuppetDB's query API.")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    server = serve(FakePuppetDB(args.nodes, args.seed, args.latency), port=args.port)
+    print("Serving %d nodes on http://localhost:%d/pdb/query/v4" % (args.nodes, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Time every phase of building an inventory from synthetic fleets.
+
+    PYTHONPATH=. python benchmarks/run.py --nodes 1000 10000 50000
+    PYTHONPATH=. python benchmarks/run.py --compare benchmarks/results/<commit>.json
+
+Each benchmark runs --repeat times and the best time is kept. Results are
+saved to benchmarks/results/<commit>.json (with -dirty appended if the tree
+has uncommitted changes), so that runs on different commits can be compared
+with --compare.
+
+With --http the fleet is served by a local HTTP server on PuppetDB's port
+and queried through simplepup, rather than through the in-process fake.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from fakepuppetdb import FakePuppetDB, serve
+from infinitory import cli
+from infinitory import errors
+from infinitory.inventory import Inventory
+from infinitory.profiling import peak_rss
+from simplepup import puppetdb
+
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def best_of(repeat, setup, function):
+    """ Best time of function(setup()) over repeat runs. setup isn't timed. """
+    times = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def loaded_inventory(pupdb):
+    inventory = Inventory()
+    inventory.add_active_filter()
+    inventory.load_nodes(pupdb, cli.NODE_FIELDS)
+    inventory.load_resources(pupdb)
+    return inventory
+
+
+def bench_fleet(pupdb, repeat, jobs):
+    results = dict()
+    directory = tempfile.mkdtemp()
+    try:
+        def new_inventory():
+            inventory = Inventory()
+            inventory.add_active_filter()
+            return inventory
+
+        results["load_nodes"] = best_of(repeat, new_inventory,
+            lambda inventory: inventory.load_nodes(pupdb, cli.NODE_FIELDS))
+
+        def inventory_with_nodes():
+            inventory = new_inventory()
+            inventory.load_nodes(pupdb, cli.NODE_FIELDS)
+            return inventory
+
+        results["load_resources"] = best_of(repeat, inventory_with_nodes,
+            lambda inventory: inventory.load_resources(pupdb))
+
+        cache_path = os.path.join(directory, "cache")
+
+        def cold_parser():
+            shutil.rmtree(cache_path, ignore_errors=True)
+            return errors.ErrorParser(report_batch_size=100, cache_path=cache_path)
+
+        results["load_reports_cold"] = best_of(repeat, cold_parser,
+            lambda parser: parser.load_reports(pupdb))
+
+        results["load_reports_warm"] = best_of(repeat,
+            lambda: errors.ErrorParser(report_batch_size=100, cache_path=cache_path),
+            lambda parser: parser.load_reports(pupdb))
+
+        # Unchanged reports, after the first repeat has saved the state.
+        results["load_reports_incremental"] = best_of(repeat,
+            lambda: errors.ErrorParser(report_batch_size=100, cache_path=cache_path,
+                incremental=True),
+            lambda parser: parser.load_reports(pupdb))
+
+        loaded = errors.ErrorParser(report_batch_size=100, cache_path=cache_path)
+        reports = list(loaded.iter_reports(pupdb,
+            pupdb.query('nodes[certname, latest_report_hash] { }')))
+
+        results["extract_errors"] = best_of(repeat,
+            lambda: errors.ErrorParser(cache_path=cache_path),
+            lambda parser: parser.extract_errors_from_reports(reports))
+
+        inventory = loaded_inventory(pupdb)
+        inventory.errorParser = errors.ErrorParser(cache_path=cache_path)
+        inventory.errorParser.extract_errors_from_reports(reports)
+
+        results["build_indexes"] = best_of(repeat, lambda: inventory,
+            lambda inventory: inventory.build_indexes())
+
+        results["sorted_services"] = best_of(repeat, lambda: inventory,
+            lambda inventory: inventory.sorted_services())
+
+        output = os.path.join(directory, "output")
+        results["output_html"] = best_of(repeat, lambda: inventory,
+            lambda inventory: cli.output_html(inventory, output, jobs=jobs))
+    finally:
+        shutil.rmtree(directory)
+
+    return results
+
+
+def git(*args):
+    try:
+        return subprocess.check_output(["git"] + list(args),
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def commit_name():
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    if git("status", "--porcelain", "--untracked-files=no"):
+        commit += "-dirty"
+    return commit
+
+
+def print_results(results, baseline=None):
+    header = "%-8s %-24s %10s" % ("nodes", "benchmark", "seconds")
+    if baseline:
+        header += " %10s %8s" % ("baseline", "ratio")
+    print(header)
+
+    for nodes, fleet in sorted(results.items(), key=lambda item: int(item[0])):
+        for name, seconds in fleet.items():
+            line = "%-8s %-24s %10.3f" % (nodes, name, seconds)
+            before = (baseline or dict()).get(nodes, dict()).get(name)
+            if before:
+                line += " %10.3f %7.2fx" % (before, seconds / before)
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=1, help="--jobs for output_html")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every query")
+    parser.add_argument("--http", action="store_true", help="Query the fleet over HTTP")
+    parser.add_argument("--compare", metavar="PATH", help="Results to compare against")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    results = dict()
+    for nodes in args.nodes:
+        fake = FakePuppetDB(nodes, latency=args.latency)
+        if args.http:
+            server = serve(fake)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                results[str(nodes)] = bench_fleet(puppetdb.HTTPConnection(), args.repeat, args.jobs)
+            finally:
+                server.shutdown()
+                server.server_close()
+        else:
+            results[str(nodes)] = bench_fleet(fake, args.repeat, args.jobs)
+        del fake
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        path = os.path.join(RESULTS_PATH, "{}.json".format(commit_name()))
+        with open(path, "w") as f:
+            json.dump({
+                "commit": git("rev-parse", "HEAD"),
+                "date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "arguments": vars(args),
+                "peak_rss_bytes": peak_rss(),
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+        print("Saved results to %s" % path)
+
+
+if __name__ == "__main__":
+    main()
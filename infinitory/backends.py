@@ -0,0 +1,249 @@
+""" Where a loaded inventory is written to.
+
+The static site (cli.HtmlBackend) is one backend. SqliteBackend loads the
+same inventory into a SQLite database, so that scripts can query it
+directly instead of parsing the JSON exports, e.g. the nodes with a role
+but no backups:
+
+    SELECT certname FROM nodes
+    JOIN node_roles ON node_roles.node_id = nodes.id
+    JOIN roles ON roles.id = node_roles.role_id
+    WHERE roles.name = 'role::db'
+    AND nodes.id NOT IN (SELECT node_id FROM node_backups)
+"""
+
+import json
+import logging
+import os
+
+from infinitory import cellformatter
+from infinitory import profiling
+
+
+class Backend(object):
+    def write(self, inventory, generation_time):
+        """ Write inventory (with everything loaded) out. """
+        raise NotImplementedError()
+
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE nodes (
+    id INTEGER PRIMARY KEY,
+    certname TEXT NOT NULL UNIQUE,
+    fqdn TEXT,
+    environment TEXT,
+    timestamp TEXT,
+    facts TEXT,
+    trusted TEXT
+);
+
+-- Each node's value for each column (in its nodes.csv form), keyed by
+-- section.key, e.g. other.monitoring = 'Y'.
+CREATE TABLE node_fields (
+    node_id INTEGER NOT NULL REFERENCES nodes (id),
+    field TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (node_id, field)
+) WITHOUT ROWID;
+
+CREATE TABLE roles (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE node_roles (
+    node_id INTEGER NOT NULL REFERENCES nodes (id),
+    role_id INTEGER NOT NULL REFERENCES roles (id),
+    PRIMARY KEY (node_id, role_id)
+) WITHOUT ROWID;
+
+CREATE TABLE node_backups (
+    node_id INTEGER NOT NULL REFERENCES nodes (id),
+    path TEXT NOT NULL,
+    PRIMARY KEY (node_id, path)
+) WITHOUT ROWID;
+
+CREATE TABLE teams (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE owners (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE services (
+    id INTEGER PRIMARY KEY,
+    class_name TEXT NOT NULL UNIQUE,
+    human_name TEXT,
+    team_id INTEGER REFERENCES teams (id),
+    owner_id INTEGER REFERENCES owners (id),
+    metadata TEXT
+);
+
+CREATE TABLE node_services (
+    node_id INTEGER NOT NULL REFERENCES nodes (id),
+    service_id INTEGER NOT NULL REFERENCES services (id),
+    PRIMARY KEY (node_id, service_id)
+) WITHOUT ROWID;
+
+CREATE TABLE errors (
+    id INTEGER PRIMARY KEY,
+    message TEXT NOT NULL UNIQUE,
+    level TEXT,
+    count INTEGER
+);
+
+-- Not a reference to nodes: reports can come from nodes that were filtered
+-- out of the inventory.
+CREATE TABLE error_nodes (
+    error_id INTEGER NOT NULL REFERENCES errors (id),
+    certname TEXT NOT NULL,
+    PRIMARY KEY (error_id, certname)
+) WITHOUT ROWID;
+"""
+
+# Created once the tables are loaded, which is quicker than keeping them up
+# to date row by row.
+INDEXES = """
+CREATE INDEX nodes_fqdn ON nodes (fqdn);
+CREATE INDEX node_fields_field_value ON node_fields (field, value);
+CREATE INDEX node_roles_role ON node_roles (role_id);
+CREATE INDEX node_backups_path ON node_backups (path);
+CREATE INDEX services_team ON services (team_id);
+CREATE INDEX services_owner ON services (owner_id);
+CREATE INDEX node_services_service ON node_services (service_id);
+CREATE INDEX error_nodes_certname ON error_nodes (certname);
+"""
+
+
+def execute_statements(connection, script):
+    """ Like connection.executescript(), but within the current transaction
+    (executescript() commits first). """
+    for statement in script.split(";"):
+        if statement.strip():
+            connection.execute(statement)
+
+
+class SqliteBackend(Backend):
+    """ Write the inventory to a SQLite database at path.
+
+    The database is built from scratch in path.tmp, in a single transaction
+    with the journal off, and then renamed over path. Readers see either the
+    previous database or the new one, never a partial load. columns are the
+    columns of node_fields (cli.NODE_COLUMNS). """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    @profiling.timed("output.sqlite")
+    def write(self, inventory, generation_time):
+        import sqlite3
+
+        temp_path = "{}.tmp".format(self.path)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        # Cells are formatted once for all the columns, as in output_html.
+        cellformatter.clear_cache()
+        connection = sqlite3.connect(temp_path, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode = OFF")
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.execute("BEGIN")
+            execute_statements(connection, SCHEMA)
+            self.load(connection, inventory, generation_time)
+            execute_statements(connection, INDEXES)
+            connection.execute("COMMIT")
+            connection.execute("ANALYZE")
+        finally:
+            connection.close()
+            cellformatter.clear_cache()
+
+        os.replace(temp_path, self.path)
+        profiling.count("output.sqlite_bytes", os.path.getsize(self.path))
+        logging.getLogger(__name__).info("Wrote %s", self.path)
+
+    def load(self, connection, inventory, generation_time):
+        nodes = inventory.sorted_nodes("facts", "fqdn")
+        services = inventory.sorted_services()
+        node_ids = dict(
+            (node["certname"], node_id) for node_id, node in enumerate(nodes, 1))
+
+        connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("schema_version", str(SCHEMA_VERSION)),
+            ("generation_time", generation_time),
+        ])
+
+        connection.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)", (
+            (node_ids[node["certname"]],
+             node["certname"],
+             node["facts"].get("fqdn"),
+             node.get("environment"),
+             node.get("timestamp"),
+             json.dumps(node["facts"]),
+             json.dumps(node.get("trusted")))
+            for node in nodes))
+
+        connection.executemany("INSERT INTO node_fields VALUES (?, ?, ?)", (
+            (node_ids[node["certname"]],
+             "{}.{}".format(cell.section, cell.key),
+             str(cell.body_csv(node)))
+            for node in nodes
+            for cell in self.columns))
+
+        connection.executemany("INSERT INTO node_backups VALUES (?, ?)", (
+            (node_ids[node["certname"]], path)
+            for node in nodes
+            for path in set(node["other"]["backups"])))
+
+        roles = inventory.sorted_roles()
+        connection.executemany("INSERT INTO roles VALUES (?, ?)", (
+            (role_id, role) for role_id, (role, _) in enumerate(roles, 1)))
+        connection.executemany("INSERT OR IGNORE INTO node_roles VALUES (?, ?)", (
+            (node_ids[node["certname"]], role_id)
+            for role_id, (_, role_nodes) in enumerate(roles, 1)
+            for node in role_nodes))
+
+        team_ids = self.insert_names(connection, "teams", inventory.sorted_teams())
+        owner_ids = self.insert_names(connection, "owners", inventory.sorted_owners())
+
+        connection.executemany("INSERT INTO services VALUES (?, ?, ?, ?, ?, ?)", (
+            (service_id,
+             service["class_name"],
+             service.get("human_name"),
+             team_ids.get(service.get("team")),
+             owner_ids.get(service.get("owner_uid")),
+             json.dumps(dict((k, v) for k, v in service.items() if k != "nodes")))
+            for service_id, service in enumerate(services, 1)))
+        connection.executemany("INSERT OR IGNORE INTO node_services VALUES (?, ?)", (
+            (node_ids[node["certname"]], service_id)
+            for service_id, service in enumerate(services, 1)
+            for node in service["nodes"]))
+
+        unique_errors = inventory.errorParser.unique_errors
+        connection.executemany("INSERT INTO errors VALUES (?, ?, ?, ?)", (
+            (error_id, error["message"], error["level"], error["count"])
+            for error_id, error in enumerate(unique_errors, 1)))
+        connection.executemany("INSERT INTO error_nodes VALUES (?, ?)", (
+            (error_id, certname)
+            for error_id, error in enumerate(unique_errors, 1)
+            for certname in error["certnames"]))
+
+    def insert_names(self, connection, table, groups):
+        """ Insert the names of groups (teams or owners) into table.
+        Returns {name: id}. """
+        ids = dict((group["name"], group_id) for group_id, group in enumerate(groups, 1))
+        connection.executemany(
+            "INSERT INTO {} VALUES (?, ?)".format(table),
+            ((group_id, name) for name, group_id in ids.items()))
+        return ids
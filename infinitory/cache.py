@@ -0,0 +1,220 @@
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "infinitory_cache")
+STATE_FILENAME = "errors-state.json.gz"
+SUFFIX = ".json.gz"
+
+# Report hashes are hex digests; anything else is not a cache key.
+HASH_RE = re.compile(r"\A[0-9a-f]{8,128}\Z")
+
+
+def write_atomically(path, data):
+    """ Write data (bytes) to path via a temporary file in the same directory
+    that is renamed over it, so readers never see a partial file. """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class ReportCache(object):
+    """ Content-addressed on-disk cache of (reduced) PuppetDB reports.
+
+    Each report is stored as gzipped JSON at <path>/<hash[:2]>/<hash>.json.gz.
+    Report hashes never change their content, so entries never go stale; they
+    are only evicted once no node references them any more, or when the cache
+    grows past max_bytes (least recently used first).
+
+    Writes go to a temporary file that is renamed into place, so several runs
+    can safely share a cache directory. """
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or DEFAULT_PATH
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    def entry_path(self, report_hash):
+        return os.path.join(self.path, report_hash[:2], report_hash + SUFFIX)
+
+    def get(self, report_hash):
+        if not HASH_RE.match(report_hash):
+            return None
+
+        path = self.entry_path(report_hash)
+        try:
+            with open(path, "rb") as entry:
+                data = entry.read()
+            report = json.loads(gzip.decompress(data).decode("utf-8"))
+        except FileNotFoundError:
+            self._count(misses=1)
+            return None
+        except (OSError, EOFError, ValueError) as e:
+            self._logger.warning("Discarding corrupt cache entry %s: %s", path, e)
+            self._remove(path)
+            self._count(misses=1)
+            return None
+
+        # Bump mtime so size-based eviction is least-recently-used.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        self._count(hits=1, bytes_read=len(data))
+        return report
+
+    def put(self, report_hash, report):
+        if not HASH_RE.match(report_hash):
+            return
+
+        path = self.entry_path(report_hash)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        data = gzip.compress(
+            json.dumps(report, separators=(",", ":")).encode("utf-8"))
+        write_atomically(path, data)
+
+        self._count(bytes_written=len(data))
+
+    def entries(self):
+        """ Yield (report_hash, path, stat) for every entry in the cache. """
+        if not os.path.isdir(self.path):
+            return
+
+        for directory in os.scandir(self.path):
+            if not directory.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(directory.path):
+                if not entry.name.endswith(SUFFIX):
+                    continue
+                report_hash = entry.name[:-len(SUFFIX)]
+                try:
+                    yield report_hash, entry.path, entry.stat()
+                except FileNotFoundError:
+                    continue
+
+    def prune(self, referenced_hashes):
+        """ Evict entries that no node references any more, then the least
+        recently used entries until the cache fits in max_bytes. """
+        referenced_hashes = set(referenced_hashes)
+        self._remove_legacy_entries()
+
+        kept = []
+        for report_hash, path, stat in self.entries():
+            if report_hash in referenced_hashes:
+                kept.append((stat.st_mtime, stat.st_size, path))
+            else:
+                self._evict(path)
+
+        if self.max_bytes is None:
+            return
+
+        total = sum(size for _, size, _ in kept)
+        for _, size, path in sorted(kept):
+            if total <= self.max_bytes:
+                break
+            self._evict(path)
+            total -= size
+
+    def log_stats(self):
+        self._logger.info(
+            "Report cache: %d hits, %d misses, %d bytes read, %d bytes written, %d evicted",
+            self.hits, self.misses, self.bytes_read, self.bytes_written, self.evicted)
+
+    def _remove_legacy_entries(self):
+        # Older versions stored one pickle per report hash at the top level.
+        if not os.path.isdir(self.path):
+            return
+
+        for entry in os.scandir(self.path):
+            if entry.is_file(follow_symlinks=False) and HASH_RE.match(entry.name):
+                self._remove(entry.path)
+
+    def _evict(self, path):
+        if self._remove(path):
+            self._count(evicted=1)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _count(self, hits=0, misses=0, bytes_read=0, bytes_written=0, evicted=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.bytes_read += bytes_read
+            self.bytes_written += bytes_written
+            self.evicted += evicted
+
+
+class ReportState(object):
+    """ What the last run extracted from each node's latest report, and the
+    unique errors that added up to:
+
+        nodes:          {certname: [report hash, [[level, message], ...]]}
+        unique_errors:  [[message, {level: occurrences},
+                          {certname: occurrences}], ...]
+
+    It is saved in the cache directory, so the next run only has to fetch
+    and parse the reports that changed. The messages in unique_errors were
+    grouped by the ErrorNormalizer with the given version. """
+
+    VERSION = 2
+
+    def __init__(self, normalizer=None, nodes=None, unique_errors=None):
+        self.normalizer = normalizer
+        self.nodes = nodes or dict()
+        self.unique_errors = unique_errors or []
+
+    @classmethod
+    def load(cls, directory):
+        """ Load the state saved in directory, or return None. """
+        path = os.path.join(directory, STATE_FILENAME)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as state_file:
+                data = json.load(state_file)
+            if data.get("version") == cls.VERSION:
+                return cls(data["normalizer"], data["nodes"], data["unique_errors"])
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, ValueError, KeyError, AttributeError) as e:
+            logging.getLogger(__name__).warning("Ignoring report state %s: %s", path, e)
+
+        return None
+
+    def save(self, directory):
+        """ Save the state to directory, replacing the old one atomically. """
+        os.makedirs(directory, exist_ok=True)
+        data = gzip.compress(json.dumps({
+            "version": self.VERSION,
+            "normalizer": self.normalizer,
+            "nodes": self.nodes,
+            "unique_errors": self.unique_errors,
+        }, separators=(",", ":")).encode("utf-8"), mtime=0)
+
+        write_atomically(os.path.join(directory, STATE_FILENAME), data)
@@ -1,11 +1,52 @@
 # -*- coding: utf-8 -*-
 # vim: set fileencoding=utf-8 :
 
-from jinja2 import Markup
+import functools
+from markupsafe import Markup
 from operator import itemgetter
 import re
 
 
+# Formatted cells of each record: id(record) -> (record, {cell key: value}).
+# The record is kept so its id can't be reused by another object while its
+# cells are cached.
+_cache = dict()
+
+
+def required_fields(columns):
+    """ All the record fields the columns read. """
+    return set().union(*[column.fields() for column in columns])
+
+
+def clear_cache():
+    """ Forget every formatted cell. Call this once the output is written,
+    or when records have changed. """
+    _cache.clear()
+
+
+def memoized(method):
+    """ Compute method(self, record) once per record for each kind of
+    column, so a node formatted for the node list, the CSV export and its
+    own page only has its values sorted and deduped once. """
+    @functools.wraps(method)
+    def wrapper(self, record):
+        try:
+            cached_record, cells = _cache[id(record)]
+        except KeyError:
+            cached_record = None
+        if cached_record is not record:
+            cells = dict()
+            _cache[id(record)] = (record, cells)
+
+        key = (type(self), method, self.section, self.key)
+        try:
+            return cells[key]
+        except KeyError:
+            value = cells[key] = method(self, record)
+            return value
+    return wrapper
+
+
 class Base(object):
     def __init__(self, section, key, header=None):
         self.section = section
@@ -19,12 +60,17 @@ class Base(object):
         if re.search(r"[^a-zA-Z0-9_-]", key):
             raise ValueError("Invalid key: {}".format(key))
 
+    def fields(self):
+        """ Paths ("section.key") of the record fields this reads. """
+        return set(["{}.{}".format(self.section, self.key)])
+
     def body_class(self, record):
         return ["key_{}".format(self.key)]
 
     def head_html(self):
         return Markup('<th class="key_%s">%s</th>') % (self.key, self.header)
 
+    @memoized
     def body_html(self, record):
         return Markup('<td class="%s">%s</td>') % (" ".join(self.body_class(record)), self.value_html(record))
 
@@ -40,6 +86,7 @@ class Base(object):
     def value_csv(self, record):
         return self.value(record)
 
+    @memoized
     def value(self, record):
         return record[self.section].get(self.key, None) or ""
 
@@ -90,19 +137,21 @@ class Set(Base):
     def value_html(self, record):
         items = [self.item_html(i) for i in self.value(record)]
 
-        # set() is used here to dedupe things that can't be put into a set in
-        # value(), like a list of dicts()
-        return Markup("<ul>%s</ul>") % Markup("\n").join(set(items))
+        # Dedupe here things that can't be put into a set in value(), like a
+        # list of dicts(). dict.fromkeys() keeps the (sorted) order stable,
+        # where set() would depend on the interpreter's hash seed.
+        return Markup("<ul>%s</ul>") % Markup("\n").join(dict.fromkeys(items))
 
     def item_html(self, item):
         return Markup("<li>%s</li>") % item
 
     def value_csv(self, record):
-        return "\n".join(set([self.item_csv(i) for i in self.value(record)]))
+        return "\n".join(dict.fromkeys([self.item_csv(i) for i in self.value(record)]))
 
     def item_csv(self, item):
         return item
 
+    @memoized
     def value(self, record):
         return sorted(set(record[self.section].get(self.key, [])))
 
@@ -113,7 +162,16 @@ class Roles(Set):
 
 
 class Services(Set):
+    def fields(self):
+        return set(["facts.profile_metadata"])
+
+    @memoized
     def value(self, record):
+        # Sorted once by Inventory.build_indexes(), if it has run.
+        services = record["other"].get("services")
+        if services is not None:
+            return services
+
         profile_metadata = record["facts"].get("profile_metadata", dict())
         return sorted(profile_metadata.get("services", list()), key=itemgetter("human_name"))
 
@@ -131,7 +189,9 @@ class Owners(Services):
         if service.get("owner_uid", ":undef") == ":undef":
             return ""
         else:
-            return Markup('<li>%s</li>') % service["owner_uid"]
+            return Markup('<li><a href="../owners/index.html#%s">%s</a></li>') % (
+                service["owner_uid"],
+                service["owner_uid"])
 
     def item_csv(self, service):
         if service.get("owner_uid", ":undef") == ":undef":
@@ -145,7 +205,9 @@ class Teams(Services):
         if service.get("team", ":undef") == ":undef":
             return ""
         else:
-            return Markup('<li>%s</li>') % service["team"]
+            return Markup('<li><a href="../teams/index.html#%s">%s</a></li>') % (
+                service["team"],
+                service["team"])
 
     def item_csv(self, service):
         if service.get("team", ":undef") == ":undef":
@@ -155,6 +217,11 @@ class Teams(Services):
 
 
 class Fqdn(Base):
+    def fields(self):
+        return super(Fqdn, self).fields() | set(
+            ["certname", "facts.hostname", "facts.domain"])
+
+    @memoized
     def body_html(self, record):
         # Use th instead of td:
         return Markup('<th class="%s">%s</th>') % (
@@ -179,6 +246,7 @@ class Fqdn(Base):
 
 
 class Os(Base):
+    @memoized
     def value(self, record):
         os_fact = record["facts"].get("os", dict())
         os = [os_fact.get("name", "")]
@@ -1,27 +1,123 @@
 #!/usr/bin/env python3
 
 import click
-import csv
 from datetime import datetime
-import jinja2
 import json
 import logging
+import math
 import os
-import markdown2
-import paramiko.ssh_exception
-import pygments.formatters
-import re
-import requests
 import socket
 import shutil
 import sys
 
+from infinitory import cache
+from infinitory.backends import Backend, SqliteBackend
 from infinitory import cellformatter
-from infinitory.inventory import Inventory
-from simplepup import puppetdb
-
+from infinitory import export
+from infinitory import profiling
+from infinitory import search
+from infinitory.snapshot import Snapshot, has_changes
+from infinitory.incremental import (Manifest, fingerprint, staging_directory,
+    swap_directory, template_version)
+from infinitory.normalize import ErrorNormalizer
+from infinitory.scheduler import ConnectionPool, run_loaders
+from infinitory.watch import Status, watch as run_watch
+
+# The PuppetDB client (paramiko, requests), the template engine, pygments
+# and multiprocessing are only imported once they're needed, so that --help
+# and --version (and anything else that fails early) start quickly. See
+# test/cli/test_startup.py.
+
+
+REPORT_COLUMNS = [
+    cellformatter.Fqdn("facts", "fqdn"),
+    cellformatter.Teams("other", "teams"),
+    cellformatter.Services("other", "services"),
+    cellformatter.Boolean("other", "monitoring"),
+    cellformatter.Boolean("other", "backups"),
+    cellformatter.Boolean("other", "logging"),
+    cellformatter.Boolean("other", "metrics"),
+    cellformatter.Roles("other", "roles"),
+]
+
+ALL_COLUMNS = [
+    cellformatter.Base("facts", "fqdn"),
+    cellformatter.Teams("other", "teams"),
+    cellformatter.Owners("other", "owners"),
+    cellformatter.Services("other", "services"),
+    cellformatter.Base("other", "icinga_notification_period", "Icinga notification period"),
+    cellformatter.Base("other", "icinga_stage", header="Icinga stage"),
+    cellformatter.Base("other", "icinga_owner", header="Icinga owner"),
+    cellformatter.Set("other", "backups"),
+    cellformatter.Boolean("other", "logging"),
+    cellformatter.Boolean("other", "metrics"),
+    cellformatter.Base("facts", "whereami"),
+    cellformatter.Base("facts", "primary_ip"),
+    cellformatter.Os("facts", "os"),
+    cellformatter.Roles("other", "roles"),
+    cellformatter.Base("trusted", "certname"),
+    cellformatter.Base("facts", "group"),
+    cellformatter.Base("facts", "function"),
+    cellformatter.Base("facts", "context"),
+    cellformatter.Base("facts", "stage"),
+    cellformatter.Base("facts", "function_number"),
+]
+
+UNIQUE_ERROR_COLUMNS = [
+    cellformatter.Base("other", "count"),
+    cellformatter.Base("other", "level"),
+    cellformatter.Base("other", "message"),
+    cellformatter.TruncatedList("other", "certnames"),
+]
+
+ALL_ERROR_COLUMNS = [
+    cellformatter.Base("other", "message"),
+    cellformatter.Base("other", "level"),
+    cellformatter.Base("other", "certname"),
+]
+
+# Every field of a node shown anywhere: the CSV columns, plus the node list's
+# monitoring flag. What the snapshot compares between runs, and the fields
+# in the SQLite backend.
+NODE_COLUMNS = ALL_COLUMNS + [
+    cell for cell in REPORT_COLUMNS
+    if (cell.section, cell.key) not in set((c.section, c.key) for c in ALL_COLUMNS)]
+
+# Everything a node needs for the columns above, the page templates,
+# Inventory.build_indexes() and the SQLite backend.
+NODE_FIELDS = cellformatter.required_fields(REPORT_COLUMNS + ALL_COLUMNS) | set(
+    ["facts.fqdn", "facts.profile_metadata", "environment", "timestamp"])
+
+
+def output_html(inventory, output, renderer=None, jobs=1, generation_time=None,
+                incremental=False, compress_exports=False, lazy_node_table=False,
+                node_shard_size=1000):
+    """Generate the site into a staging directory, then swap it in for output.
+
+    If incremental is set, node and service pages whose inputs haven't
+    changed since the last run are linked from the current output instead of
+    being rendered again.
+
+    The CSV, JSON and newline delimited JSON exports of the nodes are
+    streamed to disk, and gzipped if compress_exports is set.
+
+    If lazy_node_table is set, nodes/index.html is only a frame that loads
+    the node table from a columnar index in shards of node_shard_size
+    nodes, so its size doesn't depend on the size of the fleet."""
+    laps = profiling.laps("output")
+    if renderer is None:
+        from infinitory.render import Renderer
+        renderer = Renderer()
+    if generation_time is None:
+        generation_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%SZ")
+
+    if incremental:
+        previous_manifest = Manifest.load(output)
+    else:
+        previous_manifest = Manifest()
+    manifest = Manifest()
 
-def output_html(inventory, directory):
+    directory = staging_directory(output)
     if os.path.isdir(directory):
         shutil.rmtree(directory)
     os.mkdir(directory, 0o755)
@@ -30,169 +126,238 @@ def output_html(inventory, directory):
         "{}/static".format(os.path.dirname(os.path.abspath(__file__))),
         "{}/static".format(directory))
 
+    import pygments.formatters
     with open("{}/pygments.css".format(directory), "w", encoding="utf-8") as css:
         css.write(pygments.formatters.HtmlFormatter().get_style_defs('.codehilite'))
 
+    # Pages show the time from here rather than having it baked in, so that
+    # pages reused by an incremental run show the same time as the rest.
+    with open("{}/generated-at.js".format(directory), "w", encoding="utf-8") as js:
+        js.write("var GENERATED_AT = {};\n".format(json.dumps(generation_time)))
+    laps.lap("static")
+
     os.mkdir("{}/errors".format(directory), 0o755)
     os.mkdir("{}/nodes".format(directory), 0o755)
+    # Cells are formatted once for every page and export that shows them.
+    # Start from scratch in case the records changed since the last run.
+    cellformatter.clear_cache()
+    inventory.build_indexes()
     nodes = inventory.sorted_nodes("facts", "fqdn")
-    generation_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%SZ")
+    laps.lap("sort_nodes")
 
     with open("{}/index.html".format(directory), "w", encoding="utf-8") as html:
         html.write(
-            render_template("home.html",
-                path="",
-                generation_time=generation_time))
-
-    report_columns = [
-        cellformatter.Fqdn("facts", "fqdn"),
-        cellformatter.Teams("other", "teams"),
-        cellformatter.Services("other", "services"),
-        cellformatter.Boolean("other", "monitoring"),
-        cellformatter.Boolean("other", "backups"),
-        cellformatter.Boolean("other", "logging"),
-        cellformatter.Boolean("other", "metrics"),
-        cellformatter.Roles("other", "roles"),
-    ]
-
-    unique_error_columns = [
-        cellformatter.Base("other", "count"),
-        cellformatter.Base("other", "level"),
-        cellformatter.Base("other", "message"),
-        cellformatter.TruncatedList("other", "certnames"),
-    ]
+            renderer.render("home.html",
+                path=""))
 
     unique_errors = inventory.unique_errors()
 
     with open("{}/errors/index.html".format(directory), "w", encoding="utf-8") as html:
         html.write(
-            render_template("errors.html",
+            renderer.render("errors.html",
                 path="../",
-                generation_time=generation_time,
-                columns=unique_error_columns,
+                columns=UNIQUE_ERROR_COLUMNS,
                 errors=unique_errors))
 
-    all_error_columns = [
-        cellformatter.Base("other", "message"),
-        cellformatter.Base("other", "level"),
-        cellformatter.Base("other", "certname"),
-    ]
-
-    all_errors = inventory.all_errors()
+    export.write_errors_csv(inventory.errorParser.all_errors,
+        "{}/errors.csv".format(directory))
 
     with open("{}/errors/all.html".format(directory), "w", encoding="utf-8") as html:
         html.write(
-            render_template("all_errors.html",
+            renderer.render("all_errors.html",
                 path="../",
-                generation_time=generation_time,
-                columns=all_error_columns,
+                columns=ALL_ERROR_COLUMNS,
                 errors=unique_errors))
+    laps.lap("errors")
+
+    if lazy_node_table:
+        node_index = "table/index.json"
+        export.write_node_index(nodes, REPORT_COLUMNS,
+            "{}/nodes/table".format(directory), node_shard_size)
+    else:
+        node_index = None
 
     with open("{}/nodes/index.html".format(directory), "w", encoding="utf-8") as html:
         html.write(
-            render_template("nodes.html",
+            renderer.render("nodes.html",
                 path="../",
-                generation_time=generation_time,
-                columns=report_columns,
-                nodes=nodes))
-
-    all_columns = [
-        cellformatter.Base("facts", "fqdn"),
-        cellformatter.Teams("other", "teams"),
-        cellformatter.Owners("other", "owners"),
-        cellformatter.Services("other", "services"),
-        cellformatter.Base("other", "icinga_notification_period", "Icinga notification period"),
-        cellformatter.Base("other", "icinga_stage", header="Icinga stage"),
-        cellformatter.Base("other", "icinga_owner", header="Icinga owner"),
-        cellformatter.Set("other", "backups"),
-        cellformatter.Boolean("other", "logging"),
-        cellformatter.Boolean("other", "metrics"),
-        cellformatter.Base("facts", "whereami"),
-        cellformatter.Base("facts", "primary_ip"),
-        cellformatter.Os("facts", "os"),
-        cellformatter.Roles("other", "roles"),
-        cellformatter.Base("trusted", "certname"),
-        cellformatter.Base("facts", "group"),
-        cellformatter.Base("facts", "function"),
-        cellformatter.Base("facts", "context"),
-        cellformatter.Base("facts", "stage"),
-        cellformatter.Base("facts", "function_number"),
+                columns=REPORT_COLUMNS,
+                csv_file="nodes.csv.gz" if compress_exports else "nodes.csv",
+                node_index=node_index,
+                nodes=[] if lazy_node_table else nodes))
+    laps.lap("nodes_index")
+
+    exports = [
+        export.write_csv(nodes, ALL_COLUMNS, "{}/nodes.csv".format(directory), compress_exports),
+        export.write_json(nodes, "{}/nodes/index.json".format(directory), compress_exports),
+        export.write_ndjson(nodes, "{}/nodes/index.ndjson".format(directory), compress_exports),
     ]
+    profiling.count("output.export_bytes", sum(os.path.getsize(path) for path in exports))
+    laps.lap("exports")
 
-    with open("{}/nodes.csv".format(directory), "w", encoding="utf-8") as out:
-        csv_writer = csv.writer(out, lineterminator="\n")
-        csv_writer.writerow([cell.head_csv() for cell in all_columns])
-        for node in nodes:
-            csv_writer.writerow([cell.body_csv(node) for cell in all_columns])
-
-    write_json(nodes, directory, "index")
-
+    node_version = template_version(renderer, ["node.html", "layout.html"], ALL_COLUMNS[1:])
+    node_pages = []
     for node in nodes:
-        path = "{}/nodes/{}.html".format(directory, node["certname"])
-        with open(path, "w", encoding="utf-8") as html:
-            html.write(
-                render_template("node.html",
-                    path="../",
-                    generation_time=generation_time,
-                    columns=all_columns[1:],
-                    node=node))
+        relative_path = "nodes/{}.html".format(node["certname"])
+        manifest.pages[relative_path] = fingerprint(
+            node_version, node["certname"], node["facts"], node.get("trusted"), node["other"])
+        if not previous_manifest.reuse(relative_path, manifest.pages[relative_path], output, directory):
+            node_pages.append(("{}/{}".format(directory, relative_path), {"node": node}))
+    laps.lap("node_fingerprints")
+
+    render_pages(renderer, "node.html", node_pages,
+        dict(path="../", columns=ALL_COLUMNS[1:]),
+        jobs=jobs)
+    laps.lap("node_pages")
 
     os.mkdir("{}/roles".format(directory), 0o755)
     with open("{}/roles/index.html".format(directory), "w", encoding="utf-8") as html:
         html.write(
-            render_template("roles.html",
+            renderer.render("roles.html",
                 path="../",
-                generation_time=generation_time,
                 roles=inventory.sorted_roles()))
+    laps.lap("roles")
+
+    for name, template_name, groups in [
+            ("teams", "teams.html", inventory.sorted_teams()),
+            ("owners", "owners.html", inventory.sorted_owners())]:
+        os.mkdir("{}/{}".format(directory, name), 0o755)
+        with open("{}/{}/index.html".format(directory, name), "w", encoding="utf-8") as html:
+            html.write(
+                renderer.render(template_name,
+                    path="../",
+                    groups=groups))
+    laps.lap("teams_and_owners")
+
+    search.build_index(inventory, unique_errors).write("{}/search".format(directory))
+    laps.lap("search")
 
     os.mkdir("{}/services".format(directory), 0o755)
     sorted_services = inventory.sorted_services()
 
     with open("{}/services/index.html".format(directory), "w", encoding="utf-8") as html:
         html.write(
-            render_template("services.html",
+            renderer.render("services.html",
                 path="../",
-                generation_time=generation_time,
                 services=sorted_services))
 
+    service_version = template_version(renderer, ["service.html", "layout.html"])
+    service_pages = []
     for service in sorted_services:
-        path = "{}/services/{}.html".format(directory, service["class_name"])
+        relative_path = "services/{}.html".format(service["class_name"])
+        manifest.pages[relative_path] = fingerprint(
+            service_version,
+            dict((k, v) for k, v in service.items() if k != "nodes"),
+            [(node["certname"], node["facts"].get("fqdn")) for node in service["nodes"]])
+        if not previous_manifest.reuse(relative_path, manifest.pages[relative_path], output, directory):
+            service_pages.append(("{}/{}".format(directory, relative_path), {"service": service}))
+
+    render_pages(renderer, "service.html", service_pages,
+        dict(path="../"),
+        jobs=jobs)
+    laps.lap("services")
+
+    logging.getLogger(__name__).info("Rendered %d of %d node and service pages",
+        len(node_pages) + len(service_pages), len(manifest.pages))
+
+    snapshot = Snapshot.from_inventory(inventory, NODE_COLUMNS, unique_errors, generation_time)
+    previous_snapshot = Snapshot.load(output)
+    changes = snapshot.diff(previous_snapshot) if previous_snapshot else None
+
+    with open("{}/changes.json".format(directory), "w", encoding="utf-8") as changes_file:
+        json.dump(changes, changes_file, indent=2)
+
+    with open("{}/changes.html".format(directory), "w", encoding="utf-8") as html:
+        html.write(
+            renderer.render("changes.html",
+                path="",
+                changes=changes,
+                changed=changes is not None and has_changes(changes)))
+    snapshot.save(directory)
+    laps.lap("changes")
+
+    profiling.count("output.pages_rendered", len(node_pages) + len(service_pages))
+    profiling.count("output.pages_reused",
+        len(manifest.pages) - len(node_pages) - len(service_pages))
+
+    manifest.save(directory)
+    swap_directory(directory, output)
+    cellformatter.clear_cache()
+    laps.lap("swap")
+
+
+class HtmlBackend(Backend):
+    """ The static site, see output_html(). """
+
+    def __init__(self, output, renderer=None, **options):
+        self.output = output
+        self.renderer = renderer
+        self.options = options
+
+    def write(self, inventory, generation_time):
+        output_html(inventory, self.output, self.renderer,
+            generation_time=generation_time, **self.options)
+
+
+# Set while a pool of page rendering processes is running. The processes are
+# forked, so they inherit this (nodes, columns and all) rather than having it
+# pickled to them.
+_shared_pages = None
+
+
+def _render_shared_pages(start, stop):
+    renderer, template_name, pages, context = _shared_pages
+    _write_pages(renderer, template_name, pages[start:stop], context)
+
+
+def _write_pages(renderer, template_name, pages, context):
+    for path, page_context in pages:
         with open(path, "w", encoding="utf-8") as html:
-            html.write(
-                render_template("service.html",
-                    path="../",
-                    generation_time=generation_time,
-                    service=service))
-
-
-def render_template(template_name, **kwargs):
-    data_path = os.path.dirname(os.path.abspath(__file__))
-    environment = jinja2.Environment(
-        loader=jinja2.FileSystemLoader("{}/templates".format(data_path)),
-        autoescape=jinja2.select_autoescape(default=True))
-
-    md = markdown2.Markdown(extras=[
-        'fenced-code-blocks',
-        'cuddled-lists',
-        'tables'])
-    def markdown_filter(value):
-        return jinja2.Markup(md.convert(value))
-    environment.filters['markdown'] = markdown_filter
-
-    def unundef(value):
-        return "" if value == ":undef" else value
-    environment.filters['unundef'] = unundef
-
-    _paragraph_re = re.compile(r'(?:\r\n|\r|\n){2,}')
-    def nl2br(value):
-        return jinja2.Markup(
-            u'\n\n'.join(u'<p>%s</p>'
-                % jinja2.Markup.escape(p) for p in _paragraph_re.split(value)))
-    environment.filters['nl2br'] = nl2br
-
-    body_id = re.sub(r"\W+", "_", re.sub(r"\..*", "", template_name))
-    template = environment.get_template(template_name)
-    return template.render(body_id=body_id, **kwargs)
+            html.write(renderer.render(template_name, **context, **page_context))
+
+
+def render_pages(renderer, template_name, pages, context, jobs=1):
+    """Render template_name to each (path, page_context) in pages.
+
+    With jobs > 1 the pages are split into chunks and rendered by a pool of
+    forked processes. Every page still gets exactly the same input, so the
+    output is identical to rendering them serially."""
+    global _shared_pages
+
+    if jobs <= 1 or len(pages) < 2:
+        _write_pages(renderer, template_name, pages, context)
+        return
+
+    # Several chunks per process evens out the load.
+    chunk_size = max(1, math.ceil(len(pages) / (jobs * 4)))
+    chunks = [(start, min(start + chunk_size, len(pages)))
+        for start in range(0, len(pages), chunk_size)]
+
+    import multiprocessing
+    _shared_pages = (renderer, template_name, pages, context)
+    try:
+        with multiprocessing.get_context("fork").Pool(jobs) as pool:
+            pool.starmap(_render_shared_pages, chunks)
+    finally:
+        _shared_pages = None
+
+
+def puppetdb_errors():
+    """ Errors talking to PuppetDB. --watch logs them and tries again next
+    time. Includes timeouts and HTTP errors that outlasted the report query
+    retries (errors.RETRYABLE_ERRORS). """
+    import paramiko.ssh_exception
+    import requests
+    from simplepup import puppetdb
+
+    return (
+        socket.gaierror,
+        paramiko.ssh_exception.SSHException,
+        puppetdb.ResponseError,
+        puppetdb.QueryError,
+        requests.exceptions.RequestException,
+    )
+
 
 def set_up_logging(level=logging.WARNING):
     logging.captureWarnings(True)
@@ -211,18 +376,36 @@ def set_up_logging(level=logging.WARNING):
 
     logging.getLogger("paramiko").setLevel(logging.FATAL)
 
-def write_json(nodes, directory, filename):
-    path = "{}/nodes/{}.json".format(directory, filename)
-    with open(path, "w", encoding="utf-8") as json_out:
-        json_out.write(json.dumps(nodes))
-
 @click.command()
-@click.option("--output", "-o", required=True, metavar="PATH", help="Directory to put report in. WARNING: this directory will be removed if it already exists.")
+@click.option("--output", "-o", required=True, metavar="PATH", help="Directory to put report in. WARNING: this directory will be replaced if it already exists.")
 @click.option("--host", "-h", default="localhost", metavar="HOST", help="PuppetDB host to query")
 @click.option("--verbose", "-v", default=False, is_flag=True)
 @click.option("--debug", "-d", default=False, is_flag=True)
+@click.option("--report-workers", default=1, show_default=True, metavar="N", type=click.IntRange(min=1), help="Number of PuppetDB report queries to run concurrently")
+@click.option("--report-batch-size", default=1, show_default=True, metavar="N", type=click.IntRange(min=1), help="Number of reports to request per PuppetDB query")
+@click.option("--cache-dir", default=cache.DEFAULT_PATH, show_default=True, metavar="PATH", help="Directory to cache PuppetDB reports in")
+@click.option("--cache-max-size", default=1024, show_default=True, metavar="MB", type=click.IntRange(min=0), help="Maximum size of the report cache")
+@click.option("--error-rules", default=None, metavar="PATH", type=click.Path(exists=True, dir_okay=False), help="JSON file of rules for grouping error messages")
+@click.option("--template-cache", default=None, metavar="PATH", help="Directory to cache compiled templates in")
+@click.option("--jobs", "-j", default=1, show_default=True, metavar="N", type=click.IntRange(min=1), help="Number of processes to render pages with")
+@click.option("--incremental", default=False, is_flag=True, help="Only load reports and render node and service pages that changed since the last run")
+@click.option("--gzip", "compress_exports", default=False, is_flag=True, help="Gzip the CSV and JSON node exports")
+@click.option("--all-facts", default=False, is_flag=True, help="Load every fact rather than just the ones in the report (they end up in the JSON exports)")
+@click.option("--lazy-node-table", default=False, is_flag=True, help="Load the node table in the browser from a sharded index instead of rendering every node into one page")
+@click.option("--node-shard-size", default=1000, show_default=True, metavar="N", type=click.IntRange(min=1), help="Number of nodes per shard of the --lazy-node-table index")
+@click.option("--connections", default=2, show_default=True, metavar="N", type=click.IntRange(min=1), help="Number of PuppetDB connections to load data over in parallel")
+@click.option("--profile-output", default=None, metavar="PATH", help="Write timings, counters and peak memory use of the run to PATH as JSON")
+@click.option("--profile", default=False, is_flag=True, help="Also run under cProfile and tracemalloc (slow); the cProfile stats are written next to --profile-output")
+@click.option("--backend", "backend_names", default=["html"], show_default=True, multiple=True, type=click.Choice(["html", "sqlite"]), help="Where to write the inventory to; may be given more than once")
+@click.option("--database", default=None, metavar="PATH", help="SQLite database for --backend sqlite [default: <output>.sqlite]")
+@click.option("--watch", default=None, metavar="SECONDS", type=click.IntRange(min=1), help="Keep running, regenerating the report every SECONDS (implies --incremental)")
+@click.option("--status-file", default=None, metavar="PATH", help="Where --watch writes its status as JSON [default: <output>.status.json]")
 @click.version_option()
-def main(host, output, verbose, debug):
+def main(host, output, verbose, debug, report_workers, report_batch_size,
+         cache_dir, cache_max_size, error_rules, template_cache, jobs,
+         incremental, compress_exports, all_facts, lazy_node_table,
+         node_shard_size, connections, profile_output, profile, backend_names,
+         database, watch, status_file):
     """Generate SRE inventory report"""
     if debug:
         set_up_logging(logging.DEBUG)
@@ -231,20 +414,82 @@ def main(host, output, verbose, debug):
     else:
         set_up_logging(logging.WARNING)
 
+    error_normalizer = None
+    if error_rules:
+        try:
+            error_normalizer = ErrorNormalizer.from_file(error_rules)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--error-rules")
+
+    if profile and not profile_output:
+        profile_output = profiling.DEFAULT_OUTPUT
+
+    if watch:
+        # Only what changed since the previous refresh is loaded and rendered.
+        incremental = True
+
+    import paramiko.ssh_exception
+    import requests
+    from infinitory.inventory import Inventory
+    from infinitory.render import Renderer
+    from simplepup import puppetdb
+
+    backends = []
+    if "html" in backend_names:
+        backends.append(HtmlBackend(output, Renderer(template_cache), jobs=jobs,
+            incremental=incremental, compress_exports=compress_exports,
+            lazy_node_table=lazy_node_table, node_shard_size=node_shard_size))
+    if "sqlite" in backend_names:
+        backends.append(SqliteBackend(
+            database or "{}.sqlite".format(output.rstrip("/")), NODE_COLUMNS))
+
+    pool = ConnectionPool(lambda: puppetdb.AutomaticConnection(host), connections)
+
+    def refresh():
+        run_profile = profiling.current()
+        run_profile.reset()
+        if profile:
+            run_profile.start_tracing()
+
+        inventory = None
+        try:
+            inventory = Inventory(
+                debug=debug,
+                report_workers=report_workers,
+                report_batch_size=report_batch_size,
+                cache_path=cache_dir,
+                cache_max_bytes=cache_max_size * 1024 * 1024,
+                error_normalizer=error_normalizer,
+                incremental=incremental)
+            inventory.add_active_filter()
+
+            run_loaders(inventory.loaders(None if all_facts else NODE_FIELDS), pool)
+
+            generation_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%SZ")
+            for backend in backends:
+                backend.write(inventory, generation_time)
+        finally:
+            if inventory is not None:
+                inventory.errorParser.close()
+            if profile:
+                run_profile.stop_tracing(profiling.pstats_path(profile_output))
+
+        logging.getLogger(__name__).info("Run profile:\n%s", run_profile.summary())
+        if profile_output:
+            run_profile.write_json(profile_output)
+        return run_profile.counters
+
     try:
-        inventory = Inventory(debug=debug)
-        inventory.add_active_filter()
-
-        with puppetdb.AutomaticConnection(host) as pupdb:
-            inventory.load_nodes(pupdb)
-            inventory.load_errors(pupdb)
-            inventory.load_backups(pupdb)
-            inventory.load_logging(pupdb)
-            inventory.load_metrics(pupdb)
-            inventory.load_monitoring(pupdb)
-            inventory.load_roles(pupdb)
-
-        output_html(inventory, output)
+        with pool:
+            if watch:
+                status = Status(status_file or "{}.status.json".format(output.rstrip("/")), watch)
+                run_watch(refresh, watch, status, recoverable=puppetdb_errors(),
+                    on_error=pool.close)
+            else:
+                refresh()
+    except KeyboardInterrupt:
+        if not watch:
+            raise
     except socket.gaierror as e:
         sys.exit("PuppetDB connection (Socket): {}".format(e))
     except paramiko.ssh_exception.SSHException as e:
@@ -1,116 +1,395 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import json
 import logging
-import os
-import pickle
+import paramiko.ssh_exception
+import requests
 import sys
+import tempfile
 import time
 
-from datetime import datetime
+from infinitory import profiling
+from infinitory.cache import ReportCache, ReportState
+from infinitory.normalize import ErrorNormalizer
+from simplepup import puppetdb
+
+
+# Errors worth retrying a report query for; anything else is a bug.
+RETRYABLE_ERRORS = (
+    OSError,
+    paramiko.ssh_exception.SSHException,
+    puppetdb.QueryError,
+    puppetdb.ResponseError,
+    requests.exceptions.RequestException,
+)
+
+# The only report fields extract_errors_from_reports() needs (plus the hash,
+# to match batched results back up with nodes).
+REPORT_FIELDS = ["certname", "hash", "status", "logs"]
+
+# Most severe first.
+ERROR_LEVELS = ("err", "warning")
+
+
+def reduce_report(report):
+    """ Strip a report down to what extract_errors_from_reports() reads. """
+    return {
+        "certname": report["certname"],
+        "hash": report["hash"],
+        "status": report["status"],
+        "logs": {
+            "data": [
+                {"level": log["level"], "message": log["message"]}
+                for log in report["logs"]["data"]
+                if log["level"] in ERROR_LEVELS
+            ],
+        },
+    }
+
+
+def ordered_map(function, items, workers=1):
+    """ Yield function(item) for each item, in order, with up to workers
+    calls running at once. Unlike Executor.map(), only a couple of results
+    per worker are kept waiting to be consumed. """
+    if workers <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ErrorSpool(object):
+    """ Every error found, in order, spooled to a temporary file as JSON
+    lines rather than kept in memory. Iterating reads them back. """
+
+    def __init__(self):
+        self._file = tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", prefix="infinitory-errors-", suffix=".jsonl")
+        self._count = 0
+
+    def append(self, error):
+        self._file.write(json.dumps(error))
+        self._file.write("\n")
+        self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        self._file.flush()
+        with open(self._file.name, encoding="utf-8") as spool:
+            for line in spool:
+                yield json.loads(line)
+
+    def close(self):
+        self._file.close()
+
+
+def report_errors(report):
+    """ The [level, message] of each error and warning logged in report. """
+    return [
+        [log["level"], log["message"]]
+        for log in report["logs"]["data"]
+        if log["level"] in ERROR_LEVELS
+    ]
+
+
+def decrement(counts, key):
+    """ Take one off counts[key], dropping it when it gets to 0. """
+    if counts[key] > 1:
+        counts[key] -= 1
+    else:
+        del counts[key]
+
+
+class UniqueError(object):
+    """ Aggregate of every occurrence of one (cleaned) error message.
+
+    Its level is the most severe level it was logged at, so it doesn't
+    depend on the order the occurrences were added (or removed) in. """
+    __slots__ = ("message", "levels", "count", "certnames")
+
+    def __init__(self, message):
+        self.message = message
+        # level: number of occurrences at that level
+        self.levels = dict()
+        self.count = 0
+        # certname: number of occurrences on that node
+        self.certnames = dict()
+
+    @classmethod
+    def from_state(cls, message, levels, certnames):
+        unique_error = cls(message)
+        unique_error.levels = levels
+        unique_error.count = sum(certnames.values())
+        unique_error.certnames = certnames
+        return unique_error
+
+    @property
+    def level(self):
+        for level in ERROR_LEVELS:
+            if level in self.levels:
+                return level
+        return None
+
+    def add(self, level, certname):
+        self.count += 1
+        self.levels[level] = self.levels.get(level, 0) + 1
+        self.certnames[certname] = self.certnames.get(certname, 0) + 1
+
+    def remove(self, level, certname):
+        self.count -= 1
+        decrement(self.levels, level)
+        decrement(self.certnames, certname)
+
+    def as_state(self):
+        return [self.message, self.levels, self.certnames]
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'level': self.level,
+            'certnames': sorted(self.certnames),
+            'message': self.message,
+        }
 
 
 class ErrorParser(object):
-    def __init__(self, debug=False):
-        self.all_errors = []
-        self.reports_cache_path = '/tmp/infinitory_cache'
+    def __init__(self, debug=False, report_workers=1, report_batch_size=1,
+                 report_retries=3, report_timeout=60, retry_backoff=1.0,
+                 cache_path=None, cache_max_bytes=None, normalizer=None,
+                 incremental=False):
+        self.all_errors = ErrorSpool()
+        self.report_count = 0
+        self.normalizer = normalizer or ErrorNormalizer()
+        self.report_cache = ReportCache(cache_path, cache_max_bytes)
         self.debug = debug
+        self.report_workers = report_workers
+        self.report_batch_size = report_batch_size
+        self.report_retries = report_retries
+        self.report_timeout = report_timeout
+        self.retry_backoff = retry_backoff
+        self.incremental = incremental
         self._logger = logging.getLogger()
-        self._reports = dict()
-        self.unique_errors = []
-        self.delete_report_cache()
-
-    def delete_report_cache(self):
-        if not os.path.isdir(self.reports_cache_path):
-            os.mkdir(self.reports_cache_path)
-
-        for file in os.listdir(self.reports_cache_path):
-            # Delete cache item if older than 2 hours
-            absolute_cache_file_path = os.path.join(self.reports_cache_path,file)
-            time_one_hour_ago = time.mktime(datetime.now().timetuple()) - (1 * 3600)
-            if os.stat(absolute_cache_file_path).st_mtime < time_one_hour_ago:
-                print("Deleting File " + absolute_cache_file_path)
-                os.remove(absolute_cache_file_path)
+        self._unique_errors = dict()
 
+    @profiling.timed("errors.load_reports")
     def load_reports(self, pupdb):
         """ I didn't use a subquery because it takes much longer than loading
-        the reports one by one """
-        for report in pupdb.query('nodes[certname, latest_report_hash] { }'):
-            cache_file = "%s/%s" % (self.reports_cache_path, report["latest_report_hash"])
-            if os.path.isfile(cache_file):
-                full_report = pickle.load(open(cache_file, "rb"))
-                if self.debug:
-                    sys.stdout.write('#')
+        the reports one by one. Instead missing reports are requested in
+        chunks of report_batch_size hashes per query, optionally with several
+        queries in flight at once (report_workers).
+
+        Each report's errors are extracted as soon as it arrives and the
+        report is dropped, so only a few chunks of reports are in memory at
+        any time. Reports are still folded in in the order PuppetDB returned
+        the nodes, so the errors are the same no matter how the queries were
+        split up.
+
+        If incremental is set, only the reports that changed since the last
+        run are loaded at all, see load_changed_reports(). """
+        nodes = pupdb.query('nodes[certname, latest_report_hash] { }')
+        if self.incremental:
+            self.load_changed_reports(pupdb, nodes)
+        else:
+            self.extract_errors_from_reports(self.iter_reports(pupdb, nodes))
+
+        self.report_cache.prune(
+            node["latest_report_hash"] for node in nodes
+            if node["latest_report_hash"])
+        self.report_cache.log_stats()
+
+        profiling.count("errors.reports", self.report_count)
+        profiling.count("report_cache.hits", self.report_cache.hits)
+        profiling.count("report_cache.misses", self.report_cache.misses)
+        profiling.count("report_cache.bytes_read", self.report_cache.bytes_read)
+        profiling.count("report_cache.bytes_written", self.report_cache.bytes_written)
+
+    def load_changed_reports(self, pupdb, nodes):
+        """ Start from the errors the last run saved (a ReportState), take
+        out those of nodes whose latest report changed or that are gone, and
+        fold in the errors of the new reports. all_errors is then rebuilt
+        from the saved errors, in node order.
+
+        Unique errors first seen in this run are listed after the ones that
+        were already known. If the normalizer rules changed, the saved
+        state is ignored and every report is processed again. """
+        state = ReportState.load(self.report_cache.path)
+        if state is None or state.normalizer != self.normalizer.version:
+            state = ReportState(self.normalizer.version)
+        for message, levels, certnames in state.unique_errors:
+            self._unique_errors[message] = UniqueError.from_state(message, levels, certnames)
+
+        latest = dict((node["certname"], node["latest_report_hash"]) for node in nodes)
+        for certname, (report_hash, errors) in list(state.nodes.items()):
+            if latest.get(certname) != report_hash:
+                self.remove_unique_errors(certname, errors)
+                del state.nodes[certname]
+
+        changed = [
+            node for node in nodes
+            if node["latest_report_hash"] and node["certname"] not in state.nodes]
+        for report in self.iter_reports(pupdb, changed):
+            self.report_count += 1
+            errors = report_errors(report)
+            self.add_unique_errors(report["certname"], errors)
+            state.nodes[report["certname"]] = [report["hash"], errors]
+
+        for node in nodes:
+            _, errors = state.nodes.get(node["certname"], (None, ()))
+            for level, message in errors:
+                self.all_errors.append({
+                    'level': level,
+                    'hostname': node["certname"],
+                    'message': message
+                })
+
+        state.unique_errors = [e.as_state() for e in self._unique_errors.values()]
+        state.save(self.report_cache.path)
+
+    def iter_reports(self, pupdb, nodes):
+        """ Yield the (reduced) latest report of each node, in order. """
+        nodes = [node for node in nodes if node["latest_report_hash"]]
+        size = self.report_batch_size
+        chunks = [nodes[i:i + size] for i in range(0, len(nodes), size)]
+
+        def load_chunk(chunk):
+            hashes = [node["latest_report_hash"] for node in chunk]
+            return chunk, self.load_reports_by_hash(pupdb, hashes)
+
+        for chunk, reports in ordered_map(load_chunk, chunks, self.report_workers):
+            for node in chunk:
+                try:
+                    yield reports[node["latest_report_hash"]]
+                except KeyError:
+                    self._logger.info("No report found for %s", node["certname"])
+
+    def load_reports_by_hash(self, pupdb, hashes):
+        """ The reports with the given hashes, from the cache or else from
+        a single query. """
+        reports = dict()
+        missing = []
+        for report_hash in dict.fromkeys(hashes):
+            report = self.read_cached_report(report_hash)
+            if report is None:
+                missing.append(report_hash)
             else:
-                query = 'reports[] { hash = "%s" }' % report["latest_report_hash"]
-                full_report = pupdb.query(query)
-                pickle.dump( full_report, open(cache_file, "wb" ) )
-                if self.debug:
-                    sys.stdout.write('.')
+                reports[report_hash] = report
+
+        if missing:
+            self.add_queried_reports(reports, self.query_reports(pupdb, missing))
+
+        return reports
+
+    def add_queried_reports(self, reports, chunk_reports):
+        for report in chunk_reports:
+            report = reduce_report(report)
+            self.write_cached_report(report["hash"], report)
+            reports[report["hash"]] = report
+
+    def read_cached_report(self, report_hash):
+        report = self.report_cache.get(report_hash)
+        if report is not None and self.debug:
+            sys.stdout.write('#')
             sys.stdout.flush()
 
-            self._reports[report["certname"]] = full_report[0]
+        return report
 
-    def common_error_prefixes(self):
-        return [
-            "Could not retrieve catalog from remote server: Error 500 on SERVER: Server Error: Evaluation Error: Error while evaluating a Function Call, Untrusted facts (left) don't match values from certname (right)"
-        ]
+    def write_cached_report(self, report_hash, report):
+        self.report_cache.put(report_hash, report)
+        if self.debug:
+            sys.stdout.write('.')
+            sys.stdout.flush()
 
-    def matches_stored_error(self, message):
-        for se in self.common_error_prefixes():
-            if message.startswith(se):
-                return se
+    def report_query(self, hashes):
+        """ Build a query for the reports with the given hashes, projecting
+        only the fields extract_errors_from_reports() uses. """
+        fields = ", ".join(REPORT_FIELDS)
+        if len(hashes) == 1:
+            return 'reports[%s] { hash = "%s" }' % (fields, hashes[0])
 
-        return None
+        return 'reports[%s] { hash in [%s] }' % (
+            fields, ", ".join('"%s"' % h for h in hashes))
+
+    def query_reports(self, pupdb, hashes):
+        """ Query a chunk of reports, retrying with exponential backoff so
+        that one slow or flaky request doesn't abort the whole run. """
+        query = self.report_query(hashes)
+        for attempt in range(self.report_retries + 1):
+            try:
+                with profiling.phase("errors.query_reports"):
+                    reports = pupdb.query(query, timeout=self.report_timeout)
+                profiling.count("errors.report_rows", len(reports))
+                return reports
+            except RETRYABLE_ERRORS as e:
+                profiling.count("errors.report_retries")
+                if attempt == self.report_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                self._logger.warning(
+                    "Reports %s: %s (retrying in %.1fs)",
+                    ", ".join(hashes), e, delay)
+                time.sleep(delay)
 
     def clean_error_message(self, error_message):
-        stored_error = self.matches_stored_error(error_message)
+        return self.normalizer.normalize(error_message)
 
-        if stored_error:
-            return stored_error
+    @property
+    def unique_errors(self):
+        """ Unique errors in the order they were first seen, as dicts. """
+        return [e.as_dict() for e in self._unique_errors.values()]
 
-        return error_message
+    def append_unique_error(self, error_message, log_level, certname):
+        try:
+            unique_error = self._unique_errors[error_message]
+        except KeyError:
+            unique_error = UniqueError(error_message)
+            self._unique_errors[error_message] = unique_error
 
-    def modify_unique_errors_at(self, i, log_level, certname):
+        unique_error.add(log_level, certname)
 
-        new_certname_list = self.unique_errors[i]['certnames']
-        new_certname_list.add(certname)
+    def extract_errors_from_reports(self, reports):
+        """ Fold each report's errors into all_errors and the unique errors.
+        reports may be any iterable; each report is dropped once read. """
+        for report in reports:
+            self.add_report(report)
 
-        self.unique_errors[i] = {
-            'count': self.unique_errors[i]['count'] + 1,
-            'level': log_level,
-            'certnames': new_certname_list,
-            'message': self.unique_errors[i]['message']
-        }
+    def add_report(self, report):
+        self.report_count += 1
+        self._logger.debug("%s -- %s" % (report["certname"], report["status"]))
+        errors = report_errors(report)
+        for level, message in errors:
+            self.all_errors.append({
+                'level': level,
+                'hostname': report["certname"],
+                'message': message
+            })
 
-    def append_unique_error(self, error_message, log_level, certname):
-        for i, ue in enumerate(self.unique_errors):
-            if ue['message'] == error_message:
-                self.modify_unique_errors_at(i, log_level, certname)
-                return
-
-        self.unique_errors.append({
-            'count': 1,
-            'level': log_level,
-            'certnames': set([certname]),
-            'message': error_message,
-        })
-
-    def extract_errors_from_reports(self):
-        for node, report in self._reports.items():
-
-            self._logger.debug("%s -- %s" % (report["certname"], report["status"]))
-            for log_message in report['logs']['data']:
-                if log_message['level'] == 'err' or log_message['level'] == 'warning':
-                    error = {
-                        'level': log_message['level'],
-                        'hostname': report["certname"],
-                        'message': log_message['message']
-                    }
-
-                    self.all_errors.append(error)
-
-                    error_message = self.clean_error_message(error['message'])
-
-                    self.append_unique_error(
-                        error_message,
-                        log_message['level'],
-                        report['certname']
-                    )
+        self.add_unique_errors(report["certname"], errors)
+
+    def add_unique_errors(self, certname, errors):
+        for level, message in errors:
+            self.append_unique_error(self.clean_error_message(message), level, certname)
+
+    def remove_unique_errors(self, certname, errors):
+        for level, message in errors:
+            message = self.clean_error_message(message)
+            unique_error = self._unique_errors.get(message)
+            if (unique_error is None or certname not in unique_error.certnames
+                    or level not in unique_error.levels):
+                continue
+            unique_error.remove(level, certname)
+            if not unique_error.count:
+                del self._unique_errors[message]
+
+    def close(self):
+        """ Delete the all_errors spool, once everything has been written. """
+        self.all_errors.close()
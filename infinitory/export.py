@@ -0,0 +1,107 @@
+import csv
+import gzip
+import itertools
+import json
+import os
+
+from infinitory.record import json_default
+
+
+def open_output(path, compress=False):
+    """ Open path for writing text, gzipped (with .gz appended) if compress
+    is set. Returns the file and the path actually written. """
+    if compress:
+        path = "{}.gz".format(path)
+        return gzip.open(path, "wt", encoding="utf-8", newline=""), path
+
+    return open(path, "w", encoding="utf-8", newline=""), path
+
+
+def write_csv(nodes, columns, path, compress=False):
+    out, path = open_output(path, compress)
+    with out:
+        csv_writer = csv.writer(out, lineterminator="\n")
+        csv_writer.writerow([cell.head_csv() for cell in columns])
+        for node in nodes:
+            csv_writer.writerow([cell.body_csv(node) for cell in columns])
+
+    return path
+
+
+def write_errors_csv(errors, path):
+    """ Write errors (dicts with a level, hostname and message) as CSV, one
+    at a time, so they can come straight from the ErrorParser's spool. """
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        csv_writer = csv.writer(out, lineterminator="\n")
+        csv_writer.writerow(["Level", "Hostname", "Message"])
+        for error in errors:
+            csv_writer.writerow([error["level"], error["hostname"], error["message"]])
+
+    return path
+
+
+def write_json(nodes, path, compress=False):
+    """ Write nodes as a JSON array, one node at a time.
+
+    The output is the same as json.dumps(nodes), without ever holding all of
+    it in memory. NodeRecords are written as their to_dict(). """
+    out, path = open_output(path, compress)
+    with out:
+        out.write("[")
+        for i, node in enumerate(nodes):
+            if i:
+                out.write(", ")
+            out.write(json.dumps(node, default=json_default))
+        out.write("]")
+
+    return path
+
+
+def write_ndjson(nodes, path, compress=False):
+    """ Write nodes as newline delimited JSON: one node per line. """
+    out, path = open_output(path, compress)
+    with out:
+        for node in nodes:
+            out.write(json.dumps(node, default=json_default))
+            out.write("\n")
+
+    return path
+
+
+def write_node_index(nodes, columns, directory, shard_size=1000):
+    """ Write a columnar index of the nodes for the lazily loaded node table:
+    directory/index.json describes the columns and shards, and each shard
+    (directory/<n>.json) holds shard_size nodes as
+
+        {"html": [[cells of the first column], ...], "text": [...]}
+
+    where html is each cell's body_html() and text its body_csv(), for
+    sorting and filtering. Returns the paths written. """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    total = 0
+    nodes = iter(nodes)
+    while True:
+        shard = list(itertools.islice(nodes, shard_size))
+        if not shard:
+            break
+
+        path = os.path.join(directory, "{}.json".format(len(paths)))
+        with open(path, "w", encoding="utf-8") as out:
+            json.dump({
+                "html": [[str(cell.body_html(node)) for node in shard] for cell in columns],
+                "text": [[str(cell.body_csv(node)) for node in shard] for cell in columns],
+            }, out, separators=(",", ":"))
+        paths.append(path)
+        total += len(shard)
+
+    path = os.path.join(directory, "index.json")
+    with open(path, "w", encoding="utf-8") as out:
+        json.dump({
+            "columns": [{"key": cell.key, "header": cell.head_csv()} for cell in columns],
+            "total": total,
+            "shard_size": shard_size,
+            "shards": [os.path.basename(p) for p in paths],
+        }, out, separators=(",", ":"))
+
+    return paths + [path]
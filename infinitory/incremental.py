@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+
+class Manifest(object):
+    """ Fingerprints of the inputs each page was rendered from.
+
+    It is saved in the output directory, so the next run can tell which
+    pages are unchanged and link them into the new output instead of
+    rendering them again. """
+
+    FILENAME = ".infinitory-manifest.json"
+    VERSION = 1
+
+    def __init__(self, pages=None):
+        self.pages = pages or dict()
+
+    @classmethod
+    def load(cls, directory):
+        path = os.path.join(directory, cls.FILENAME)
+        try:
+            with open(path, "r", encoding="utf-8") as manifest_file:
+                data = json.load(manifest_file)
+            if data.get("version") == cls.VERSION:
+                return cls(data["pages"])
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, AttributeError) as e:
+            logging.getLogger(__name__).warning("Ignoring manifest %s: %s", path, e)
+
+        return cls()
+
+    def save(self, directory):
+        path = os.path.join(directory, self.FILENAME)
+        with open(path, "w", encoding="utf-8") as manifest_file:
+            json.dump({"version": self.VERSION, "pages": self.pages}, manifest_file)
+
+    def reuse(self, relative_path, fingerprint, previous_directory, directory):
+        """ Link relative_path from previous_directory into directory if it
+        was rendered from the same fingerprint. Returns True if it was. """
+        if self.pages.get(relative_path) != fingerprint:
+            return False
+
+        try:
+            link_or_copy(
+                os.path.join(previous_directory, relative_path),
+                os.path.join(directory, relative_path))
+        except FileNotFoundError:
+            return False
+
+        return True
+
+
+def _fingerprint_default(value):
+    try:
+        return value.to_dict()
+    except AttributeError:
+        return str(value)
+
+
+def fingerprint(*inputs):
+    """ Hash JSON-like inputs, independent of dict ordering. Objects with a
+    to_dict() method (like NodeRecord) are hashed as that dict. """
+    data = json.dumps(inputs, sort_keys=True, separators=(",", ":"),
+        default=_fingerprint_default)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def template_version(renderer, template_names, columns=()):
+    """ Fingerprint of what a page looks like apart from its data: the
+    template sources and the column definitions. """
+    sources = [
+        renderer.environment.loader.get_source(renderer.environment, name)[0]
+        for name in template_names]
+    column_specs = [
+        (type(column).__name__, column.section, column.key, column.header)
+        for column in columns]
+    return fingerprint(sources, column_specs)
+
+
+def link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # E.g. a filesystem without hard links.
+        shutil.copy2(source, destination)
+
+
+def staging_directory(directory):
+    return "{}.staging".format(os.path.normpath(directory))
+
+
+def swap_directory(staging, directory):
+    """ Replace directory with staging.
+
+    There is no portable way to atomically exchange two directories, so the
+    old one is renamed out of the way first. The window in which directory
+    doesn't exist is two renames long, rather than a whole run. """
+    directory = os.path.normpath(directory)
+    previous = "{}.previous".format(directory)
+    if os.path.isdir(previous):
+        shutil.rmtree(previous)
+
+    if os.path.isdir(directory):
+        os.rename(directory, previous)
+    os.rename(staging, directory)
+
+    if os.path.isdir(previous):
+        shutil.rmtree(previous)
@@ -1,17 +1,105 @@
 from collections import defaultdict
 from operator import itemgetter
+import re
 from simplepup import puppetdb
+import sys
+import threading
 
 import infinitory.errors as errors
+from infinitory import profiling
+from infinitory.record import NodeRecord
+from infinitory.scheduler import Loader
+
+
+# Sections of a node that infinitory fills in itself.
+LOCAL_SECTIONS = ("other",)
+
+
+def inventory_query(fields=None):
+    if fields is None:
+        return 'inventory {}'
+
+    projection = set(["certname"])
+    for field in fields:
+        section = field.split(".", 1)[0]
+        if section not in LOCAL_SECTIONS:
+            projection.add(field)
+
+    return 'inventory[%s] {}' % ", ".join(sorted(projection))
+
+
+def unflatten_node(row):
+    """ Turn a projected inventory row like {"facts.os": ...} back into the
+    shape of a full one, {"facts": {"os": ...}}. Missing facts are left
+    out, as they would be in a full row. """
+    node = {"facts": dict(), "trusted": dict()}
+    for field, value in row.items():
+        if "." in field:
+            section, key = field.split(".", 1)
+            if value is not None:
+                node.setdefault(section, dict())[key] = value
+        else:
+            node[field] = value
+
+    return node
+
+
+class Enrichment(object):
+    """ Information about nodes loaded from their resources.
+
+    Resources of resource_type (and optionally with the given title, or a
+    title matching title_pattern) are passed to handler(node, resource).
+    Resources with ensure => absent are skipped unless include_absent is
+    set. """
+
+    def __init__(self, name, handler, resource_type, title=None,
+                 title_pattern=None, include_absent=False):
+        self.name = name
+        self.handler = handler
+        self.resource_type = resource_type
+        self.title = title
+        self.title_pattern = title_pattern
+        self.include_absent = include_absent
+        self._title_re = re.compile(title_pattern) if title_pattern else None
+
+    def condition(self):
+        condition = 'type = "%s"' % self.resource_type
+        if self.title is not None:
+            condition += ' and title = "%s"' % self.title
+        if self.title_pattern is not None:
+            condition += ' and title ~ "%s"' % self.title_pattern
+        return condition
+
+    def matches(self, resource):
+        if resource["type"] != self.resource_type:
+            return False
+        if self.title is not None and resource["title"] != self.title:
+            return False
+        if self._title_re and not self._title_re.search(resource["title"]):
+            return False
+        return True
 
 
 class Inventory(object):
-    def __init__(self, filters=set(), debug=False):
+    def __init__(self, filters=set(), debug=False, report_workers=1,
+                 report_batch_size=1, cache_path=None, cache_max_bytes=None,
+                 error_normalizer=None, incremental=False):
         self.debug = debug
-        self.errorParser = errors.ErrorParser(debug=debug)
+        self.errorParser = errors.ErrorParser(
+            debug=debug,
+            report_workers=report_workers,
+            report_batch_size=report_batch_size,
+            cache_path=cache_path,
+            cache_max_bytes=cache_max_bytes,
+            normalizer=error_normalizer,
+            incremental=incremental)
         self.filter = puppetdb.QueryFilter(filters)
         self.nodes = None
         self.roles = None
+        self.services = None
+        self.teams = None
+        self.owners = None
+        self._merge_lock = threading.Lock()
 
     def add_active_filter(self):
         self.filter.add("nodes { deactivated is null and expired is null }")
@@ -19,38 +107,36 @@ class Inventory(object):
     def add_filter(self, filter):
         self.filter.add(filter)
 
-    def load_nodes(self, pupdb):
-        self.nodes = dict()
-        for node in pupdb.query(self.filter('inventory {}')):
-            node["other"] = defaultdict(list)
-            self.nodes[node["certname"]] = node
-
-    def query_classes(self, pupdb, class_name):
-        return self.query_resources(pupdb,
-            'title="%s" and type="Class"' % class_name)
-
-    def query_resources(self, pupdb, condition, include_absent=False):
-        for resource in pupdb.query(self.filter('resources {}', condition)):
-            if not include_absent:
-                if resource["parameters"].get("ensure", None) == "absent":
-                    continue
+    def loaders(self, node_fields=None):
+        """ The loaders for a full inventory, for scheduler.run_loaders().
+        Error reports don't depend on the inventory's nodes, so they can be
+        loaded alongside them. """
+        return [
+            Loader("nodes", lambda pupdb: self.load_nodes(pupdb, node_fields)),
+            Loader("errors", self.load_errors),
+            Loader("resources", self.load_resources, requires=["nodes"]),
+        ]
 
-            try:
-                yield self.nodes[resource["certname"]], resource
-            except KeyError:
-                continue
+    @profiling.timed("inventory.load_nodes")
+    def load_nodes(self, pupdb, fields=None):
+        """ Load active nodes from the inventory.
 
-    def load_backups(self, pupdb):
-        for node, resource in self.query_resources(pupdb, 'type="Backup::Job"'):
-            paths = resource["parameters"]["files"]
-            if type(paths) is list:
-                node["other"]["backups"].extend(paths)
-            else:
-                node["other"]["backups"].append(paths)
+        If fields is set, only those fields are requested from PuppetDB,
+        e.g. ["facts.os", "trusted.certname"]. Fields in the other section
+        are filled in by infinitory itself, so they are ignored.
+
+        Nodes are stored as NodeRecords. """
+        self.nodes = dict()
+        for row in pupdb.query(self.filter(inventory_query(fields))):
+            if fields is not None:
+                row = unflatten_node(row)
+            node = NodeRecord.from_inventory(row)
+            self.nodes[node.certname] = node
+
+        profiling.count("inventory.nodes", len(self.nodes))
 
     def load_errors(self, pupdb):
         self.errorParser.load_reports(pupdb)
-        self.errorParser.extract_errors_from_reports()
 
     def wrap_with_category(self, list_of_hashes, category):
         retval = []
@@ -63,56 +149,148 @@ class Inventory(object):
     def unique_errors(self):
         return self.wrap_with_category(self.errorParser.unique_errors, "other")
 
-    def all_errors(self):
-        return self.wrap_with_category(self.errorParser.all_errors, "other")
+    def enrichments(self):
+        """ Everything loaded from nodes' resources, see load_resources(). """
+        return [
+            Enrichment("backups", self.add_backup, "Backup::Job"),
+            Enrichment("logging", self.add_logging,
+                "Class", title="Profile::Logging::Rsyslog::Client"),
+            Enrichment("metrics", self.add_metrics,
+                "Class", title="Profile::Metrics"),
+            Enrichment("monitoring", self.add_monitoring,
+                "Class", title="Profile::Server::Monitor"),
+            Enrichment("icinga", self.add_icinga,
+                "Class", title="Profile::Monitoring::Icinga2::Common"),
+            Enrichment("roles", self.add_role,
+                "Class", title_pattern="^Role::"),
+        ]
 
-    def load_logging(self, pupdb):
-        for node, resource in self.query_classes(pupdb, "Profile::Logging::Rsyslog::Client"):
-            node["other"]["logging"] = True
+    @profiling.timed("inventory.load_resources")
+    def load_resources(self, pupdb, names=None):
+        """ Load the enrichments with the given names (default: all of them)
+        with a single resources query, handing each resource to every
+        enrichment it matches. """
+        enrichments = [e for e in self.enrichments() if names is None or e.name in names]
+        if not enrichments:
+            return
 
-    def load_metrics(self, pupdb):
-        for node, resource in self.query_classes(pupdb, "Profile::Metrics"):
-            node["other"]["metrics"] = True
+        if any(e.name == "roles" for e in enrichments):
+            self.roles = defaultdict(list)
 
-    def load_monitoring(self, pupdb):
-        for node, resource in self.query_classes(pupdb, "Profile::Server::Monitor"):
-            node["other"]["monitoring"] = True
+        conditions = [e.condition() for e in enrichments]
+        if len(conditions) == 1:
+            condition = conditions[0]
+        else:
+            condition = " or ".join("(%s)" % c for c in conditions)
+        query = self.filter('resources[certname, type, title, parameters] {}', condition)
+        resources = pupdb.query(query)
+        profiling.count("inventory.resources", len(resources))
 
-        for node, resource in self.query_classes(pupdb, "Profile::Monitoring::Icinga2::Common"):
-            node["other"]["icinga_notification_period"] = resource["parameters"]["notification_period"]
-            node["other"]["icinga_environment"] = resource["parameters"]["icinga2_environment"]
-            node["other"]["icinga_owner"] = resource["parameters"]["owner"]
+        # Other loaders may be running at the same time.
+        with self._merge_lock:
+            for resource in resources:
+                try:
+                    node = self.nodes[resource["certname"]]
+                except KeyError:
+                    continue
 
-    def load_roles(self, pupdb):
-        self.roles = defaultdict(list)
+                absent = resource["parameters"].get("ensure", None) == "absent"
+                for enrichment in enrichments:
+                    if enrichment.matches(resource) and (enrichment.include_absent or not absent):
+                        enrichment.handler(node, resource)
 
-        condition = 'type = "Class" and title ~ "^Role::"'
-        for node, resource in self.query_resources(pupdb, condition):
-            if resource["title"] not in ("role", "role::delivery"):
-                node["other"]["roles"].append(resource["title"])
-                self.roles[resource["title"]].append(node)
+    def add_backup(self, node, resource):
+        paths = resource["parameters"]["files"]
+        if type(paths) is list:
+            node["other"]["backups"].extend(sys.intern(path) for path in paths)
+        else:
+            node["other"]["backups"].append(sys.intern(paths))
 
-    def sorted_nodes(self, section, key):
-        return sorted(
-            self.nodes.values(),
-            key=lambda node: node.get(section, dict()).get(key, ""))
+    def add_logging(self, node, resource):
+        node["other"]["logging"] = True
 
-    def sorted_roles(self):
-        return sorted(self.roles.items())
+    def add_metrics(self, node, resource):
+        node["other"]["metrics"] = True
 
-    def sorted_services(self):
+    def add_monitoring(self, node, resource):
+        node["other"]["monitoring"] = True
+
+    def add_icinga(self, node, resource):
+        node["other"]["icinga_notification_period"] = resource["parameters"]["notification_period"]
+        node["other"]["icinga_environment"] = resource["parameters"]["icinga2_environment"]
+        node["other"]["icinga_owner"] = resource["parameters"]["owner"]
+
+    def add_role(self, node, resource):
+        if resource["title"] not in ("role", "role::delivery"):
+            role = sys.intern(resource["title"])
+            node["other"]["roles"].append(role)
+            self.roles[role].append(node)
+
+    def build_indexes(self):
+        """ Index the loaded nodes by service, team and owner, once all
+        the loaders have run. (Roles are indexed as they're loaded.)
+
+        Each node's services are stored sorted by name in other.services,
+        so the service columns don't have to sort them again for every page.
+        Lists of nodes in the indexes are sorted by fqdn. """
         services = dict()
+        teams = defaultdict(lambda: (dict(), dict()))
+        owners = defaultdict(lambda: (dict(), dict()))
 
-        for node in self.nodes.values():
+        for node in self.sorted_nodes("facts", "fqdn"):
             profile_metadata = node["facts"].get("profile_metadata", dict())
-            service_facts = profile_metadata.get("services", list())
+            service_facts = sorted(
+                profile_metadata.get("services", list()), key=itemgetter("human_name"))
+            node["other"]["services"] = service_facts
 
             for service_fact in service_facts:
                 class_name = service_fact["class_name"]
                 if class_name not in services:
-                    services[class_name] = service_fact
-                    services[class_name]["nodes"] = list()
+                    # Copy, so the node's facts don't end up referring back
+                    # to the nodes.
+                    services[class_name] = dict(service_fact, nodes=list())
+                service = services[class_name]
+                service["nodes"].append(node)
+
+                for index, key in ((teams, "team"), (owners, "owner_uid")):
+                    name = service_fact.get(key, ":undef")
+                    if name != ":undef":
+                        index_services, index_nodes = index[name]
+                        index_services[class_name] = service
+                        index_nodes[node["certname"]] = node
+
+        self.services = services
+        self.teams = self._group_index(teams)
+        self.owners = self._group_index(owners)
+
+    def _group_index(self, index):
+        return dict(
+            (name, {
+                "name": name,
+                "services": sorted(services.values(), key=itemgetter("human_name")),
+                "nodes": list(nodes.values()),
+            })
+            for name, (services, nodes) in index.items())
+
+    def sorted_nodes(self, section, key):
+        return sorted(
+            self.nodes.values(),
+            key=lambda node: node.get(section, dict()).get(key, ""))
+
+    def sorted_roles(self):
+        return sorted(self.roles.items())
+
+    def sorted_services(self):
+        if self.services is None:
+            self.build_indexes()
+        return sorted(self.services.values(), key=itemgetter("human_name"))
 
-                services[class_name]["nodes"].append(node)
+    def sorted_teams(self):
+        if self.teams is None:
+            self.build_indexes()
+        return [self.teams[name] for name in sorted(self.teams)]
 
-        return sorted(services.values(), key=itemgetter("human_name"))
+    def sorted_owners(self):
+        if self.owners is None:
+            self.build_indexes()
+        return [self.owners[name] for name in sorted(self.owners)]
@@ -0,0 +1,240 @@
+import functools
+import hashlib
+import json
+import re
+
+
+DEFAULT_PREFIXES = [
+    "Could not retrieve catalog from remote server: Error 500 on SERVER: Server Error: Evaluation Error: Error while evaluating a Function Call, Untrusted facts (left) don't match values from certname (right)",
+]
+
+# Marks the end of an entry in a trie. Not a string, so it can't collide with
+# a child.
+_END = None
+
+_META = set(".^$*+?{}[]\\|()")
+_QUANTIFIERS = set("*+?{")
+
+
+def has_top_level_alternation(pattern):
+    depth = 0
+    in_class = False
+    chars = iter(pattern)
+    for char in chars:
+        if char == "\\":
+            next(chars, None)
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+
+    return False
+
+
+def has_numbered_backreference(pattern):
+    in_class = False
+    chars = iter(pattern)
+    for char in chars:
+        if char == "\\":
+            escaped = next(chars, "")
+            if not in_class and escaped in "123456789":
+                return True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+
+    return False
+
+
+def check_mask(pattern):
+    """ Raise ValueError unless pattern can be merged with other masks.
+
+    Merging renumbers the groups of every pattern but the first, so a
+    numbered backreference would refer to some other pattern's group. Named
+    groups could clash with the other patterns' names. """
+    try:
+        compiled = re.compile(pattern)
+    except re.error as e:
+        raise ValueError("{!r}: {}".format(pattern, e)) from None
+    if compiled.groupindex:
+        raise ValueError("{!r}: named groups are not supported".format(pattern))
+    if has_numbered_backreference(pattern):
+        raise ValueError("{!r}: backreferences are not supported".format(pattern))
+
+
+def split_literal_prefix(pattern):
+    """ Split a regex into the atoms of its literal prefix and the rest.
+
+    Atoms are literal characters (escaped) and \\b. The prefix stops at the
+    first thing that isn't one, and never includes a quantified atom. """
+    if has_top_level_alternation(pattern):
+        return [], pattern
+
+    atoms = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            if escaped == "b":
+                atom = r"\b"
+            elif not escaped.isalnum():
+                atom = re.escape(escaped)
+            else:
+                break
+            length = 2
+        elif char not in _META:
+            atom = re.escape(char)
+            length = 1
+        else:
+            break
+
+        if pattern[i + length:i + length + 1] in _QUANTIFIERS:
+            break
+        atoms.append(atom)
+        i += length
+
+    return atoms, pattern[i:]
+
+
+def compile_masks(patterns):
+    """ Compile patterns into one regex, with group mask<N> matching the
+    (empty) end of pattern N.
+
+    Python's regex engine tries every branch of an alternation at every
+    position, so hundreds of branches would be slower than running the
+    patterns one by one. Instead the literal prefixes of the patterns are
+    merged into a trie, so that at any position only the patterns that can
+    actually start there are tried.
+
+    Patterns may not use named groups or numbered backreferences (see
+    check_mask()). """
+    trie = dict()
+    for i, pattern in enumerate(patterns):
+        check_mask(pattern)
+        atoms, rest = split_literal_prefix(pattern)
+        node = trie
+        for atom in atoms:
+            node = node.setdefault(atom, dict())
+        node.setdefault(_END, []).append((i, rest))
+
+    return re.compile(_trie_regex(trie))
+
+
+def _trie_regex(node):
+    branches = []
+    for i, rest in node.get(_END, []):
+        branches.append("(?:%s)(?P<mask%d>)" % (rest, i))
+    for atom, child in node.items():
+        if atom is not _END:
+            branches.append(atom + _trie_regex(child))
+
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:%s)" % "|".join(branches)
+
+
+class ErrorNormalizer(object):
+    """ Collapse log messages into groups of "the same" error.
+
+    There are two kinds of rules:
+
+      * prefixes: a message starting with a prefix is replaced by the prefix
+        (the longest one if several match). These are stored in a trie, so
+        matching costs at most the length of the longest prefix no matter how
+        many there are.
+
+      * masks: (pattern, replacement) pairs. Every match of pattern in the
+        message is replaced with the literal replacement, e.g. to mask out
+        hostnames or UUIDs. All patterns are compiled into one alternation so
+        each message is scanned once. Patterns should not overlap; if they
+        do, which one wins is unspecified.
+
+    Prefixes are checked first; a message matching a prefix is not masked.
+    Results are memoized, since the same messages tend to show up on many
+    nodes. """
+
+    def __init__(self, prefixes=DEFAULT_PREFIXES, masks=(), cache_size=65536):
+        self._trie = dict()
+        self._prefixes = []
+        for prefix in prefixes:
+            self.add_prefix(prefix)
+
+        self._masks = None
+        self._replacements = dict()
+        masks = list(masks)
+        self._mask_rules = masks
+        if masks:
+            self._masks = compile_masks([pattern for pattern, _ in masks])
+            for i, (_, replacement) in enumerate(masks):
+                index = self._masks.groupindex["mask%d" % i]
+                self._replacements[index] = replacement
+
+        self.normalize = functools.lru_cache(maxsize=cache_size)(self._normalize)
+
+    @classmethod
+    def from_file(cls, path):
+        """ Load rules from a JSON file shaped like:
+
+            {
+              "prefixes": ["Could not find dependent", ...],
+              "masks": [{"pattern": "[0-9a-f]{8}-...", "replacement": "<uuid>"}, ...]
+            }
+
+        Prefixes are added to DEFAULT_PREFIXES. Patterns are combined into one
+        regex, so flags must be scoped, e.g. (?i:...) rather than (?i), and
+        patterns can't use named groups or backreferences like \\1. """
+        try:
+            with open(path, "r", encoding="utf-8") as rules_file:
+                rules = json.load(rules_file)
+            return cls(
+                prefixes=DEFAULT_PREFIXES + list(rules.get("prefixes", [])),
+                masks=[(m["pattern"], m["replacement"]) for m in rules.get("masks", [])])
+        except (KeyError, TypeError, AttributeError, ValueError, re.error) as e:
+            raise ValueError("Invalid error rules in {}: {}".format(path, e)) from None
+
+    @property
+    def version(self):
+        """ Fingerprint of the rules: messages normalized under a different
+        version may have been grouped differently. """
+        rules = json.dumps([self._prefixes, self._mask_rules])
+        return hashlib.sha1(rules.encode("utf-8")).hexdigest()
+
+    def add_prefix(self, prefix):
+        self._prefixes.append(prefix)
+        node = self._trie
+        for char in prefix:
+            node = node.setdefault(char, dict())
+        node[_END] = prefix
+
+    def match_prefix(self, message):
+        """ Return the longest prefix message starts with, or None. """
+        node = self._trie
+        match = node.get(_END)
+        for char in message:
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(_END, match)
+
+        return match
+
+    def _normalize(self, message):
+        prefix = self.match_prefix(message)
+        if prefix is not None:
+            return prefix
+
+        if self._masks is None:
+            return message
+
+        return self._masks.sub(self._replace, message)
+
+    def _replace(self, match):
+        return self._replacements[match.lastindex]
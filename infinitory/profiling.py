@@ -0,0 +1,175 @@
+""" Timers and counters for a run, reported at the end as a summary table
+and optionally as a JSON file.
+
+Like logging, there is one module level profile that code anywhere can
+record into:
+
+    with profiling.phase("inventory.load_nodes"):
+        ...
+    profiling.count("inventory.nodes", len(nodes))
+"""
+
+from contextlib import contextmanager
+import cProfile
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+
+DEFAULT_OUTPUT = "infinitory-profile.json"
+
+# Number of allocation sites to report from tracemalloc.
+TOP_ALLOCATIONS = 20
+
+
+class RunProfile(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.phases = dict()
+            self.counters = dict()
+            self.extra = dict()
+            self._profiler = None
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            phase = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+            phase["seconds"] += seconds
+            phase["calls"] += 1
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def start_tracing(self):
+        """ Start cProfile and tracemalloc. Both slow the run down a lot. """
+        tracemalloc.start()
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def stop_tracing(self, pstats_path):
+        """ Stop tracing, dump the cProfile stats to pstats_path and add the
+        biggest allocation sites to the profile. """
+        self._profiler.disable()
+        self._profiler.dump_stats(pstats_path)
+        self._profiler = None
+
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.extra["pstats"] = pstats_path
+        self.extra["tracemalloc"] = {
+            "peak_bytes": peak,
+            "top": [
+                {
+                    "location": "{}:{}".format(stat.traceback[0].filename, stat.traceback[0].lineno),
+                    "bytes": stat.size,
+                    "blocks": stat.count,
+                }
+                for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+            ],
+        }
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "seconds": time.time() - self.started,
+                "peak_rss_bytes": peak_rss(),
+                "phases": dict(self.phases),
+                "counters": dict(self.counters),
+                **self.extra,
+            }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as out:
+            json.dump(self.as_dict(), out, indent=2, sort_keys=True)
+
+    def summary(self):
+        data = self.as_dict()
+        lines = ["%-40s %10s %8s" % ("phase", "seconds", "calls")]
+        for name, phase in sorted(data["phases"].items()):
+            lines.append("%-40s %10.2f %8d" % (name, phase["seconds"], phase["calls"]))
+        lines.append("")
+        lines.append("%-40s %19s" % ("counter", "value"))
+        for name, value in sorted(data["counters"].items()):
+            lines.append("%-40s %19d" % (name, value))
+        lines.append("")
+        lines.append("%-40s %19.2f" % ("total seconds", data["seconds"]))
+        lines.append("%-40s %19d" % ("peak RSS (MiB)", data["peak_rss_bytes"] // (1024 * 1024)))
+        return "\n".join(lines)
+
+
+class Laps(object):
+    """ Time consecutive stages of straight-line code: each lap(name)
+    records the time since the previous lap as phase "<prefix>.<name>". """
+
+    def __init__(self, profile, prefix):
+        self.profile = profile
+        self.prefix = prefix
+        self._last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.profile.add_time("{}.{}".format(self.prefix, name), now - self._last)
+        self._last = now
+
+
+def pstats_path(profile_output):
+    """ Where to put the cProfile stats for a JSON profile at profile_output. """
+    return os.path.splitext(profile_output)[0] + ".pstats"
+
+
+def peak_rss():
+    """ Peak resident set size of this process, in bytes. """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+_profile = RunProfile()
+
+
+def current():
+    return _profile
+
+
+def phase(name):
+    return _profile.phase(name)
+
+
+def count(name, n=1):
+    _profile.count(name, n)
+
+
+def laps(prefix):
+    return Laps(_profile, prefix)
+
+
+def timed(name):
+    """ Decorator recording every call of a function as phase name. """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _profile.phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
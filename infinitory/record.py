@@ -0,0 +1,135 @@
+""" Compact in-memory representation of a node.
+
+A fleet's worth of raw PuppetDB rows holds the same strings (OS names,
+domains, teams, roles, fact names) over and over. NodeRecord interns them,
+and keeps what infinitory works out about a node itself in the fixed fields
+of an OtherSection instead of a dict per node.
+
+Both still support the record[section].get(key) access the cellformatter
+classes and templates use, so they can be used interchangeably with plain
+dicts. """
+
+import sys
+
+
+# Longer strings (keys, certificates, notes) are unlikely to be repeated
+# across nodes, so interning them would only grow the interned table.
+INTERN_MAX_LENGTH = 64
+
+
+def intern_values(value):
+    """ Copy value (decoded JSON) with short strings interned. """
+    if isinstance(value, str):
+        return sys.intern(value) if len(value) <= INTERN_MAX_LENGTH else value
+    if isinstance(value, dict):
+        return dict((intern_values(k), intern_values(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [intern_values(v) for v in value]
+    return value
+
+
+class OtherSection(object):
+    """ The "other" section of a node: what infinitory finds out from its
+    resources. List fields are created empty the first time they're looked
+    up, like in the defaultdict(list) this replaces. Unset fields, and the
+    services copied from the facts by Inventory.build_indexes(), are left
+    out of to_dict(). """
+    __slots__ = ("roles", "backups", "logging", "metrics", "monitoring",
+                 "icinga_notification_period", "icinga_environment", "icinga_owner",
+                 "services")
+
+    LIST_FIELDS = ("roles", "backups", "services")
+
+    DERIVED_FIELDS = ("services",)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            if key in self.LIST_FIELDS:
+                value = []
+                setattr(self, key, value)
+                return value
+            return None
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError("{} is not a field of the other section".format(key))
+        if isinstance(value, str):
+            value = sys.intern(value)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return dict(
+            (key, getattr(self, key)) for key in self.__slots__
+            if key not in self.DERIVED_FIELDS and hasattr(self, key))
+
+
+class NodeRecord(object):
+    """ A node from the PuppetDB inventory. """
+    __slots__ = ("certname", "environment", "timestamp", "facts", "trusted", "other")
+
+    def __init__(self, certname, facts=None, trusted=None, environment=None, timestamp=None):
+        self.certname = sys.intern(certname)
+        self.environment = intern_values(environment)
+        self.timestamp = timestamp
+        self.facts = intern_values(facts or dict())
+        self.trusted = intern_values(trusted or dict())
+        self.other = OtherSection()
+
+    @classmethod
+    def from_inventory(cls, row):
+        """ Make a record from a (full, or unflattened) inventory row. """
+        return cls(
+            row["certname"],
+            facts=row.get("facts"),
+            trusted=row.get("trusted"),
+            environment=row.get("environment"),
+            timestamp=row.get("timestamp"))
+
+    def __getitem__(self, section):
+        if section not in self.__slots__:
+            raise KeyError(section)
+        return getattr(self, section)
+
+    def __contains__(self, section):
+        return section in self.__slots__ and getattr(self, section) is not None
+
+    def get(self, section, default=None):
+        if section not in self:
+            return default
+        return getattr(self, section)
+
+    def to_dict(self):
+        """ The node as a JSON-serializable dict, shaped like the PuppetDB
+        inventory row it came from. """
+        node = dict(certname=self.certname)
+        for section in ("timestamp", "environment"):
+            if getattr(self, section) is not None:
+                node[section] = getattr(self, section)
+        node["facts"] = self.facts
+        node["trusted"] = self.trusted
+        node["other"] = self.other.to_dict()
+        return node
+
+    def __repr__(self):
+        return "NodeRecord({!r})".format(self.certname)
+
+
+def json_default(value):
+    """ default= for json.dump(s), for nodes that are NodeRecords. """
+    try:
+        return value.to_dict()
+    except AttributeError:
+        raise TypeError("Object of type {} is not JSON serializable".format(
+            type(value).__name__)) from None
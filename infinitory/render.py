@@ -0,0 +1,72 @@
+import jinja2
+from markupsafe import Markup
+import os
+import re
+
+
+_paragraph_re = re.compile(r'(?:\r\n|\r|\n){2,}')
+
+
+def unundef(value):
+    return "" if value == ":undef" else value
+
+
+def nl2br(value):
+    return Markup(
+        u'\n\n'.join(u'<p>%s</p>'
+            % Markup.escape(p) for p in _paragraph_re.split(value)))
+
+
+class Renderer(object):
+    """ Render templates with one long-lived Jinja2 environment.
+
+    Templates are compiled the first time they're used and kept for the life
+    of the renderer. If bytecode_cache_path is set the compiled templates are
+    also cached on disk, which makes the first render of each template in a
+    new process cheaper. """
+
+    def __init__(self, bytecode_cache_path=None):
+        data_path = os.path.dirname(os.path.abspath(__file__))
+
+        bytecode_cache = None
+        if bytecode_cache_path:
+            os.makedirs(bytecode_cache_path, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_path)
+
+        self.environment = jinja2.Environment(
+            loader=jinja2.FileSystemLoader("{}/templates".format(data_path)),
+            autoescape=jinja2.select_autoescape(default=True),
+            auto_reload=False,
+            bytecode_cache=bytecode_cache)
+
+        # Made the first time a template uses the markdown filter.
+        self._markdown = None
+
+        self.environment.filters['markdown'] = self.markdown
+        self.environment.filters['unundef'] = unundef
+        self.environment.filters['nl2br'] = nl2br
+
+        self._templates = dict()
+
+    def markdown(self, value):
+        if self._markdown is None:
+            import markdown2
+            self._markdown = markdown2.Markdown(extras=[
+                'fenced-code-blocks',
+                'cuddled-lists',
+                'tables'])
+
+        return Markup(self._markdown.convert(value))
+
+    def get_template(self, template_name):
+        try:
+            return self._templates[template_name]
+        except KeyError:
+            body_id = re.sub(r"\W+", "_", re.sub(r"\..*", "", template_name))
+            template = self.environment.get_template(template_name)
+            self._templates[template_name] = (template, body_id)
+            return template, body_id
+
+    def render(self, template_name, **kwargs):
+        template, body_id = self.get_template(template_name)
+        return template.render(body_id=body_id, **kwargs)
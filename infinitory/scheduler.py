@@ -0,0 +1,122 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import logging
+import queue
+import threading
+import time
+
+
+class Loader(object):
+    """ A step that loads data over a PuppetDB connection, once the loaders
+    named in requires have finished. """
+
+    def __init__(self, name, function, requires=()):
+        self.name = name
+        self.function = function
+        self.requires = set(requires)
+
+
+class ConnectionPool(object):
+    """ Hands out up to size PuppetDB connections, opening them on demand
+    with factory() and closing them all when the pool is closed. """
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = size
+        self._idle = queue.Queue()
+        self._opened = []
+        self._lock = threading.Lock()
+        self._available = threading.Semaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self._available.acquire()
+        try:
+            try:
+                pupdb = self._idle.get_nowait()
+            except queue.Empty:
+                pupdb = self.factory()
+                pupdb.connect()
+                with self._lock:
+                    self._opened.append(pupdb)
+
+            try:
+                yield pupdb
+            finally:
+                self._idle.put(pupdb)
+        finally:
+            self._available.release()
+
+    def close(self):
+        """ Close every connection. The pool can still be used afterwards,
+        opening new ones. """
+        with self._lock:
+            opened, self._opened = self._opened, []
+            while True:
+                try:
+                    self._idle.get_nowait()
+                except queue.Empty:
+                    break
+        for pupdb in opened:
+            pupdb.disconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def check_loaders(loaders):
+    names = set()
+    for loader in loaders:
+        if loader.name in names:
+            raise ValueError("Duplicate loader: {}".format(loader.name))
+        names.add(loader.name)
+
+    done = set()
+    remaining = list(loaders)
+    while remaining:
+        ready = [l for l in remaining if l.requires <= done]
+        if not ready:
+            raise ValueError("Unsatisfiable loader dependencies: {}".format(
+                ", ".join(sorted(l.name for l in remaining))))
+        done.update(l.name for l in ready)
+        remaining = [l for l in remaining if l.name not in done]
+
+
+def run_loaders(loaders, pool):
+    """ Run loaders as soon as their requirements are met, as many at a time
+    as the pool has connections. Returns {name: seconds}.
+
+    Loaders that run at the same time must not write the same data. If one
+    fails, no new loaders are started and its exception is raised once the
+    running ones are done. """
+    check_loaders(loaders)
+    logger = logging.getLogger(__name__)
+    timings = dict()
+
+    def run(loader):
+        with pool.connection() as pupdb:
+            start = time.perf_counter()
+            loader.function(pupdb)
+            return time.perf_counter() - start
+
+    pending = list(loaders)
+    running = dict()
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        while pending or running:
+            for loader in [l for l in pending if l.requires <= set(timings)]:
+                pending.remove(loader)
+                running[executor.submit(run, loader)] = loader
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                loader = running.pop(future)
+                if future.exception() is not None:
+                    wait(running)
+                    raise future.exception()
+                timings[loader.name] = future.result()
+                logger.info("Loaded %s in %.2fs", loader.name, timings[loader.name])
+
+    return timings
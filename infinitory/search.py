@@ -0,0 +1,121 @@
+""" Static search index for the site, queried in the browser by
+static/search.js.
+
+Every node, role, service, team, owner and unique error is a document with
+a label, a URL and the text it can be found by. The index maps each
+trigram of that text to the (delta encoded) ids of the documents that
+contain it, sharded by a hash of the trigram so that a query only has to
+load the shards of its own trigrams. The documents themselves are stored in
+shards of consecutive ids. A query matches the documents containing all of
+its trigrams, which search.js then checks actually contain the query.
+
+    search/index.json       counts and shard sizes
+    search/grams-<n>.json   {trigram: [first id, delta, delta, ...]}
+    search/docs-<n>.json    [[kind, label, url, text], ...]
+"""
+
+import json
+import os
+
+
+GRAM_LENGTH = 3
+
+DEFAULT_GRAM_SHARDS = 64
+
+DEFAULT_DOCUMENT_SHARD_SIZE = 1000
+
+
+def grams(text):
+    """ The trigrams of (lower case) text. """
+    return set(text[i:i + GRAM_LENGTH] for i in range(len(text) - GRAM_LENGTH + 1))
+
+
+def gram_shard(gram, shards):
+    """ Which shard gram is in. This must match gramShard() in search.js. """
+    value = 0
+    for char in gram:
+        value = (value * 31 + ord(char)) % 1000003
+    return value % shards
+
+
+def delta_encode(ids):
+    return [ids[0]] + [b - a for a, b in zip(ids, ids[1:])]
+
+
+class SearchIndex(object):
+    def __init__(self):
+        self.documents = []
+
+    def add(self, kind, label, url, *terms):
+        """ Add a document found by its label and terms. Documents are listed
+        in the order they were added when a query matches several. """
+        terms = [label] + [t for t in terms if t]
+        text = " ".join(dict.fromkeys(t.lower() for t in terms))
+        self.documents.append([kind, label, url, text])
+
+    def write(self, directory, gram_shards=DEFAULT_GRAM_SHARDS,
+              document_shard_size=DEFAULT_DOCUMENT_SHARD_SIZE):
+        """ Write the index to directory. Returns the paths written. """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+
+        def dump(name, data):
+            path = os.path.join(directory, name)
+            with open(path, "w", encoding="utf-8") as out:
+                json.dump(data, out, ensure_ascii=False, separators=(",", ":"))
+            paths.append(path)
+
+        postings = [dict() for _ in range(gram_shards)]
+        for document_id, document in enumerate(self.documents):
+            for gram in grams(document[3]):
+                postings[gram_shard(gram, gram_shards)].setdefault(gram, []).append(document_id)
+
+        for shard, shard_postings in enumerate(postings):
+            dump("grams-{}.json".format(shard), dict(
+                (gram, delta_encode(ids)) for gram, ids in sorted(shard_postings.items())))
+
+        document_shards = 0
+        for start in range(0, len(self.documents), document_shard_size):
+            dump("docs-{}.json".format(document_shards),
+                self.documents[start:start + document_shard_size])
+            document_shards += 1
+
+        dump("index.json", {
+            "gram_length": GRAM_LENGTH,
+            "gram_shards": gram_shards,
+            "documents": len(self.documents),
+            "document_shard_size": document_shard_size,
+            "document_shards": document_shards,
+        })
+
+        return paths
+
+
+def build_index(inventory, unique_errors):
+    """ Index the inventory's roles, services, teams, owners, nodes and
+    unique errors, in that order. """
+    index = SearchIndex()
+
+    for role, _ in inventory.sorted_roles():
+        index.add("role", role, "roles/index.html#{}".format(role))
+
+    for service in inventory.sorted_services():
+        index.add("service", service["human_name"],
+            "services/{}.html".format(service["class_name"]),
+            service["class_name"])
+
+    for team in inventory.sorted_teams():
+        index.add("team", team["name"], "teams/index.html#{}".format(team["name"]))
+
+    for owner in inventory.sorted_owners():
+        index.add("owner", owner["name"], "owners/index.html#{}".format(owner["name"]))
+
+    for node in inventory.sorted_nodes("facts", "fqdn"):
+        index.add("node", node["facts"].get("fqdn") or node["certname"],
+            "nodes/{}.html".format(node["certname"]),
+            node["certname"])
+
+    for error in unique_errors:
+        index.add("error", error["other"]["message"], "errors/index.html")
+
+    return index
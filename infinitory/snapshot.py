@@ -0,0 +1,138 @@
+import gzip
+import io
+import json
+import logging
+import os
+
+
+class Snapshot(object):
+    """ What a run rendered, compactly: each node's column values (in their
+    CSV form), the nodes of each role and service, and the unique errors.
+
+    It is saved in the output directory, so the next run can report what
+    changed since. """
+
+    FILENAME = ".infinitory-snapshot.json.gz"
+    VERSION = 2
+
+    def __init__(self, generation_time=None, nodes=None, roles=None, services=None, errors=None):
+        self.generation_time = generation_time
+        self.nodes = nodes or dict()
+        self.roles = roles or dict()
+        self.services = services or dict()
+        self.errors = errors or dict()
+
+    @classmethod
+    def from_inventory(cls, inventory, columns, unique_errors, generation_time=None):
+        nodes = dict()
+        for node in inventory.nodes.values():
+            nodes[node["certname"]] = dict(
+                ("{}.{}".format(cell.section, cell.key), cell.body_csv(node))
+                for cell in columns)
+
+        return cls(
+            generation_time=generation_time,
+            nodes=nodes,
+            roles=dict(
+                (role, sorted(node["certname"] for node in role_nodes))
+                for role, role_nodes in inventory.sorted_roles()),
+            services=dict(
+                (service["class_name"], sorted(node["certname"] for node in service["nodes"]))
+                for service in inventory.sorted_services()),
+            errors=dict(
+                (error["other"]["message"], {
+                    "level": error["other"]["level"],
+                    "count": error["other"]["count"],
+                })
+                for error in unique_errors))
+
+    @classmethod
+    def load(cls, directory):
+        """ Load the snapshot saved in directory, or return None. """
+        path = os.path.join(directory, cls.FILENAME)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as snapshot_file:
+                data = json.load(snapshot_file)
+            if data.get("version") == cls.VERSION:
+                return cls(data["generation_time"], data["nodes"], data["roles"],
+                    data["services"], data["errors"])
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, ValueError, KeyError, AttributeError) as e:
+            logging.getLogger(__name__).warning("Ignoring snapshot %s: %s", path, e)
+
+        return None
+
+    def save(self, directory):
+        path = os.path.join(directory, self.FILENAME)
+        # No timestamp in the gzip header, so the same snapshot is always
+        # written the same.
+        with gzip.GzipFile(path, "wb", mtime=0) as raw, \
+                io.TextIOWrapper(raw, encoding="utf-8") as snapshot_file:
+            json.dump({
+                "version": self.VERSION,
+                "generation_time": self.generation_time,
+                "nodes": self.nodes,
+                "roles": self.roles,
+                "services": self.services,
+                "errors": self.errors,
+            }, snapshot_file, separators=(",", ":"))
+
+    def diff(self, previous):
+        """ The changes since previous, as a JSON-serializable changelog.
+
+        Everything is matched up by key (certname, role, class name, error
+        message), so this takes time linear in the size of the snapshots. """
+        changed = dict()
+        for certname, fields in self.nodes.items():
+            old_fields = previous.nodes.get(certname)
+            if old_fields is None or old_fields == fields:
+                continue
+            changed[certname] = dict(
+                (field, [old_fields.get(field), value])
+                for field, value in fields.items()
+                if old_fields.get(field) != value)
+
+        return {
+            "from": previous.generation_time,
+            "to": self.generation_time,
+            "nodes": {
+                "added": added(previous.nodes, self.nodes),
+                "removed": added(self.nodes, previous.nodes),
+                "changed": dict(sorted(changed.items())),
+            },
+            "roles": membership_changes(previous.roles, self.roles),
+            "services": membership_changes(previous.services, self.services),
+            "errors": {
+                "new": added(previous.errors, self.errors),
+                "resolved": added(self.errors, previous.errors),
+            },
+        }
+
+
+def added(old, new):
+    """ Sorted keys of new that aren't in old. """
+    return sorted(key for key in new if key not in old)
+
+
+def membership_changes(old, new):
+    """ {group: {"added": [...], "removed": [...]}} for every group whose
+    members changed, given {group: [members]} before and after. """
+    changes = dict()
+    for group in sorted(set(old) | set(new)):
+        old_members = set(old.get(group, ()))
+        new_members = set(new.get(group, ()))
+        if old_members != new_members:
+            changes[group] = {
+                "added": sorted(new_members - old_members),
+                "removed": sorted(old_members - new_members),
+            }
+    return changes
+
+
+def has_changes(changelog):
+    return bool(
+        any(changelog["nodes"].values())
+        or changelog["roles"]
+        or changelog["services"]
+        or any(changelog["errors"].values()))
@@ -2,7 +2,7 @@
 (function(){
   try {
     var generated_at = document.getElementById("generated-at");
-    var m = moment(generated_at.innerText);
+    var m = moment(GENERATED_AT); // From generated-at.js
     var update_generated_at = function () {
       generated_at.innerText = "Generated on " + m.format("MMMM Do, YYYY")
         + " at " + m.format("h:mm a") + " (" + m.fromNow() + ")";
@@ -14,3 +14,149 @@
     console.error(e);
   }
 })();
+
+// Node table loaded lazily from the sharded index written with
+// --lazy-node-table. Only the rows in view are in the DOM; sorting and
+// filtering work on whatever shards have loaded so far.
+(function(){
+  var table = document.getElementById("node-table");
+  if ( ! table || ! table.getAttribute("data-index") ) {
+    return;
+  }
+
+  var ROW_HEIGHT = 30; // Fixed by .virtual-table in general.css
+  var OVERSCAN = 20; // Rows rendered above and below the viewport
+
+  var viewport = document.getElementById("node-table-viewport");
+  var filter = document.getElementById("node-filter");
+  var status = document.getElementById("node-table-status");
+  var tbody = table.tBodies[0];
+  var headers = table.tHead.rows[0].cells;
+  var index_url = table.getAttribute("data-index");
+  var base_url = index_url.replace(/[^\/]*$/, "");
+
+  var total = 0;
+  var html = []; // html[column][node]
+  var text = []; // text[column][node], lower case
+  var rows = []; // Nodes shown, in order
+  var sort_column = null;
+  var sort_descending = false;
+
+  var load = function (url, callback) {
+    var request = new XMLHttpRequest();
+    request.open("GET", url);
+    request.onload = function () {
+      if ( request.status == 200 || request.status == 0 ) {
+        callback(JSON.parse(request.responseText));
+      } else {
+        console.error("Could not load " + url + ": " + request.status);
+      }
+    };
+    request.send();
+  };
+
+  var render = function () {
+    var first = Math.max(0, Math.floor(viewport.scrollTop / ROW_HEIGHT) - OVERSCAN);
+    var last = Math.min(rows.length,
+      Math.ceil((viewport.scrollTop + viewport.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+
+    var parts = ['<tr class="spacer" style="height: ' + (first * ROW_HEIGHT) + 'px"></tr>'];
+    for ( var i = first; i < last; i++ ) {
+      parts.push("<tr>");
+      for ( var column = 0; column < html.length; column++ ) {
+        parts.push(html[column][rows[i]]);
+      }
+      parts.push("</tr>");
+    }
+    parts.push('<tr class="spacer" style="height: ' + ((rows.length - last) * ROW_HEIGHT) + 'px"></tr>');
+    tbody.innerHTML = parts.join("");
+  };
+
+  var update = function () {
+    var query = filter.value.toLowerCase();
+    var loaded = html.length ? html[0].length : 0;
+
+    rows = [];
+    for ( var node = 0; node < loaded; node++ ) {
+      if ( query ) {
+        var found = false;
+        for ( var column = 0; column < text.length && ! found; column++ ) {
+          found = text[column][node].indexOf(query) != -1;
+        }
+        if ( ! found ) {
+          continue;
+        }
+      }
+      rows.push(node);
+    }
+
+    if ( sort_column !== null ) {
+      var values = text[sort_column];
+      rows.sort(function (a, b) {
+        var order = values[a] < values[b] ? -1 : (values[a] > values[b] ? 1 : a - b);
+        return sort_descending ? -order : order;
+      });
+    }
+
+    status.textContent = rows.length + " of " + total + " nodes"
+      + (loaded < total ? " (loading…)" : "");
+    render();
+  };
+
+  var add_shard = function (shard) {
+    for ( var column = 0; column < shard.html.length; column++ ) {
+      Array.prototype.push.apply(html[column], shard.html[column]);
+      Array.prototype.push.apply(text[column], shard.text[column].map(function (value) {
+        return value.toLowerCase();
+      }));
+    }
+    update();
+  };
+
+  var scheduled = false;
+  viewport.addEventListener("scroll", function () {
+    if ( ! scheduled ) {
+      scheduled = true;
+      window.requestAnimationFrame(function () {
+        scheduled = false;
+        render();
+      });
+    }
+  });
+
+  filter.addEventListener("input", function () {
+    viewport.scrollTop = 0;
+    update();
+  });
+
+  Array.prototype.forEach.call(headers, function (header, column) {
+    header.addEventListener("click", function () {
+      sort_descending = sort_column === column && ! sort_descending;
+      sort_column = column;
+      Array.prototype.forEach.call(headers, function (other) {
+        other.classList.remove("sorted", "descending");
+      });
+      header.classList.add("sorted");
+      header.classList.toggle("descending", sort_descending);
+      update();
+    });
+  });
+
+  load(index_url, function (index) {
+    total = index.total;
+    html = index.columns.map(function () { return []; });
+    text = index.columns.map(function () { return []; });
+
+    // One shard at a time, so the first rows show up as soon as possible.
+    var next = function (i) {
+      if ( i < index.shards.length ) {
+        load(base_url + index.shards[i], function (shard) {
+          add_shard(shard);
+          next(i + 1);
+        });
+      }
+    };
+    update();
+    next(0);
+  });
+})();
@@ -0,0 +1,173 @@
+// Search box in the navigation, backed by the static index in search/ (see
+// infinitory/search.py). Shards of the index are loaded as queries need
+// them and kept for the next query.
+(function(){
+  var input = document.getElementById("search-input");
+  if ( ! input ) {
+    return;
+  }
+
+  var MAX_RESULTS = 30;
+  var MAX_LABEL = 80;
+
+  var results = document.getElementById("search-results");
+  var root = input.getAttribute("data-root");
+  var loaded = {};
+  var postings = {};
+  var sequence = 0;
+
+  var load = function (name) {
+    if ( ! loaded[name] ) {
+      loaded[name] = new Promise(function (resolve, reject) {
+        var request = new XMLHttpRequest();
+        request.open("GET", root + "search/" + name);
+        request.onload = function () {
+          if ( request.status == 200 || request.status == 0 ) {
+            resolve(JSON.parse(request.responseText));
+          } else {
+            delete loaded[name];
+            reject(new Error("Could not load " + name + ": " + request.status));
+          }
+        };
+        request.onerror = function () {
+          delete loaded[name];
+          reject(new Error("Could not load " + name));
+        };
+        request.send();
+      });
+    }
+    return loaded[name];
+  };
+
+  // Must match gram_shard() in search.py.
+  var gramShard = function (gram, shards) {
+    var value = 0;
+    Array.from(gram).forEach(function (char) {
+      value = (value * 31 + char.codePointAt(0)) % 1000003;
+    });
+    return value % shards;
+  };
+
+  var grams = function (text, length) {
+    var chars = Array.from(text);
+    var found = {};
+    for ( var i = 0; i + length <= chars.length; i++ ) {
+      found[chars.slice(i, i + length).join("")] = true;
+    }
+    return Object.keys(found);
+  };
+
+  var decode = function (deltas) {
+    var ids = new Array(deltas.length);
+    var id = 0;
+    for ( var i = 0; i < deltas.length; i++ ) {
+      id += deltas[i];
+      ids[i] = id;
+    }
+    return ids;
+  };
+
+  var intersect = function (a, b) {
+    var result = [];
+    var i = 0, j = 0;
+    while ( i < a.length && j < b.length ) {
+      if ( a[i] < b[j] ) {
+        i++;
+      } else if ( a[i] > b[j] ) {
+        j++;
+      } else {
+        result.push(a[i]);
+        i++;
+        j++;
+      }
+    }
+    return result;
+  };
+
+  var lookup = function (index, gram) {
+    if ( postings[gram] ) {
+      return Promise.resolve(postings[gram]);
+    }
+    return load("grams-" + gramShard(gram, index.gram_shards) + ".json").then(function (shard) {
+      postings[gram] = shard[gram] ? decode(shard[gram]) : [];
+      return postings[gram];
+    });
+  };
+
+  // Check candidates (in id order) actually contain query, loading document
+  // shards as needed, until there are enough matches.
+  var verify = function (index, query, candidates, matches, start) {
+    if ( start >= candidates.length || matches.length >= MAX_RESULTS ) {
+      return Promise.resolve(matches);
+    }
+    var shard = Math.floor(candidates[start] / index.document_shard_size);
+    return load("docs-" + shard + ".json").then(function (documents) {
+      var i = start;
+      for ( ; i < candidates.length; i++ ) {
+        if ( Math.floor(candidates[i] / index.document_shard_size) != shard ) {
+          break;
+        }
+        var match = documents[candidates[i] % index.document_shard_size];
+        if ( match[3].indexOf(query) != -1 && matches.length < MAX_RESULTS ) {
+          matches.push(match);
+        }
+      }
+      return verify(index, query, candidates, matches, i);
+    });
+  };
+
+  var search = function (query) {
+    return load("index.json").then(function (index) {
+      var query_grams = grams(query, index.gram_length);
+      if ( query_grams.length == 0 ) {
+        return [];
+      }
+      return Promise.all(query_grams.map(function (gram) {
+        return lookup(index, gram);
+      })).then(function (lists) {
+        lists.sort(function (a, b) { return a.length - b.length; });
+        var candidates = lists.reduce(intersect);
+        return verify(index, query, candidates, [], 0);
+      });
+    });
+  };
+
+  var escape = function (text) {
+    var element = document.createElement("span");
+    element.textContent = text;
+    return element.innerHTML;
+  };
+
+  var show = function (matches, query) {
+    if ( ! query ) {
+      results.innerHTML = "";
+      return;
+    }
+    if ( matches.length == 0 ) {
+      results.innerHTML = '<li class="empty">No matches</li>';
+      return;
+    }
+    results.innerHTML = matches.map(function (match) {
+      var label = match[1].length > MAX_LABEL
+        ? match[1].slice(0, MAX_LABEL) + "…" : match[1];
+      return '<li><span class="kind">' + escape(match[0]) + '</span> '
+        + '<a href="' + escape(root + match[2]) + '">' + escape(label) + "</a></li>";
+    }).join("");
+  };
+
+  input.addEventListener("input", function () {
+    var query = input.value.trim().toLowerCase();
+    var current = ++sequence;
+    if ( Array.from(query).length < 3 ) {
+      show([], "");
+      return;
+    }
+    search(query).then(function (matches) {
+      if ( current == sequence ) {
+        show(matches, query);
+      }
+    }, function (error) {
+      console.error(error);
+    });
+  });
+})();
@@ -0,0 +1,99 @@
+""" Keep infinitory running, regenerating the site every so often.
+
+Between refreshes the process keeps its imports, the compiled templates and
+its PuppetDB connections. Each refresh loads the inventory again, but only
+fetches the reports and renders the pages that changed (as --incremental).
+"""
+
+import json
+import logging
+import os
+import time
+
+from infinitory.cache import write_atomically
+
+
+class Status(object):
+    """ Health of a watching infinitory, rewritten after every refresh:
+
+        {
+          "pid": 1234,
+          "started": 1700000000.0,
+          "interval": 300,
+          "refreshes": 12,
+          "failures": 1,
+          "last_refresh": {"started": ..., "duration": 41.2, "error": null},
+          "last_success": 1700003300.0,
+          "next_refresh": 1700003600.0,
+          "counters": {...}
+        }
+
+    last_refresh.error is the error message if the last refresh failed.
+    counters are those of the last refresh's run profile. """
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.data = {
+            "pid": os.getpid(),
+            "started": time.time(),
+            "interval": interval,
+            "refreshes": 0,
+            "failures": 0,
+            "last_refresh": None,
+            "last_success": None,
+            "next_refresh": None,
+            "counters": dict(),
+        }
+
+    def record(self, started, duration, next_refresh, error=None, counters=None):
+        self.data["refreshes"] += 1
+        self.data["last_refresh"] = {
+            "started": started,
+            "duration": duration,
+            "error": error,
+        }
+        if error is None:
+            self.data["last_success"] = started + duration
+            self.data["counters"] = dict(counters or {})
+        else:
+            self.data["failures"] += 1
+        self.data["next_refresh"] = next_refresh
+        self.write()
+
+    def write(self):
+        """ Write the status, atomically so readers never see half of it. """
+        write_atomically(self.path, json.dumps(
+            self.data, indent=2, sort_keys=True).encode("utf-8"))
+
+
+def watch(refresh, interval, status, recoverable=(), on_error=None,
+          refreshes=None, sleep=time.sleep):
+    """ Call refresh() every interval seconds (counted from the start of
+    the previous refresh, so a slow refresh is followed by the next one right
+    away), recording each one in status.
+
+    Exceptions in recoverable are logged and the next refresh goes ahead as
+    usual, after on_error() has been called (to reconnect, say). Anything
+    else stops watching. refreshes limits the number of refreshes. """
+    logger = logging.getLogger(__name__)
+    count = 0
+    while refreshes is None or count < refreshes:
+        started = time.time()
+        error = None
+        counters = None
+        try:
+            counters = refresh()
+            logger.info("Refreshed in %.1fs", time.time() - started)
+        except recoverable as e:
+            error = str(e) or type(e).__name__
+            logger.error("Refresh failed: %s", error)
+            if on_error is not None:
+                on_error()
+
+        duration = time.time() - started
+        next_refresh = started + interval
+        status.record(started, duration, next_refresh, error, counters)
+
+        count += 1
+        if refreshes is None or count < refreshes:
+            sleep(max(0, next_refresh - time.time()))
@@ -23,6 +23,7 @@ setuptools.setup(
         "click",
         "Jinja2",
         "markdown2",
+        "markupsafe",
         "pygments",
         "simplepup",
     ],
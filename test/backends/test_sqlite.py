@@ -0,0 +1,140 @@
+from collections import defaultdict
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from infinitory import cli
+from infinitory.backends import SqliteBackend
+from infinitory.inventory import Inventory
+from infinitory.record import NodeRecord
+
+
+def make_inventory():
+    inventory = Inventory()
+    inventory.nodes = dict()
+    inventory.roles = defaultdict(list)
+
+    for i, (role, backups) in enumerate([
+            ("role::db", ["/var/lib/postgresql"]),
+            ("role::db", []),
+            ("role::web", [])]):
+        certname = "node%d.example.com" % i
+        node = NodeRecord(certname,
+            facts={
+                "fqdn": certname,
+                "os": {"name": "Debian", "release": {"full": "9.8"}},
+                "profile_metadata": {"services": [{
+                    "class_name": "profile::%s" % role.split("::")[1],
+                    "human_name": role.split("::")[1].title(),
+                    "team": "sre",
+                    "owner_uid": "alice" if i else ":undef",
+                }]},
+            },
+            trusted={"certname": certname},
+            environment="production",
+            timestamp="2019-01-01T00:00:00.000Z")
+        node["other"]["roles"].append(role)
+        node["other"]["backups"].extend(backups)
+        node["other"]["monitoring"] = i != 1
+        inventory.nodes[certname] = node
+        inventory.roles[role].append(node)
+
+    inventory.errorParser.append_unique_error("Failed", "err", "node1.example.com")
+    inventory.errorParser.append_unique_error("Failed", "err", "node2.example.com")
+    return inventory
+
+
+class SqliteBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "inventory.sqlite")
+
+    def write(self, inventory=None):
+        SqliteBackend(self.path, cli.NODE_COLUMNS).write(
+            inventory or make_inventory(), "2019-01-01 00:00:00Z")
+        connection = sqlite3.connect(self.path)
+        self.addCleanup(connection.close)
+        return connection
+
+    def test_role_without_backups(self):
+        connection = self.write()
+        rows = connection.execute("""
+            SELECT certname FROM nodes
+            JOIN node_roles ON node_roles.node_id = nodes.id
+            JOIN roles ON roles.id = node_roles.role_id
+            WHERE roles.name = 'role::db'
+            AND nodes.id NOT IN (SELECT node_id FROM node_backups)
+        """).fetchall()
+
+        self.assertEqual([("node1.example.com",)], rows)
+
+    def test_role_without_monitoring(self):
+        connection = self.write()
+        rows = connection.execute("""
+            SELECT certname, environment, timestamp FROM nodes
+            JOIN node_roles ON node_roles.node_id = nodes.id
+            JOIN roles ON roles.id = node_roles.role_id
+            JOIN node_fields ON node_fields.node_id = nodes.id
+            WHERE roles.name = 'role::db'
+            AND field = 'other.monitoring' AND value = 'N'
+        """).fetchall()
+
+        self.assertEqual(
+            [("node1.example.com", "production", "2019-01-01T00:00:00.000Z")], rows)
+
+    def test_services_teams_and_owners(self):
+        connection = self.write()
+        rows = connection.execute("""
+            SELECT services.class_name, teams.name, owners.name, count(*)
+            FROM services
+            JOIN node_services ON node_services.service_id = services.id
+            LEFT JOIN teams ON teams.id = services.team_id
+            LEFT JOIN owners ON owners.id = services.owner_id
+            GROUP BY services.id ORDER BY services.class_name
+        """).fetchall()
+
+        self.assertEqual([
+            ("profile::db", "sre", None, 2),
+            ("profile::web", "sre", "alice", 1),
+        ], rows)
+
+    def test_fields_and_errors(self):
+        connection = self.write()
+
+        self.assertEqual(
+            [("node0.example.com",), ("node1.example.com",), ("node2.example.com",)],
+            connection.execute("""
+                SELECT certname FROM nodes JOIN node_fields ON node_id = id
+                WHERE field = 'facts.os' AND value = 'Debian 9.8' ORDER BY certname
+            """).fetchall())
+        self.assertEqual(
+            [("Failed", "err", 2, "node1.example.com"), ("Failed", "err", 2, "node2.example.com")],
+            connection.execute("""
+                SELECT message, level, count, certname FROM errors
+                JOIN error_nodes ON error_id = id ORDER BY certname
+            """).fetchall())
+        self.assertEqual(
+            [("generation_time", "2019-01-01 00:00:00Z"), ("schema_version", "1")],
+            connection.execute("SELECT * FROM meta ORDER BY key").fetchall())
+
+    def test_queries_use_indexes(self):
+        connection = self.write()
+        plan = " ".join(row[-1] for row in connection.execute("""
+            EXPLAIN QUERY PLAN SELECT node_id FROM node_fields
+            WHERE field = 'facts.os' AND value = 'Debian 9.8'
+        """))
+
+        self.assertIn("node_fields_field_value", plan)
+
+    def test_replaces_previous_database(self):
+        self.write().close()
+        inventory = make_inventory()
+        del inventory.nodes["node2.example.com"]
+        inventory.roles["role::web"] = []
+        connection = self.write(inventory)
+
+        self.assertEqual(2, connection.execute("SELECT count(*) FROM nodes").fetchone()[0])
+        self.assertEqual(["inventory.sqlite"], os.listdir(self.directory))
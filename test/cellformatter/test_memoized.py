@@ -0,0 +1,48 @@
+import unittest
+
+from infinitory import cellformatter
+
+
+class CountingSet(cellformatter.Set):
+    calls = 0
+
+    @cellformatter.memoized
+    def value(self, record):
+        CountingSet.calls += 1
+        return super(CountingSet, self).value(record)
+
+
+class MemoizedTest(unittest.TestCase):
+    def setUp(self):
+        CountingSet.calls = 0
+        cellformatter.clear_cache()
+        self.addCleanup(cellformatter.clear_cache)
+
+    def test_value_computed_once(self):
+        record = {"other": {"backups": ["/var", "/etc", "/var"]}}
+        column = CountingSet("other", "backups")
+
+        self.assertEqual("/etc\n/var", column.body_csv(record))
+        column.body_html(record)
+        CountingSet("other", "backups").body_html(record)
+        self.assertEqual(1, CountingSet.calls)
+
+        cellformatter.clear_cache()
+        column.body_csv(record)
+        self.assertEqual(2, CountingSet.calls)
+
+    def test_columns_kept_apart(self):
+        record = {"other": {"backups": ["/etc"], "roles": ["Role::Web"]}}
+
+        self.assertEqual("/etc", cellformatter.Set("other", "backups").body_csv(record))
+        self.assertEqual("Role::Web", cellformatter.Set("other", "roles").body_csv(record))
+        self.assertEqual("Y", cellformatter.Boolean("other", "backups").body_csv(record))
+        self.assertIn("true", cellformatter.Boolean("other", "backups").body_html(record))
+        self.assertNotIn("true", cellformatter.Base("other", "backups").body_html(record))
+
+    def test_records_kept_apart(self):
+        column = cellformatter.Base("facts", "fqdn")
+
+        # Temporary records are likely to get the same id.
+        values = [column.value({"facts": {"fqdn": "node%d" % i}}) for i in range(10)]
+        self.assertEqual(["node%d" % i for i in range(10)], values)
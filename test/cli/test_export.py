@@ -0,0 +1,92 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from infinitory import cellformatter
+from infinitory import export
+
+
+NODES = [
+    {"certname": "node%03d" % i, "facts": {"fqdn": "node%03d.example.com" % i, "blob": "x" * 1000}}
+    for i in range(500)
+]
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_json_matches_dumps(self):
+        path = export.write_json(NODES, self.path("nodes.json"))
+        with open(path, encoding="utf-8") as out:
+            self.assertEqual(json.dumps(NODES), out.read())
+
+        path = export.write_json([], self.path("empty.json"))
+        with open(path, encoding="utf-8") as out:
+            self.assertEqual("[]", out.read())
+
+    def test_ndjson(self):
+        path = export.write_ndjson(NODES, self.path("nodes.ndjson"))
+        with open(path, encoding="utf-8") as out:
+            self.assertEqual(NODES, [json.loads(line) for line in out])
+
+    def test_gzipped_csv(self):
+        columns = [cellformatter.Base("facts", "fqdn"), cellformatter.Base("certname", "x")]
+        nodes = [{"facts": {"fqdn": "a.example.com"}, "certname": {"x": "a"}}]
+        path = export.write_csv(nodes, columns, self.path("nodes.csv"), compress=True)
+
+        self.assertEqual(self.path("nodes.csv.gz"), path)
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as out:
+            self.assertEqual([["fqdn", "x"], ["a.example.com", "a"]], list(csv.reader(out)))
+
+    def test_json_memory_is_flat(self):
+        nodes = NODES * 10
+
+        tracemalloc.start()
+        try:
+            path = export.write_json(nodes, self.path("nodes.json"), compress=True)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # The document is about 5.5MB; writing it should only need the gzip
+        # buffers and a node or two.
+        with gzip.open(path, "rt", encoding="utf-8") as out:
+            self.assertGreater(len(out.read()), 5000000)
+        self.assertLess(peak, 1000000)
+
+    def test_node_index_shards(self):
+        columns = [cellformatter.Base("facts", "fqdn"), cellformatter.Boolean("other", "logging")]
+        nodes = [
+            {"facts": {"fqdn": "node%d.example.com" % i}, "other": {"logging": i % 2 == 0}}
+            for i in range(5)
+        ]
+        paths = export.write_node_index(nodes, columns, self.path("table"), shard_size=2)
+
+        self.assertEqual(
+            [self.path("table/%s" % name) for name in ("0.json", "1.json", "2.json", "index.json")],
+            paths)
+        with open(self.path("table/index.json"), encoding="utf-8") as out:
+            self.assertEqual({
+                "columns": [{"key": "fqdn", "header": "fqdn"}, {"key": "logging", "header": "logging"}],
+                "total": 5,
+                "shard_size": 2,
+                "shards": ["0.json", "1.json", "2.json"],
+            }, json.load(out))
+        with open(self.path("table/2.json"), encoding="utf-8") as out:
+            self.assertEqual({
+                "html": [
+                    ['<td class="key_fqdn">node4.example.com</td>'],
+                    ['<td class="key_logging true">✔︎</td>'],
+                ],
+                "text": [["node4.example.com"], ["Y"]],
+            }, json.load(out))
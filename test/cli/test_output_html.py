@@ -0,0 +1,157 @@
+from collections import defaultdict
+import filecmp
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from infinitory import cli
+from infinitory import profiling
+from infinitory.inventory import Inventory
+from infinitory.record import NodeRecord
+
+
+def make_inventory(count=20):
+    inventory = Inventory()
+    inventory.nodes = dict()
+    inventory.roles = defaultdict(list)
+
+    for i in range(count):
+        certname = "node%02d.example.com" % i
+        node = NodeRecord(certname,
+            facts={
+                "fqdn": certname,
+                "hostname": "node%02d" % i,
+                "domain": "example.com",
+                "os": {"name": "Debian", "release": {"full": "9.8"}},
+                "profile_metadata": {"services": [{
+                    "class_name": "profile::service%d" % (i % 3),
+                    "human_name": "Service %d" % (i % 3),
+                    "team": "sre",
+                    "owner_uid": ":undef",
+                    "notes": "Some *notes*",
+                }]},
+            },
+            trusted={"certname": certname})
+        role = "role::role%d" % (i % 4)
+        node["other"]["roles"].append(role)
+        node["other"]["backups"].extend(["/etc", "/var/lib", "/etc"])
+        node["other"]["monitoring"] = bool(i % 2)
+        inventory.nodes[certname] = node
+        inventory.roles[role].append(node)
+
+    return inventory
+
+
+def assert_same_tree(test, left, right):
+    comparison = filecmp.dircmp(left, right)
+    test.assertEqual([], comparison.left_only + comparison.right_only)
+    test.assertEqual([], comparison.diff_files)
+    for subdirectory in comparison.common_dirs:
+        assert_same_tree(
+            test,
+            os.path.join(left, subdirectory),
+            os.path.join(right, subdirectory))
+
+
+class OutputHtmlTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.inventory = make_inventory()
+
+    def output(self, name, **kwargs):
+        path = os.path.join(self.directory, name)
+        cli.output_html(self.inventory, path, generation_time="2019-01-01 00:00:00Z", **kwargs)
+        return path
+
+    def test_writes_pages(self):
+        path = self.output("serial")
+
+        self.assertEqual(
+            set(["index.html", "index.json", "index.ndjson"] + ["node%02d.example.com.html" % i for i in range(20)]),
+            set(os.listdir(os.path.join(path, "nodes"))))
+        self.assertTrue(os.path.isfile(os.path.join(path, "services", "profile::service2.html")))
+        with open(os.path.join(path, "teams", "index.html"), encoding="utf-8") as html:
+            self.assertIn('<tr id="sre">', html.read())
+        self.assertTrue(os.path.isfile(os.path.join(path, "owners", "index.html")))
+        self.assertTrue(os.path.isfile(os.path.join(path, "search", "index.json")))
+        self.assertTrue(os.path.isfile(os.path.join(path, "errors.csv")))
+
+    def test_lazy_node_table(self):
+        path = self.output("lazy", lazy_node_table=True, node_shard_size=8)
+
+        with open(os.path.join(path, "nodes", "index.html"), encoding="utf-8") as html:
+            page = html.read()
+        self.assertIn('data-index="table/index.json"', page)
+        self.assertNotIn("node02.example.com", page)
+        self.assertEqual(
+            set(["0.json", "1.json", "2.json", "index.json"]),
+            set(os.listdir(os.path.join(path, "nodes", "table"))))
+
+    def test_parallel_output_is_identical(self):
+        assert_same_tree(self, self.output("serial"), self.output("parallel", jobs=3))
+
+    def test_incremental_reuses_unchanged_pages(self):
+        path = self.output("site")
+        with open(os.path.join(path, "nodes/node02.example.com.html"), encoding="utf-8") as html:
+            unchanged = html.read()
+        self.inventory.nodes["node03.example.com"]["other"]["logging"] = True
+        profiling.current().reset()
+        cli.output_html(self.inventory, path, generation_time="2019-01-02 00:00:00Z",
+            incremental=True)
+
+        def read(page):
+            with open(os.path.join(path, page), encoding="utf-8") as f:
+                return f.read()
+
+        counters = profiling.current().as_dict()["counters"]
+        self.assertEqual(1, counters["output.pages_rendered"])
+        self.assertEqual(22, counters["output.pages_reused"])
+        self.assertEqual(unchanged, read("nodes/node02.example.com.html"))
+        # Every page, reused or not, shows the time of this run.
+        for page in ("nodes/node02.example.com.html", "nodes/node03.example.com.html",
+                     "services/profile::service1.html", "nodes/index.html"):
+            self.assertNotIn("2019-01-01 00:00:00Z", read(page))
+        self.assertEqual('var GENERATED_AT = "2019-01-02 00:00:00Z";\n', read("generated-at.js"))
+        self.assertFalse(os.path.exists(path + ".staging"))
+        self.assertFalse(os.path.exists(path + ".previous"))
+
+    def test_changes(self):
+        path = self.output("site")
+        with open(os.path.join(path, "changes.json"), encoding="utf-8") as f:
+            self.assertIsNone(json.load(f))
+
+        self.inventory.nodes["node03.example.com"]["other"]["logging"] = True
+        self.inventory.nodes["node05.example.com"]["other"]["monitoring"] = None
+        cli.output_html(self.inventory, path, generation_time="2019-01-02 00:00:00Z")
+
+        with open(os.path.join(path, "changes.json"), encoding="utf-8") as f:
+            changes = json.load(f)
+        self.assertEqual("2019-01-01 00:00:00Z", changes["from"])
+        self.assertEqual({
+            "node03.example.com": {"other.logging": ["N", "Y"]},
+            "node05.example.com": {"other.monitoring": ["Y", "N"]},
+        }, changes["nodes"]["changed"])
+        with open(os.path.join(path, "changes.html"), encoding="utf-8") as html:
+            self.assertIn("node03.example.com", html.read())
+
+    def test_full_run_rerenders_everything(self):
+        path = self.output("site")
+        profiling.current().reset()
+        cli.output_html(self.inventory, path, generation_time="2019-01-02 00:00:00Z")
+
+        self.assertEqual(0, profiling.current().as_dict()["counters"]["output.pages_reused"])
+
+    def test_profile(self):
+        profiling.current().reset()
+
+        self.output("site")
+
+        data = profiling.current().as_dict()
+        for stage in ("static", "errors", "exports", "node_pages", "services", "swap"):
+            self.assertIn("output." + stage, data["phases"])
+        self.assertEqual(23, data["counters"]["output.pages_rendered"])
+        self.assertEqual(0, data["counters"]["output.pages_reused"])
+        self.assertGreater(data["counters"]["output.export_bytes"], 0)
@@ -0,0 +1,49 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Imported only once a run actually needs them.
+DEFERRED = ("jinja2", "markdown2", "pygments", "paramiko", "requests",
+            "simplepup", "multiprocessing")
+
+# Seconds infinitory.cli may take to import, by python -X importtime. It
+# takes well under 0.1s; the dependencies above add about 0.3s.
+STARTUP_BUDGET = 0.2
+
+
+def run_python(*args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run((sys.executable,) + args, env=env, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+class StartupTest(unittest.TestCase):
+    def test_help_defers_heavy_imports(self):
+        result = run_python("-c", "\n".join([
+            "import json, sys",
+            "from infinitory.cli import main",
+            "try:",
+            "    main(['--help'])",
+            "except SystemExit:",
+            "    pass",
+            "sys.stderr.write(json.dumps(sorted(sys.modules)))",
+        ]))
+
+        self.assertIn("--watch", result.stdout)
+        packages = set(name.split(".")[0] for name in json.loads(result.stderr))
+        self.assertEqual([], [name for name in DEFERRED if name in packages])
+
+    def test_import_within_budget(self):
+        best = None
+        for _ in range(3):
+            stderr = run_python("-X", "importtime", "-c", "import infinitory.cli").stderr
+            seconds = int(re.search(r"\|\s+(\d+) \| infinitory\.cli$", stderr, re.M).group(1)) / 1e6
+            best = seconds if best is None else min(best, seconds)
+
+        self.assertLess(best, STARTUP_BUDGET)
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from infinitory.cache import ReportCache
+
+
+class ReportCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_round_trip(self):
+        cache = ReportCache(self.path)
+        cache.put("abcdef0123", {"certname": "a"})
+
+        self.assertEqual({"certname": "a"}, cache.get("abcdef0123"))
+        self.assertEqual(None, cache.get("abcdef0124"))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_ignores_invalid_hashes(self):
+        cache = ReportCache(self.path)
+        cache.put("../escape", {"certname": "a"})
+
+        self.assertEqual(None, cache.get("../escape"))
+        self.assertEqual([], os.listdir(self.path))
+
+    def test_discards_corrupt_entries(self):
+        cache = ReportCache(self.path)
+        cache.put("abcdef0123", {"certname": "a"})
+        with open(cache.entry_path("abcdef0123"), "wb") as entry:
+            entry.write(b"garbage")
+
+        self.assertEqual(None, cache.get("abcdef0123"))
+        self.assertFalse(os.path.exists(cache.entry_path("abcdef0123")))
+
+    def test_prune_unreferenced(self):
+        cache = ReportCache(self.path)
+        cache.put("aaaaaaaa", {})
+        cache.put("bbbbbbbb", {})
+        cache.prune(["aaaaaaaa"])
+
+        self.assertEqual(["aaaaaaaa"], [h for h, _, _ in cache.entries()])
+        self.assertEqual(1, cache.evicted)
+
+    def test_prune_to_size_evicts_least_recently_used(self):
+        cache = ReportCache(self.path)
+        hashes = ["aaaaaaaa", "bbbbbbbb", "cccccccc"]
+        for i, report_hash in enumerate(hashes):
+            cache.put(report_hash, {"certname": report_hash})
+            os.utime(cache.entry_path(report_hash), (time.time() - 100 + i,) * 2)
+        cache.get("aaaaaaaa")
+
+        entry_size = os.path.getsize(cache.entry_path("aaaaaaaa"))
+        cache.max_bytes = entry_size * 2
+        cache.prune(hashes)
+
+        self.assertEqual(
+            ["aaaaaaaa", "cccccccc"],
+            sorted(h for h, _, _ in cache.entries()))
@@ -0,0 +1,228 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import infinitory.errors
+from infinitory.normalize import ErrorNormalizer
+from simplepup import puppetdb
+
+
+class FakePuppetDB(object):
+    def __init__(self, certnames, failures=0, delays=None):
+        self.certnames = certnames
+        self.hashes = dict(
+            (hashlib.sha1(c.encode("utf-8")).hexdigest(), c) for c in certnames)
+        self.messages = dict()
+        self.levels = dict()
+        self.failures = failures
+        self.delays = delays or {}
+        self.report_queries = 0
+        self._lock = threading.Lock()
+
+    def query(self, query, timeout=60):
+        if query.startswith("nodes"):
+            return [
+                {"certname": c, "latest_report_hash": h}
+                for h, c in self.hashes.items()]
+
+        with self._lock:
+            self.report_queries += 1
+            if self.failures:
+                self.failures -= 1
+                raise puppetdb.QueryError("Timed out", query)
+
+        hashes = re.findall(r'"([0-9a-f]+)"', query)
+        time.sleep(max(self.delays.get(self.hashes[h], 0) for h in hashes))
+        return [{
+            "certname": self.hashes[h],
+            "hash": h,
+            "status": "failed",
+            "logs": {"data": [
+                {"level": "notice", "message": "Applied catalog"},
+                {"level": self.levels.get(h, "err"), "message": self.messages.get(h, "Failed")},
+            ]},
+        } for h in hashes]
+
+    def check_in(self, certname, message, level="err"):
+        """ Give certname a new latest report, logging message. """
+        for report_hash, c in list(self.hashes.items()):
+            if c == certname:
+                del self.hashes[report_hash]
+        report_hash = hashlib.sha1((certname + message).encode("utf-8")).hexdigest()
+        self.hashes[report_hash] = certname
+        self.messages[report_hash] = message
+        self.levels[report_hash] = level
+
+    def remove(self, certname):
+        self.hashes = dict((h, c) for h, c in self.hashes.items() if c != certname)
+
+
+class LoadReportsTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_path)
+
+    def error_parser(self, **kwargs):
+        return infinitory.errors.ErrorParser(
+            retry_backoff=0, cache_path=self.cache_path, **kwargs)
+
+    def test_concurrent_order_matches_serial(self):
+        certnames = ["node%02d" % i for i in range(20)]
+        # Make early reports slowest so they complete last.
+        delays = dict((c, 0.01 * (20 - i)) for i, c in enumerate(certnames))
+
+        error_parser = self.error_parser(report_workers=8)
+        error_parser.load_reports(FakePuppetDB(certnames, delays=delays))
+
+        self.assertEqual(
+            certnames,
+            [e["hostname"] for e in error_parser.all_errors])
+
+    def test_batched_order_matches_serial(self):
+        certnames = ["node%02d" % i for i in range(25)]
+        pupdb = FakePuppetDB(certnames)
+
+        error_parser = self.error_parser(report_workers=3, report_batch_size=10)
+        error_parser.load_reports(pupdb)
+
+        self.assertEqual(3, pupdb.report_queries)
+        self.assertEqual(
+            certnames,
+            [e["hostname"] for e in error_parser.all_errors])
+
+    def test_streams_reports(self):
+        """ Reports are folded in while later chunks are still being
+        queried, with only a few chunks queried ahead. """
+        certnames = ["node%02d" % i for i in range(50)]
+        pupdb = FakePuppetDB(certnames)
+        error_parser = self.error_parser(report_workers=2)
+
+        queried_ahead = []
+        add_report = error_parser.add_report
+
+        def record_add_report(report):
+            queried_ahead.append(pupdb.report_queries - error_parser.report_count)
+            add_report(report)
+
+        error_parser.add_report = record_add_report
+        error_parser.load_reports(pupdb)
+
+        self.assertEqual(50, error_parser.report_count)
+        self.assertLessEqual(max(queried_ahead), 2 * 2 + 1)
+        self.assertEqual(
+            [{"count": 50, "level": "err", "certnames": certnames, "message": "Failed"}],
+            error_parser.unique_errors)
+
+    def test_incremental_only_loads_changed_reports(self):
+        pupdb = FakePuppetDB(["a", "b", "c", "d"])
+        self.error_parser(incremental=True).load_reports(pupdb)
+        self.assertEqual(4, pupdb.report_queries)
+
+        pupdb.check_in("b", "Broken")
+        pupdb.check_in("d", "Failed again")
+        pupdb.remove("c")
+        error_parser = self.error_parser(incremental=True)
+        error_parser.load_reports(pupdb)
+
+        self.assertEqual(6, pupdb.report_queries)
+        self.assertEqual(2, error_parser.report_count)
+        self.assertEqual(0, error_parser.report_cache.hits)
+        self.assertEqual([
+            {"count": 1, "level": "err", "certnames": ["a"], "message": "Failed"},
+            {"count": 1, "level": "err", "certnames": ["b"], "message": "Broken"},
+            {"count": 1, "level": "err", "certnames": ["d"], "message": "Failed again"},
+        ], error_parser.unique_errors)
+        self.assertEqual(
+            [("a", "Failed"), ("b", "Broken"), ("d", "Failed again")],
+            sorted((e["hostname"], e["message"]) for e in error_parser.all_errors))
+
+        # The same as loading everything from scratch.
+        full = infinitory.errors.ErrorParser(cache_path=self.cache_path)
+        full.load_reports(pupdb)
+        self.assertEqual(
+            sorted(e["message"] for e in full.unique_errors),
+            sorted(e["message"] for e in error_parser.unique_errors))
+        self.assertEqual(list(full.all_errors), list(error_parser.all_errors))
+
+    def test_incremental_mixed_levels_match_full_run(self):
+        for first_level, second_level in [("err", "warning"), ("warning", "err")]:
+            pupdb = FakePuppetDB([])
+            pupdb.check_in("a", "X", first_level)
+            pupdb.check_in("b", "X", second_level)
+            self.error_parser(incremental=True).load_reports(pupdb)
+
+            pupdb.check_in("b", "Other")
+            error_parser = self.error_parser(incremental=True)
+            error_parser.load_reports(pupdb)
+            full = infinitory.errors.ErrorParser(cache_path=self.cache_path)
+            full.load_reports(pupdb)
+
+            self.assertEqual(first_level, full.unique_errors[0]["level"])
+            self.assertEqual(
+                sorted(full.unique_errors, key=lambda e: e["message"]),
+                sorted(error_parser.unique_errors, key=lambda e: e["message"]))
+            # Start over for the next case.
+            shutil.rmtree(self.cache_path)
+            os.mkdir(self.cache_path)
+
+    def test_incremental_ignores_state_of_other_rules(self):
+        pupdb = FakePuppetDB(["a", "b"])
+        self.error_parser(incremental=True).load_reports(pupdb)
+
+        normalizer = ErrorNormalizer(prefixes=["Fail"])
+        error_parser = self.error_parser(incremental=True, normalizer=normalizer)
+        error_parser.load_reports(pupdb)
+
+        self.assertEqual(2, error_parser.report_count)
+        self.assertEqual(2, error_parser.report_cache.hits)
+        self.assertEqual(
+            [{"count": 2, "level": "err", "certnames": ["a", "b"], "message": "Fail"}],
+            error_parser.unique_errors)
+
+    def test_batched_query_projects_fields(self):
+        error_parser = self.error_parser()
+
+        self.assertEqual(
+            'reports[certname, hash, status, logs] { hash in ["a", "b"] }',
+            error_parser.report_query(["a", "b"]))
+        self.assertEqual(
+            'reports[certname, hash, status, logs] { hash = "a" }',
+            error_parser.report_query(["a"]))
+
+    def test_cached_reports_are_not_queried(self):
+        pupdb = FakePuppetDB(["a", "b"])
+        self.error_parser(report_workers=2).load_reports(pupdb)
+        self.error_parser(report_workers=2).load_reports(pupdb)
+
+        self.assertEqual(2, pupdb.report_queries)
+
+    def test_caches_reduced_reports(self):
+        pupdb = FakePuppetDB(["a"])
+        self.error_parser().load_reports(pupdb)
+        error_parser = self.error_parser()
+        error_parser.load_reports(pupdb)
+
+        self.assertEqual(1, error_parser.report_cache.hits)
+        self.assertEqual(
+            [{"level": "err", "hostname": "a", "message": "Failed"}],
+            list(error_parser.all_errors))
+
+    def test_retries_failed_queries(self):
+        pupdb = FakePuppetDB(["a"], failures=2)
+        error_parser = self.error_parser(report_retries=2)
+        error_parser.load_reports(pupdb)
+
+        self.assertEqual(1, error_parser.report_count)
+        self.assertEqual(3, pupdb.report_queries)
+
+    def test_gives_up_after_retries(self):
+        pupdb = FakePuppetDB(["a"], failures=3)
+        error_parser = self.error_parser(report_retries=2)
+
+        with self.assertRaises(puppetdb.QueryError):
+            error_parser.load_reports(pupdb)
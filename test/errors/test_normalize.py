@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import unittest
+
+from infinitory.normalize import ErrorNormalizer, split_literal_prefix
+
+
+class ErrorNormalizerTest(unittest.TestCase):
+    def test_longest_prefix_wins(self):
+        normalizer = ErrorNormalizer(prefixes=["Could not", "Could not find"])
+
+        self.assertEqual("Could not find", normalizer.normalize("Could not find foo"))
+        self.assertEqual("Could not", normalizer.normalize("Could not connect"))
+        self.assertEqual("Could", normalizer.normalize("Could"))
+
+    def test_masks(self):
+        normalizer = ErrorNormalizer(prefixes=[], masks=[
+            (r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", "<uuid>"),
+            (r"\b[\w-]+(\.[\w-]+)+\.(com|net)\b", "<host>"),
+            (r"(?<=line )\d+", "<n>"),
+        ])
+
+        self.assertEqual(
+            "Job <uuid> on <host> failed at line <n>, line <n>",
+            normalizer.normalize(
+                "Job 123e4567-e89b-12d3-a456-426614174000 on web01.ops.example.com"
+                " failed at line 12, line 345"))
+
+    def test_many_masks_sharing_prefixes(self):
+        normalizer = ErrorNormalizer(prefixes=[], masks=[
+            (r"\bmodule%d::[\w:]+" % i, "<module%d>" % i) for i in range(200)
+        ] + [(r"\d+", "N")])
+
+        self.assertEqual(
+            "<module7> and <module123> but not amoduleN::x, line N",
+            normalizer.normalize("module7::foo::bar and module123::x but not amodule5::x, line 9"))
+
+    def test_split_literal_prefix(self):
+        self.assertEqual(([r"\b", "a", ":"], r"\w+"), split_literal_prefix(r"\ba\:\w+"))
+        self.assertEqual((["a"], "b*c"), split_literal_prefix("ab*c"))
+        self.assertEqual(([], "ab|cd"), split_literal_prefix("ab|cd"))
+        self.assertEqual((["a", "b"], "(c|d)"), split_literal_prefix("ab(c|d)"))
+        self.assertEqual((["a", r"\ "], ""), split_literal_prefix("a "))
+
+    def test_prefix_before_masks(self):
+        normalizer = ErrorNormalizer(prefixes=["Error 42"], masks=[(r"\d+", "N")])
+
+        self.assertEqual("Error 42", normalizer.normalize("Error 42 on node 7"))
+        self.assertEqual("Error N on node N", normalizer.normalize("Error 43 on node 7"))
+
+    def test_from_file(self):
+        fd, path = tempfile.mkstemp(suffix=".json")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w") as rules:
+            json.dump({
+                "prefixes": ["Could not find dependent"],
+                "masks": [{"pattern": r"\d+", "replacement": "N"}],
+            }, rules)
+
+        normalizer = ErrorNormalizer.from_file(path)
+        self.assertEqual(
+            "Could not find dependent",
+            normalizer.normalize("Could not find dependent Service[x]"))
+        self.assertEqual("Port N", normalizer.normalize("Port 8140"))
+
+    def test_from_file_invalid_regex(self):
+        fd, path = tempfile.mkstemp(suffix=".json")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w") as rules:
+            json.dump({"masks": [{"pattern": "(", "replacement": ""}]}, rules)
+
+        with self.assertRaises(ValueError):
+            ErrorNormalizer.from_file(path)
+
+    def test_rejects_backreferences_and_named_groups(self):
+        for pattern in [r"(\w+)=\1", r"(?P<key>\w+)=(?P=key)"]:
+            with self.assertRaises(ValueError):
+                ErrorNormalizer(prefixes=[], masks=[(r"\d+ms", "<ms>"), (pattern, "<dup>")])
+
+        # Escaped backslashes and groups without backreferences are fine.
+        normalizer = ErrorNormalizer(prefixes=[], masks=[
+            (r"\d+ms", "<ms>"), (r"C:\\1(\w)", "<path>")])
+        self.assertEqual("<ms> <path>", normalizer.normalize(r"10ms C:\1x"))
+
+    def test_from_file_backreference(self):
+        fd, path = tempfile.mkstemp(suffix=".json")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w") as rules:
+            json.dump({"masks": [
+                {"pattern": r"\d+ms", "replacement": "<ms>"},
+                {"pattern": r"(\w+)=\1", "replacement": "<dup>"},
+            ]}, rules)
+
+        with self.assertRaisesRegex(ValueError, "backreferences are not supported"):
+            ErrorNormalizer.from_file(path)
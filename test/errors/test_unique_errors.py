@@ -0,0 +1,93 @@
+import os
+import time
+import unittest
+
+import infinitory.errors
+
+
+def synthetic_report(certname, lines, offset):
+    return {
+        "certname": certname,
+        "status": "failed",
+        "logs": {"data": [
+            {
+                "level": "err" if i % 2 else "warning",
+                # Roughly one distinct message per ten lines.
+                "message": "Error number %d" % ((offset + i) // 10),
+            }
+            for i in range(lines)
+        ]},
+    }
+
+
+def extract(line_count, lines_per_report=100, repeat=3):
+    """ Returns the ErrorParser and the best time of repeat runs. """
+    reports = []
+    for i in range(line_count // lines_per_report):
+        certname = "node%05d" % i
+        reports.append(synthetic_report(
+            certname, lines_per_report, i * lines_per_report))
+
+    best = None
+    for _ in range(repeat):
+        error_parser = infinitory.errors.ErrorParser()
+        start = time.perf_counter()
+        error_parser.extract_errors_from_reports(reports)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return error_parser, best
+
+
+class UniqueErrorsTest(unittest.TestCase):
+    def test_aggregates_by_message(self):
+        error_parser = infinitory.errors.ErrorParser()
+        error_parser.append_unique_error("a", "warning", "node1")
+        error_parser.append_unique_error("b", "err", "node1")
+        error_parser.append_unique_error("a", "err", "node2")
+        error_parser.append_unique_error("a", "err", "node2")
+
+        self.assertEqual([
+            {"count": 3, "level": "err", "certnames": ["node1", "node2"], "message": "a"},
+            {"count": 1, "level": "err", "certnames": ["node1"], "message": "b"},
+        ], error_parser.unique_errors)
+
+    def test_spools_all_errors(self):
+        error_parser = infinitory.errors.ErrorParser()
+        error_parser.extract_errors_from_reports(iter([
+            synthetic_report("node1", 2, 0),
+            synthetic_report("node2", 1, 20),
+        ]))
+
+        errors = [
+            {"level": "warning", "hostname": "node1", "message": "Error number 0"},
+            {"level": "err", "hostname": "node1", "message": "Error number 0"},
+            {"level": "warning", "hostname": "node2", "message": "Error number 2"},
+        ]
+        self.assertEqual(3, len(error_parser.all_errors))
+        self.assertEqual(errors, list(error_parser.all_errors))
+        # The spool can be read more than once, and appended to in between.
+        error_parser.extract_errors_from_reports([synthetic_report("node3", 1, 0)])
+        self.assertEqual(4, len(list(error_parser.all_errors)))
+
+    def test_close_deletes_spool(self):
+        error_parser = infinitory.errors.ErrorParser()
+        error_parser.extract_errors_from_reports([synthetic_report("node1", 2, 0)])
+        path = error_parser.all_errors._file.name
+        self.assertTrue(os.path.exists(path))
+
+        error_parser.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_scales_linearly(self):
+        """ 20k log lines with 2k distinct messages. A linear scan per line
+        makes this quadratic; 4x the input should cost about 4x the time. """
+        small, small_time = extract(5000)
+        large, large_time = extract(20000)
+
+        self.assertEqual(500, len(small.unique_errors))
+        self.assertEqual(2000, len(large.unique_errors))
+        self.assertEqual(20000, sum(e["count"] for e in large.unique_errors))
+        self.assertEqual(20000, len(large.all_errors))
+        self.assertLess(large_time, small_time * 10)
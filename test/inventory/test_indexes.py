@@ -0,0 +1,57 @@
+import unittest
+
+from infinitory import cellformatter
+from infinitory.inventory import Inventory
+from infinitory.record import NodeRecord
+
+
+def service(name, team=":undef", owner=":undef"):
+    return {
+        "class_name": "profile::%s" % name,
+        "human_name": name.capitalize(),
+        "team": team,
+        "owner_uid": owner,
+    }
+
+
+class IndexesTest(unittest.TestCase):
+    def setUp(self):
+        self.inventory = Inventory()
+        self.inventory.nodes = dict()
+        for certname, services in [
+                ("c.example.com", [service("web", "sre", "alice")]),
+                ("a.example.com", [service("web", "sre", "alice"), service("db", "dba")]),
+                ("b.example.com", [])]:
+            self.inventory.nodes[certname] = NodeRecord(certname, facts={
+                "fqdn": certname,
+                "profile_metadata": {"services": services},
+            })
+        self.inventory.build_indexes()
+
+    def test_node_services_sorted(self):
+        node = self.inventory.nodes["a.example.com"]
+
+        self.assertEqual(["Db", "Web"], [s["human_name"] for s in node["other"]["services"]])
+        self.assertEqual(
+            ["profile::db", "profile::web"],
+            [s["class_name"] for s in cellformatter.Services("other", "services").value(node)])
+        self.assertNotIn("services", node["other"].to_dict())
+
+    def test_services(self):
+        services = self.inventory.sorted_services()
+
+        self.assertEqual(["Db", "Web"], [s["human_name"] for s in services])
+        self.assertEqual(
+            ["a.example.com", "c.example.com"],
+            [n["certname"] for n in services[1]["nodes"]])
+        self.assertNotIn("nodes", self.inventory.nodes["a.example.com"]["other"]["services"][1])
+
+    def test_teams_and_owners(self):
+        teams = self.inventory.sorted_teams()
+
+        self.assertEqual(["dba", "sre"], [t["name"] for t in teams])
+        self.assertEqual(["Web"], [s["human_name"] for s in teams[1]["services"]])
+        self.assertEqual(
+            ["a.example.com", "c.example.com"],
+            [n["certname"] for n in teams[1]["nodes"]])
+        self.assertEqual(["alice"], [o["name"] for o in self.inventory.sorted_owners()])
@@ -0,0 +1,68 @@
+import unittest
+
+from infinitory import cellformatter
+from infinitory import cli
+from infinitory.inventory import Inventory, inventory_query
+from infinitory.record import NodeRecord
+
+
+class FakePuppetDB(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query(self, query, **kwargs):
+        self.queries.append(query)
+        return self.rows
+
+
+class LoadNodesTest(unittest.TestCase):
+    def test_fields_from_columns(self):
+        columns = [
+            cellformatter.Fqdn("facts", "fqdn"),
+            cellformatter.Services("other", "services"),
+            cellformatter.Os("facts", "os"),
+            cellformatter.Boolean("other", "logging"),
+            cellformatter.Base("trusted", "certname"),
+        ]
+
+        self.assertEqual(
+            set(["certname", "facts.fqdn", "facts.hostname", "facts.domain",
+                "facts.profile_metadata", "facts.os", "other.logging",
+                "trusted.certname"]),
+            cellformatter.required_fields(columns))
+
+    def test_query(self):
+        self.assertEqual("inventory {}", inventory_query())
+        self.assertEqual(
+            "inventory[certname, facts.os, trusted.certname] {}",
+            inventory_query(["trusted.certname", "facts.os", "other.roles"]))
+
+    def test_query_for_report(self):
+        query = inventory_query(cli.NODE_FIELDS)
+
+        self.assertIn(" environment,", query)
+        self.assertIn(" timestamp,", query)
+        self.assertNotIn("other.", query)
+
+    def test_load_projected_nodes(self):
+        pupdb = FakePuppetDB([{
+            "certname": "a.example.com",
+            "facts.fqdn": "a.example.com",
+            "facts.hostname": None,
+            "facts.os": {"name": "Debian"},
+            "trusted.certname": "a.example.com",
+        }])
+        inventory = Inventory()
+        inventory.add_active_filter()
+        inventory.load_nodes(pupdb, ["facts.fqdn", "facts.hostname", "facts.os", "trusted.certname"])
+
+        self.assertEqual(
+            'inventory[certname, facts.fqdn, facts.hostname, facts.os, trusted.certname]'
+            ' {(nodes { deactivated is null and expired is null })}',
+            pupdb.queries[0])
+        node = inventory.nodes["a.example.com"]
+        self.assertIsInstance(node, NodeRecord)
+        self.assertEqual({"fqdn": "a.example.com", "os": {"name": "Debian"}}, node["facts"])
+        self.assertEqual({"certname": "a.example.com"}, node["trusted"])
+        self.assertEqual([], node["other"]["roles"])
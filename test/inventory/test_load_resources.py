@@ -0,0 +1,65 @@
+from collections import defaultdict
+import unittest
+
+from infinitory.inventory import Inventory
+
+
+RESOURCES = [
+    {"certname": "a", "type": "Backup::Job", "title": "etc", "parameters": {"files": ["/etc", "/root"]}},
+    {"certname": "a", "type": "Backup::Job", "title": "old", "parameters": {"files": "/old", "ensure": "absent"}},
+    {"certname": "b", "type": "Backup::Job", "title": "var", "parameters": {"files": "/var"}},
+    {"certname": "a", "type": "Class", "title": "Profile::Metrics", "parameters": {}},
+    {"certname": "b", "type": "Class", "title": "Profile::Server::Monitor", "parameters": {}},
+    {"certname": "b", "type": "Class", "title": "Profile::Monitoring::Icinga2::Common", "parameters": {
+        "notification_period": "24x7", "icinga2_environment": "prod", "owner": "sre"}},
+    {"certname": "a", "type": "Class", "title": "Role::Web", "parameters": {}},
+    {"certname": "b", "type": "Class", "title": "Role::Web", "parameters": {}},
+    {"certname": "gone", "type": "Class", "title": "Role::Web", "parameters": {}},
+]
+
+
+class FakePuppetDB(object):
+    def __init__(self):
+        self.queries = []
+
+    def query(self, query, **kwargs):
+        self.queries.append(query)
+        return RESOURCES
+
+
+class LoadResourcesTest(unittest.TestCase):
+    def setUp(self):
+        self.inventory = Inventory()
+        self.inventory.nodes = dict(
+            (certname, {"certname": certname, "other": defaultdict(list)})
+            for certname in ("a", "b"))
+
+    def test_one_query(self):
+        pupdb = FakePuppetDB()
+        self.inventory.load_resources(pupdb)
+
+        self.assertEqual(1, len(pupdb.queries))
+        self.assertIn('(type = "Backup::Job") or (type = "Class" and title = "Profile::Logging::Rsyslog::Client")', pupdb.queries[0])
+        self.assertIn('(type = "Class" and title ~ "^Role::")', pupdb.queries[0])
+
+        a = self.inventory.nodes["a"]["other"]
+        b = self.inventory.nodes["b"]["other"]
+        self.assertEqual(["/etc", "/root"], a["backups"])
+        self.assertEqual(["/var"], b["backups"])
+        self.assertEqual((True, False), (bool(a["metrics"]), bool(b["metrics"])))
+        self.assertEqual((False, True), (bool(a["monitoring"]), bool(b["monitoring"])))
+        self.assertEqual("24x7", b["icinga_notification_period"])
+        self.assertEqual(["Role::Web"], a["roles"])
+        self.assertEqual(
+            [self.inventory.nodes["a"], self.inventory.nodes["b"]],
+            self.inventory.roles["Role::Web"])
+
+    def test_named_enrichments(self):
+        pupdb = FakePuppetDB()
+        self.inventory.load_resources(pupdb, ["metrics"])
+
+        self.assertEqual(
+            'resources[certname, type, title, parameters] {(type = "Class" and title = "Profile::Metrics")}',
+            pupdb.queries[0])
+        self.assertTrue(self.inventory.nodes["a"]["other"]["metrics"])
+        self.assertEqual([], self.inventory.nodes["a"]["other"]["backups"])
@@ -0,0 +1,67 @@
+import json
+import pickle
+import unittest
+
+import jinja2
+
+from infinitory import cellformatter
+from infinitory.record import NodeRecord, json_default
+
+
+def make_record():
+    node = NodeRecord("a.example.com",
+        facts={"fqdn": "a.example.com", "os": {"name": "Debian", "release": {"full": "9.8"}}},
+        trusted={"certname": "a.example.com"})
+    node["other"]["roles"].append("Role::Web")
+    node["other"]["logging"] = True
+    return node
+
+
+class NodeRecordTest(unittest.TestCase):
+    def test_section_access(self):
+        node = make_record()
+
+        self.assertEqual("a.example.com", node["facts"].get("fqdn"))
+        self.assertEqual(["Role::Web"], node["other"].get("roles"))
+        self.assertTrue(node["other"]["logging"])
+        self.assertIsNone(node["other"]["metrics"])
+        self.assertIsNone(node["other"].get("icinga_stage"))
+        self.assertEqual([], node["other"]["backups"])
+        self.assertEqual("", node.get("environment", ""))
+        with self.assertRaises(KeyError):
+            node["other"]["unknown"] = True
+        with self.assertRaises(KeyError):
+            node["unknown"]
+
+    def test_cellformatters(self):
+        node = make_record()
+
+        self.assertEqual("Debian 9.8", cellformatter.Os("facts", "os").value(node))
+        self.assertEqual("Y", cellformatter.Boolean("other", "logging").body_csv(node))
+        self.assertEqual("N", cellformatter.Boolean("other", "metrics").body_csv(node))
+        self.assertEqual("", cellformatter.Set("other", "backups").body_csv(node))
+        self.assertEqual("", cellformatter.Base("other", "icinga_stage").value(node))
+
+    def test_template_access(self):
+        template = jinja2.Template("{{ node.facts.fqdn }} {{ node['other']['roles'][0] }}")
+
+        self.assertEqual("a.example.com Role::Web", template.render(node=make_record()))
+
+    def test_interned(self):
+        first = NodeRecord("a", facts={"os": {"name": "".join(["Deb", "ian"])}})
+        second = NodeRecord("b", facts={"os": {"name": "".join(["Debi", "an"])}})
+
+        self.assertIs(first["facts"]["os"]["name"], second["facts"]["os"]["name"])
+
+    def test_pickle(self):
+        node = pickle.loads(pickle.dumps(make_record()))
+
+        self.assertEqual(make_record().to_dict(), node.to_dict())
+
+    def test_json(self):
+        self.assertEqual({
+            "certname": "a.example.com",
+            "facts": {"fqdn": "a.example.com", "os": {"name": "Debian", "release": {"full": "9.8"}}},
+            "trusted": {"certname": "a.example.com"},
+            "other": {"roles": ["Role::Web"], "logging": True},
+        }, json.loads(json.dumps(make_record(), default=json_default)))
@@ -0,0 +1,91 @@
+import threading
+import unittest
+
+from infinitory.scheduler import ConnectionPool, Loader, run_loaders
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.connected = False
+
+    def connect(self):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.connections = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.connections.append(connection)
+        return connection
+
+    def test_runs_after_requirements(self):
+        order = []
+        loaders = [
+            Loader("c", lambda pupdb: order.append("c"), requires=["a", "b"]),
+            Loader("b", lambda pupdb: order.append("b"), requires=["a"]),
+            Loader("a", lambda pupdb: order.append("a")),
+        ]
+
+        with ConnectionPool(self.connect, 3) as pool:
+            timings = run_loaders(loaders, pool)
+
+        self.assertEqual(["a", "b", "c"], order)
+        self.assertEqual(set("abc"), set(timings))
+        self.assertEqual(1, len(self.connections))
+        self.assertFalse(self.connections[0].connected)
+
+    def test_independent_loaders_run_concurrently(self):
+        # Deadlocks (and times out) unless both run at once.
+        barrier = threading.Barrier(2, timeout=5)
+        connections = []
+
+        def load(pupdb):
+            connections.append(pupdb)
+            barrier.wait()
+
+        with ConnectionPool(self.connect, 2) as pool:
+            run_loaders([Loader("a", load), Loader("b", load)], pool)
+
+        self.assertEqual(2, len(set(map(id, connections))))
+
+    def test_failure_stops_dependents(self):
+        ran = []
+
+        def fail(pupdb):
+            raise RuntimeError("boom")
+
+        loaders = [
+            Loader("a", fail),
+            Loader("b", lambda pupdb: ran.append("b"), requires=["a"]),
+        ]
+        with ConnectionPool(self.connect, 2) as pool:
+            with self.assertRaises(RuntimeError):
+                run_loaders(loaders, pool)
+
+        self.assertEqual([], ran)
+
+    def test_unsatisfiable_requirements(self):
+        loaders = [
+            Loader("a", None, requires=["b"]),
+            Loader("b", None, requires=["a"]),
+        ]
+        with ConnectionPool(self.connect, 1) as pool:
+            with self.assertRaises(ValueError):
+                run_loaders(loaders, pool)
+
+    def test_reconnects_after_close(self):
+        pool = ConnectionPool(self.connect, 1)
+        with pool.connection() as first:
+            pass
+        pool.close()
+        with pool.connection() as second:
+            self.assertTrue(second.connected)
+
+        self.assertFalse(first.connected)
+        self.assertIsNot(first, second)
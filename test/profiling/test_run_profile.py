@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from infinitory import profiling
+from infinitory.profiling import RunProfile
+
+
+class RunProfileTest(unittest.TestCase):
+    def test_phases_accumulate(self):
+        profile = RunProfile()
+        for _ in range(3):
+            with profile.phase("work"):
+                pass
+        profile.count("rows", 5)
+        profile.count("rows", 2)
+
+        data = profile.as_dict()
+        self.assertEqual(3, data["phases"]["work"]["calls"])
+        self.assertEqual(7, data["counters"]["rows"])
+        self.assertGreater(data["peak_rss_bytes"], 0)
+
+    def test_phase_recorded_on_error(self):
+        profile = RunProfile()
+        with self.assertRaises(ValueError):
+            with profile.phase("failing"):
+                raise ValueError()
+
+        self.assertEqual(1, profile.as_dict()["phases"]["failing"]["calls"])
+
+    def test_laps(self):
+        profile = RunProfile()
+        laps = profiling.Laps(profile, "output")
+        laps.lap("one")
+        laps.lap("two")
+
+        self.assertEqual(["output.one", "output.two"], sorted(profile.as_dict()["phases"]))
+
+    def test_write_json_and_tracing(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "profile.json")
+
+        profile = RunProfile()
+        profile.start_tracing()
+        with profile.phase("allocate"):
+            [str(i) for i in range(1000)]
+        profile.stop_tracing(profiling.pstats_path(path))
+        profile.write_json(path)
+
+        with open(path) as f:
+            data = json.load(f)
+        self.assertIn("allocate", data["phases"])
+        self.assertGreater(data["tracemalloc"]["peak_bytes"], 0)
+        self.assertTrue(data["tracemalloc"]["top"])
+        self.assertTrue(os.path.exists(os.path.join(directory, "profile.pstats")))
+        self.assertIn("allocate", profile.summary())
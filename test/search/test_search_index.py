@@ -0,0 +1,53 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from infinitory.search import SearchIndex, gram_shard, grams
+
+
+def decode(deltas):
+    ids = []
+    for delta in deltas:
+        ids.append((ids[-1] if ids else 0) + delta)
+    return ids
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_grams(self):
+        self.assertEqual(set(["web", "eb0", "b01"]), grams("web01"))
+        self.assertEqual(set(), grams("db"))
+
+    def test_gram_shard(self):
+        # search.js has to compute the same values.
+        self.assertEqual(34, gram_shard("abc", 64))
+        self.assertEqual(41, gram_shard("é::", 64))
+
+    def test_write(self):
+        index = SearchIndex()
+        index.add("role", "Role::Web", "roles/index.html#Role::Web")
+        for i in range(5):
+            certname = "web%d.example.com" % i
+            index.add("node", certname, "nodes/%s.html" % certname, certname)
+        index.write(self.directory, gram_shards=4, document_shard_size=2)
+
+        meta = self.read("index.json")
+        self.assertEqual(6, meta["documents"])
+        self.assertEqual(3, meta["document_shards"])
+        self.assertEqual(
+            ["node", "web4.example.com", "nodes/web4.example.com.html", "web4.example.com"],
+            self.read("docs-2.json")[1])
+
+        shard = self.read("grams-%d.json" % gram_shard("web", 4))
+        self.assertEqual([0, 1, 2, 3, 4, 5], decode(shard["web"]))
+        shard = self.read("grams-%d.json" % gram_shard("b3.", 4))
+        self.assertEqual([4], decode(shard["b3."]))
@@ -0,0 +1,61 @@
+import shutil
+import tempfile
+import unittest
+
+from infinitory.snapshot import Snapshot, has_changes
+
+
+def make_snapshot(generation_time, **kwargs):
+    nodes = {
+        "a": {"facts.fqdn": "a.example.com", "other.monitoring": "Y"},
+        "b": {"facts.fqdn": "b.example.com", "other.monitoring": "Y"},
+    }
+    nodes.update(kwargs.pop("nodes", dict()))
+    return Snapshot(generation_time,
+        nodes=dict((k, v) for k, v in nodes.items() if v is not None),
+        roles=kwargs.pop("roles", {"Role::Web": ["a", "b"]}),
+        services=kwargs.pop("services", {"profile::nginx": ["a"]}),
+        errors=kwargs.pop("errors", {"Could not find x": {"level": "err", "count": 1}}))
+
+
+class SnapshotDiffTest(unittest.TestCase):
+    def test_no_changes(self):
+        changes = make_snapshot("2").diff(make_snapshot("1"))
+
+        self.assertEqual("1", changes["from"])
+        self.assertEqual("2", changes["to"])
+        self.assertFalse(has_changes(changes))
+
+    def test_changes(self):
+        previous = make_snapshot("1")
+        current = make_snapshot("2",
+            nodes={"b": {"facts.fqdn": "b.example.com", "other.monitoring": "N"},
+                   "a": None,
+                   "c": {"facts.fqdn": "c.example.com", "other.monitoring": "Y"}},
+            roles={"Role::Web": ["b", "c"], "Role::Db": ["c"]},
+            errors={"Could not find y": {"level": "err", "count": 3}})
+        changes = current.diff(previous)
+
+        self.assertTrue(has_changes(changes))
+        self.assertEqual({
+            "added": ["c"],
+            "removed": ["a"],
+            "changed": {"b": {"other.monitoring": ["Y", "N"]}},
+        }, changes["nodes"])
+        self.assertEqual({
+            "Role::Db": {"added": ["c"], "removed": []},
+            "Role::Web": {"added": ["c"], "removed": ["a"]},
+        }, changes["roles"])
+        self.assertEqual({}, changes["services"])
+        self.assertEqual(
+            {"new": ["Could not find y"], "resolved": ["Could not find x"]},
+            changes["errors"])
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        self.assertIsNone(Snapshot.load(directory))
+        make_snapshot("1").save(directory)
+        loaded = Snapshot.load(directory)
+        self.assertEqual(make_snapshot("1").__dict__, loaded.__dict__)
@@ -0,0 +1,84 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from infinitory import cli
+from infinitory.watch import Status, watch
+
+
+class WatchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "status.json")
+
+    def test_survives_recoverable_errors(self):
+        outcomes = [ValueError("PuppetDB is down"), {"pages_rendered": 3}, {"pages_rendered": 1}]
+        errors = []
+        sleeps = []
+
+        def refresh():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        status = Status(self.path, 60)
+        watch(refresh, 60, status, recoverable=(ValueError,),
+            on_error=lambda: errors.append(True), refreshes=3, sleep=sleeps.append)
+
+        with open(self.path) as status_file:
+            data = json.load(status_file)
+        self.assertEqual(3, data["refreshes"])
+        self.assertEqual(1, data["failures"])
+        self.assertIsNone(data["last_refresh"]["error"])
+        self.assertEqual({"pages_rendered": 1}, data["counters"])
+        self.assertGreaterEqual(data["last_refresh"]["duration"], 0)
+        self.assertEqual([True], errors)
+        # Slept between refreshes, but not after the last one.
+        self.assertEqual(2, len(sleeps))
+        self.assertTrue(all(0 < s <= 60 for s in sleeps))
+
+    def test_survives_puppetdb_timeouts(self):
+        outcomes = [
+            requests.exceptions.ReadTimeout("Read timed out"),
+            requests.exceptions.HTTPError("503 Server Error"),
+            {"pages_rendered": 1},
+        ]
+
+        def refresh():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        watch(refresh, 60, Status(self.path, 60), recoverable=cli.puppetdb_errors(),
+            refreshes=3, sleep=lambda seconds: None)
+
+        with open(self.path) as status_file:
+            data = json.load(status_file)
+        self.assertEqual(3, data["refreshes"])
+        self.assertEqual(2, data["failures"])
+        self.assertEqual({"pages_rendered": 1}, data["counters"])
+
+    def test_records_failure(self):
+        def refresh():
+            raise ValueError("PuppetDB is down")
+
+        watch(refresh, 60, Status(self.path, 60), recoverable=(ValueError,), refreshes=1)
+
+        with open(self.path) as status_file:
+            data = json.load(status_file)
+        self.assertEqual("PuppetDB is down", data["last_refresh"]["error"])
+        self.assertIsNone(data["last_success"])
+
+    def test_other_errors_stop_watching(self):
+        def refresh():
+            raise KeyError("bug")
+
+        with self.assertRaises(KeyError):
+            watch(refresh, 60, Status(self.path, 60), recoverable=(ValueError,))